@@ -0,0 +1,108 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from decentralizepy.communication.TCP_ACK import TCP
+from decentralizepy.mappings.Linear import Linear
+
+
+def transfer(addresses, offset, loss_rate, messages, size, seed=90):
+    """
+    Sends messages from uid 0 to uid 1 over a simulated lossy network and
+    checks that each one is delivered exactly once and in order
+
+    Parameters
+    ----------
+    addresses : str
+        JSON file with machine_id -> ip mapping
+    offset : int
+        Port offset of the two processes
+    loss_rate : float
+        Fraction of the frames dropped, in both directions
+    messages : int
+        Number of messages
+    size : int
+        Number of float32 parameters per message
+    seed : int, optional
+        Seed of the simulated losses
+
+    Returns
+    -------
+    dict
+        Timing, retransmission and correctness of the transfer
+
+    """
+    mapping = Linear(1, 2)
+    sender = TCP(
+        0, 0, mapping, 2, addresses, offset, loss_rate=loss_rate, loss_seed=seed
+    )
+    receiver = TCP(
+        1, 0, mapping, 2, addresses, offset, loss_rate=loss_rate, loss_seed=seed + 1
+    )
+    sender.init_connection(1)
+    receiver.init_connection(0)
+    params = np.random.default_rng(seed).random(size, dtype=np.float32)
+
+    start = time.perf_counter()
+    for i in range(messages):
+        sender.send(1, {"CHANNEL": "DPSGD", "iteration": i, "params": params})
+    received = []
+    for _ in range(messages):
+        message = receiver.receive(timeout=60)
+        if message is None:
+            break
+        received.append(message[1]["iteration"])
+    elapsed = time.perf_counter() - start
+    # Anything more would be a duplicate
+    extra = receiver.receive(timeout=2 * sender.resend_timeout)
+
+    result = {
+        "loss_rate": loss_rate,
+        "seconds": elapsed,
+        "payload_mb": sender.total_bytes / 2**20,
+        "resent": sender.resent_messages,
+        "resent_mb": sender.resent_bytes / 2**20,
+        "dropped": sender.dropped_frames + receiver.dropped_frames,
+        "exactly_once_in_order": received == list(range(messages)) and extra is None,
+    }
+    sender.terminate()
+    receiver.terminate()
+    sender.context.destroy(linger=0)
+    receiver.context.destroy(linger=0)
+    return result
+
+
+if __name__ == "__main__":
+    # Usage: python benchmark_ack_loss.py [messages] [parameters per message] [port offset]
+    # Reliable delivery of TCP_ACK with frames dropped locally at several rates
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 250000
+    offset = int(sys.argv[3]) if len(sys.argv) > 3 else 31000
+
+    with tempfile.TemporaryDirectory() as directory:
+        addresses = os.path.join(directory, "ip.json")
+        with open(addresses, "w") as f:
+            json.dump({"0": "127.0.0.1"}, f)
+
+        print(
+            "{:>6} {:>8} {:>10} {:>7} {:>10} {:>8} {:>6}".format(
+                "loss", "seconds", "payload MB", "resent", "resent MB", "dropped", "ok"
+            )
+        )
+        for i, loss_rate in enumerate([0.0, 0.01, 0.05, 0.2]):
+            r = transfer(addresses, offset + 10 * i, loss_rate, messages, size)
+            print(
+                "{:>6} {:>8.2f} {:>10.1f} {:>7} {:>10.1f} {:>8} {:>6}".format(
+                    r["loss_rate"],
+                    r["seconds"],
+                    r["payload_mb"],
+                    r["resent"],
+                    r["resent_mb"],
+                    r["dropped"],
+                    str(r["exactly_once_in_order"]),
+                )
+            )
@@ -0,0 +1,279 @@
+import csv
+import glob
+import importlib
+import json
+import os
+import pickle
+import pkgutil
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import torch
+
+import decentralizepy.compression
+from decentralizepy.compression.Compression import Compression
+
+
+def load_corpus(directory):
+    """
+    Payloads to benchmark on.
+
+    Parameters
+    ----------
+    directory : str or None
+        Corpus recorded with record_dir in the [COMMUNICATION] section of a run
+        (see communication/PayloadRecorder.py), or None for a synthetic corpus
+        of a ResNet-sized model
+
+    Returns
+    -------
+    list
+        dicts with name, kind, params (np.float32) and, for sparse payloads, indices (np.int32)
+
+    """
+    if directory is not None:
+        corpus = []
+        for path in sorted(glob.glob(os.path.join(directory, "*.pt"))):
+            payload = torch.load(path, weights_only=False)
+            payload["name"] = os.path.basename(path)
+            payload["params"] = np.ascontiguousarray(payload["params"], np.float32)
+            if "indices" in payload:
+                payload["indices"] = np.asarray(payload["indices"], np.int32)
+            corpus.append(payload)
+        return corpus
+
+    rng = np.random.default_rng(90)
+    layer_sizes = rng.integers(1000, 600000, size=60)
+    scales = rng.lognormal(sigma=1.5, size=60) * 1e-2
+    model = np.concatenate(
+        [rng.laplace(scale=s, size=n) for s, n in zip(scales, layer_sizes)]
+    ).astype(np.float32)
+    change = (rng.laplace(size=model.shape[0]) * np.repeat(scales, layer_sizes)).astype(
+        np.float32
+    )
+    corpus = [{"name": "model", "kind": "full", "params": model}]
+    chunk = model.shape[0] // 4
+    for i in range(4):
+        end = model.shape[0] if i == 3 else (i + 1) * chunk
+        corpus.append(
+            {
+                "name": "chunk {}".format(i),
+                "kind": "chunk",
+                "params": model[i * chunk : end],
+            }
+        )
+    for alpha in [0.01, 0.1, 0.3]:
+        k = round(alpha * model.shape[0])
+        indices = np.sort(np.argpartition(np.abs(change), -k)[-k:]).astype(np.int32)
+        corpus.append(
+            {
+                "name": "top-k {}".format(alpha),
+                "kind": "sparse",
+                "params": model[indices],
+                "indices": indices,
+            }
+        )
+        corpus.append(
+            {
+                "name": "choco {}".format(alpha),
+                "kind": "sparse",
+                "params": change[indices],
+                "indices": indices,
+            }
+        )
+    return corpus
+
+
+def codecs():
+    """
+    Every Compression subclass of decentralizepy.compression with its default
+    parameters, and the variants that enable optional compression.
+    Modules whose dependencies are missing are skipped.
+
+    Returns
+    -------
+    tuple
+        (list of (name, codec), list of skipped modules)
+
+    """
+    found = []
+    skipped = []
+    for module_info in pkgutil.iter_modules(decentralizepy.compression.__path__):
+        try:
+            module = importlib.import_module(
+                "decentralizepy.compression." + module_info.name
+            )
+        except ImportError as e:
+            skipped.append("{} ({})".format(module_info.name, e))
+            continue
+        cls = getattr(module, module_info.name, None)
+        if isinstance(cls, type) and issubclass(cls, Compression):
+            found.append((module_info.name, cls()))
+            if module_info.name == "Lz4Wrapper":
+                found.append(("Lz4Wrapper(compress_data)", cls(compress_data=True)))
+            if module_info.name in ["Quantization", "EliasQuantization"]:
+                found.append(
+                    (
+                        "{}(float_precision=127)".format(module_info.name),
+                        cls(float_precision=2**7 - 1),
+                    )
+                )
+    return sorted(found, key=lambda item: item[0]), skipped
+
+
+def size_of(encoded):
+    """
+    Size on the wire of an encoded array
+
+    """
+    if isinstance(encoded, (bytes, bytearray)):
+        return len(encoded)
+    if isinstance(encoded, np.ndarray):
+        return encoded.nbytes
+    return len(pickle.dumps(encoded))
+
+
+def measure(encode, decode, arr, repetitions):
+    """
+    Times and traces one codec on one array
+
+    Returns
+    -------
+    tuple
+        (encoded size, encode seconds, decode seconds, peak bytes, decoded array)
+
+    """
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        encoded = encode(arr.copy())
+    encode_time = (time.perf_counter() - start) / repetitions
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        decoded = decode(encoded)
+    decode_time = (time.perf_counter() - start) / repetitions
+
+    copy = arr.copy()
+    tracemalloc.start()
+    decode(encode(copy))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size_of(encoded), encode_time, decode_time, peak, np.asarray(decoded)
+
+
+def benchmark(corpus, codecs, repetitions):
+    """
+    Replays a corpus through the codecs
+
+    Returns
+    -------
+    list
+        One dict per (payload, codec, field)
+
+    """
+    rows = []
+    for payload in corpus:
+        for name, codec in codecs:
+            fields = [("params", codec.compress_float, codec.decompress_float)]
+            if "indices" in payload:
+                fields.append(("indices", codec.compress, codec.decompress))
+            for field, encode, decode in fields:
+                arr = payload[field]
+                row = {
+                    "payload": payload["name"],
+                    "kind": payload["kind"],
+                    "codec": name,
+                    "field": field,
+                    "elements": arr.shape[0],
+                    "raw_bytes": arr.nbytes,
+                }
+                try:
+                    size, encode_time, decode_time, peak, decoded = measure(
+                        encode, decode, arr, repetitions
+                    )
+                except Exception as e:
+                    row["error"] = repr(e)
+                    rows.append(row)
+                    continue
+                if field == "indices":
+                    max_error = float(not np.array_equal(decoded, np.sort(arr)))
+                    relative_error = max_error
+                else:
+                    difference = decoded.astype(np.float64) - arr
+                    max_error = float(np.abs(difference).max(initial=0))
+                    relative_error = float(
+                        np.linalg.norm(difference) / max(np.linalg.norm(arr), 1e-30)
+                    )
+                row.update(
+                    {
+                        "bytes": size,
+                        "ratio": arr.nbytes / max(size, 1),
+                        "encode_mb_s": arr.nbytes / 1e6 / max(encode_time, 1e-9),
+                        "decode_mb_s": arr.nbytes / 1e6 / max(decode_time, 1e-9),
+                        "peak_mb": peak / 1e6,
+                        "max_error": max_error,
+                        "relative_error": relative_error,
+                    }
+                )
+                rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    # Usage: python benchmark_compression.py [corpus directory | ""] [results .json or .csv] [repetitions]
+    directory = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] else None
+    output = sys.argv[2] if len(sys.argv) > 2 else None
+    repetitions = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    corpus = load_corpus(directory)
+    found, skipped = codecs()
+    for module in skipped:
+        print("Skipping {}".format(module))
+    rows = benchmark(corpus, found, repetitions)
+
+    print(
+        "{:>14} {:>38} {:>8} {:>8} {:>10} {:>10} {:>9} {:>10}".format(
+            "payload",
+            "codec",
+            "field",
+            "ratio",
+            "enc MB/s",
+            "dec MB/s",
+            "peak MB",
+            "rel error",
+        )
+    )
+    for row in rows:
+        if "error" in row:
+            print(
+                "{:>14} {:>38} {:>8} {}".format(
+                    row["payload"], row["codec"], row["field"], row["error"]
+                )
+            )
+            continue
+        print(
+            "{:>14} {:>38} {:>8} {:>8.2f} {:>10.1f} {:>10.1f} {:>9.1f} {:>10.2e}".format(
+                row["payload"],
+                row["codec"],
+                row["field"],
+                row["ratio"],
+                row["encode_mb_s"],
+                row["decode_mb_s"],
+                row["peak_mb"],
+                row["relative_error"],
+            )
+        )
+
+    if output is not None:
+        if output.endswith(".csv"):
+            columns = []
+            for row in rows:
+                columns += [c for c in row if c not in columns]
+            with open(output, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(output, "w") as f:
+                json.dump({"skipped": skipped, "results": rows}, f, indent=2)
@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+import zmq
+
+from decentralizepy.communication.TCP import TCP
+from decentralizepy.mappings.Linear import Linear
+
+
+def rcvtimeo_loop(communication, duration, recv_timeout):
+    """
+    The previous blocking receive: recv with RCVTIMEO, retried on EAGAIN
+
+    Parameters
+    ----------
+    communication : decentralizepy.communication.TCP
+        Communication without incoming messages
+    duration : float
+        Seconds to wait
+    recv_timeout : int
+        RCVTIMEO in ms
+
+    """
+    communication.router.setsockopt(zmq.RCVTIMEO, recv_timeout)
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            communication.router.recv_multipart()
+        except zmq.ZMQError as exc:
+            if exc.errno != zmq.EAGAIN:
+                raise
+    communication.router.setsockopt(zmq.RCVTIMEO, -1)
+
+
+def nonblocking_loop(communication, duration):
+    """
+    The previous timeout pattern of EL_Local_Timeout: non-blocking receives
+    until the deadline
+
+    Parameters
+    ----------
+    communication : decentralizepy.communication.TCP
+        Communication without incoming messages
+    duration : float
+        Seconds to wait
+
+    """
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        communication.receive(block=False)
+
+
+def cpu_share(wait, *args):
+    """
+    CPU time used by this process while waiting, relative to the wall time
+
+    Parameters
+    ----------
+    wait : function
+        Waits without receiving anything
+    args : optional
+        Arguments of wait
+
+    Returns
+    -------
+    tuple
+        (wall time in s, CPU time / wall time)
+
+    """
+    start_cpu, start_wall = time.process_time(), time.perf_counter()
+    wait(*args)
+    wall = time.perf_counter() - start_wall
+    return wall, (time.process_time() - start_cpu) / wall
+
+
+if __name__ == "__main__":
+    # Usage: python benchmark_idle_receive.py [seconds] [port offset]
+    # CPU used by a process that waits for messages that never come
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    offset = int(sys.argv[2]) if len(sys.argv) > 2 else 29000
+
+    with tempfile.TemporaryDirectory() as directory:
+        addresses = os.path.join(directory, "ip.json")
+        with open(addresses, "w") as f:
+            json.dump({"0": "127.0.0.1"}, f)
+        communication = TCP(0, 0, Linear(1, 1), 1, addresses, offset=offset)
+
+        waits = [
+            ("receive(timeout) with zmq.Poller", communication.receive, True, duration),
+            ("RCVTIMEO 50 ms loop", rcvtimeo_loop, communication, duration, 50),
+            ("RCVTIMEO 1 ms loop", rcvtimeo_loop, communication, duration, 1),
+            ("non-blocking receive loop", nonblocking_loop, communication, duration),
+        ]
+        print("{:<34} {:>8} {:>8}".format("wait", "wall s", "CPU %"))
+        for name, wait, *args in waits:
+            wall, share = cpu_share(wait, *args)
+            print("{:<34} {:>8.2f} {:>8.1f}".format(name, wall, share * 100))
+        communication.context.destroy(linger=0)
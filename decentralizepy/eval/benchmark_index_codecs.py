@@ -0,0 +1,107 @@
+import sys
+import time
+
+import numpy as np
+
+from decentralizepy.compression.Elias import Elias
+from decentralizepy.compression.EliasGamma import EliasGamma
+from decentralizepy.sharing.ParameterLog import ParameterLog, ParameterLogReader
+
+
+def index_sets(path, alphas):
+    """
+    Top-k index sets to benchmark on.
+
+    Parameters
+    ----------
+    path : str or None
+        A model change log written with save_accumulated (model_change/<rank>/model_change),
+        a shared_params log written with save_shared, or None for a synthetic
+        ResNet-sized model change. The last round of a model change log is used.
+    alphas : list
+        Fractions of the model to select from model changes
+
+    Returns
+    -------
+    list
+        (name, sorted np.ndarray of indices)
+
+    """
+    if path is None:
+        rng = np.random.default_rng(90)
+        # Per-layer scales give the top-k indices a clustered, layer-wise structure
+        layer_sizes = rng.integers(1000, 600000, size=60)
+        scales = rng.lognormal(sigma=1.5, size=60)
+        change = np.concatenate(
+            [rng.laplace(scale=s, size=n) for s, n in zip(scales, layer_sizes)]
+        )
+    else:
+        reader = ParameterLogReader(path)
+        last = reader.rounds()[-1]
+        if reader.entry(last)["kind"] == ParameterLog.INDICES:
+            return [
+                ("round {}".format(r), reader.indices(r).astype(np.int32))
+                for r in reader.rounds()
+            ]
+        change = reader.vector(last)
+    change = np.abs(change)
+    sets = []
+    for alpha in alphas:
+        k = round(alpha * change.shape[0])
+        index = np.sort(np.argpartition(change, -k)[-k:]).astype(np.int32)
+        sets.append(("alpha {}".format(alpha), index))
+    return sets
+
+
+def measure(codec, index, repetitions):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        compressed = codec.compress(index.copy())
+    encode_time = (time.perf_counter() - start) / repetitions
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        decompressed = codec.decompress(compressed)
+    decode_time = (time.perf_counter() - start) / repetitions
+    assert np.array_equal(np.asarray(decompressed), index)
+    return len(compressed), encode_time, decode_time
+
+
+if __name__ == "__main__":
+    # Usage: python benchmark_index_codecs.py [model_change or shared_params log | ""] [repetitions]
+    path = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] else None
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    alphas = [0.01, 0.05, 0.1, 0.2, 0.5]
+
+    codecs = [("Elias", Elias()), ("EliasGamma", EliasGamma())]
+    try:
+        from decentralizepy.compression.Lz4Wrapper import Lz4Wrapper
+
+        codecs.append(("Lz4Wrapper", Lz4Wrapper()))
+    except ImportError:
+        print("lz4 not installed, skipping Lz4Wrapper")
+    try:
+        from decentralizepy.compression.EliasFpzip import EliasFpzip
+
+        codecs.append(("EliasFpzip", EliasFpzip()))
+    except ImportError:
+        print("fpzip not installed, skipping EliasFpzip")
+
+    print("Index source: {}".format(path if path else "synthetic"))
+    print(
+        "{:>12} {:>12} {:>10} {:>12} {:>10} {:>10}".format(
+            "set", "codec", "indices", "bytes", "enc ms", "dec ms"
+        )
+    )
+    for name, index in index_sets(path, alphas):
+        for codec_name, codec in codecs:
+            size, encode_time, decode_time = measure(codec, index, repetitions)
+            print(
+                "{:>12} {:>12} {:>10} {:>12} {:>10.2f} {:>10.2f}".format(
+                    name,
+                    codec_name,
+                    index.shape[0],
+                    size,
+                    encode_time * 1000,
+                    decode_time * 1000,
+                )
+            )
@@ -0,0 +1,142 @@
+import sys
+import time
+
+import numpy as np
+import pywt
+import torch
+import torch.fft as fft
+
+from decentralizepy.sharing.JWINS.Wavelet import (
+    change_transformer_wavelet,
+    wavelet_plan,
+)
+from decentralizepy.sharing.SparseAccumulator import SparseAccumulator
+
+
+class Transform:
+    """
+    Forward and inverse transform of a flat model
+
+    """
+
+    def __init__(self, name, length, wavelet="haar", level=4):
+        self.name = name
+        self.length = length
+        if name == "wavelet":
+            self.wavelet, self.level = wavelet, level
+            self.wavelet_object, self.coeff_slices, _ = wavelet_plan(
+                wavelet, level, length
+            )
+
+    def forward(self, x):
+        if self.name == "fft":
+            return fft.rfft(x)
+        return change_transformer_wavelet(x, self.wavelet, self.level)
+
+    def inverse(self, coefficients):
+        if self.name == "fft":
+            return fft.irfft(coefficients, n=self.length)
+        coeff = pywt.array_to_coeffs(
+            coefficients.numpy(), self.coeff_slices, output_format="wavedec"
+        )
+        return torch.from_numpy(
+            pywt.waverec(coeff, wavelet=self.wavelet_object)[: self.length]
+        )
+
+
+def per_neighbor_inverse(transform, local, messages, weight):
+    """
+    Inverse transform of every complemented neighbor, averaged in the parameter domain
+
+    """
+    local_model = transform.inverse(local)
+    total = (1 - weight * len(messages)) * local_model
+    for indices, values in messages:
+        complemented = local.clone()
+        complemented[indices] = values
+        total += weight * transform.inverse(complemented)
+    return total
+
+
+def dense_complement(transform, local, messages, weight):
+    """
+    Previous receiver: dense complement of every neighbor, one inverse transform
+
+    """
+    total = None
+    for indices, values in messages:
+        complemented = local.clone()
+        complemented[indices] = values
+        if total is None:
+            total = weight * complemented
+        else:
+            total += weight * complemented
+    total += (1 - weight * len(messages)) * local
+    return transform.inverse(total)
+
+
+def sparse_accumulator(accumulator):
+    """
+    Current receiver: sparse accumulation in the coefficient domain, one inverse transform
+
+    """
+
+    def aggregate(transform, local, messages, weight):
+        accumulator.reset()
+        for indices, values in messages:
+            accumulator.add(indices, values, weight)
+        return transform.inverse(accumulator.average(local))
+
+    return aggregate
+
+
+if __name__ == "__main__":
+    # Usage: python benchmark_jwins_aggregation.py [num_params] [alpha] [repetitions]
+    num_params = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    alpha = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    repetitions = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    rng = np.random.default_rng(90)
+
+    print("Parameters: {}, alpha: {}".format(num_params, alpha))
+    print(
+        "{:>8} {:>7} {:>16} {:>16} {:>16} {:>10}".format(
+            "domain",
+            "degree",
+            "per-neighbor ms",
+            "dense ms",
+            "accumulator ms",
+            "max diff",
+        )
+    )
+    for name in ["fft", "wavelet"]:
+        transform = Transform(name, num_params)
+        local = transform.forward(torch.randn(num_params))
+        accumulator = SparseAccumulator(local.shape[0], dtype=local.dtype)
+        for degree in [2, 4, 8, 16]:
+            k = round(alpha * local.shape[0])
+            messages = []
+            for _ in range(degree):
+                neighbor = transform.forward(torch.randn(num_params))
+                indices = torch.from_numpy(
+                    np.sort(rng.choice(local.shape[0], size=k, replace=False))
+                )
+                messages.append((indices, neighbor[indices]))
+            weight = 1 / (degree + 1)
+            times = []
+            results = []
+            for aggregate in [
+                per_neighbor_inverse,
+                dense_complement,
+                sparse_accumulator(accumulator),
+            ]:
+                start = time.perf_counter()
+                for _ in range(repetitions):
+                    result = aggregate(transform, local, messages, weight)
+                times.append((time.perf_counter() - start) / repetitions)
+                results.append(result.clone())
+            diff = max((r - results[0]).abs().max().item() for r in results[1:])
+            print(
+                "{:>8} {:>7} {:>16.1f} {:>16.1f} {:>16.1f} {:>10.2e}".format(
+                    name, degree, *[t * 1000 for t in times], diff
+                )
+            )
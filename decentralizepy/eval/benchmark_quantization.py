@@ -0,0 +1,111 @@
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from decentralizepy.compression.Quantization import Quantization
+
+
+class LoopQuantization(Quantization):
+    """
+    Reference implementation converting each parameter with np.binary_repr
+
+    """
+
+    def compress_float(self, x):
+        scale_factor = np.mean(np.abs(x)) / self.k
+        norm_factor = np.max(np.abs(x)) / self.k
+        x = (x / norm_factor).round().astype(np.int32)
+        max_abs = np.max(np.abs(x))
+        nearest_pow_2 = 2 ** np.ceil(np.log2(max_abs))
+        if nearest_pow_2 == max_abs:
+            nearest_pow_2 = nearest_pow_2 * 2
+        num_bits = int(np.ceil(np.log2(nearest_pow_2))) + 1
+        x = np.asarray(x + nearest_pow_2 - 1, dtype=np.uint32)
+        bit_rep = np.zeros((x.shape[0], num_bits), dtype=np.uint8)
+        for i in range(len(x)):
+            str_bit = np.binary_repr(x[i], width=num_bits)
+            array_bit = np.array(list(str_bit), dtype=np.uint8)
+            bit_rep[i][np.where(array_bit == 1)[0]] = 1
+        bit_rep = bit_rep.reshape(-1)
+        intermediate_rep = np.packbits(bit_rep, bitorder="little")
+        padding = np.array([0], dtype=np.uint8)
+        if bit_rep.shape[0] % 8:
+            padding = np.array([8 - (bit_rep.shape[0] % 8)], dtype=np.uint8)
+        num_bits = np.array([num_bits], dtype=np.uint8)
+        to_send = np.concatenate((padding, num_bits, intermediate_rep), dtype=np.uint8)
+        return pickle.dumps((scale_factor, to_send))
+
+    def decompress_float(self, bytes):
+        scale_factor, x = pickle.loads(bytes)
+        padding = -x[0].item() if x[0].item() else None
+        num_bits = x[1].item()
+        received_x = np.unpackbits(
+            x[2:].astype(np.uint8), bitorder="little", count=padding
+        )
+        received_x = received_x.reshape((-1, num_bits)).astype(np.uint8)
+        output = np.zeros(received_x.shape[0], dtype=np.int32)
+        for i in range(received_x.shape[0]):
+            output[i] = (
+                int("".join(received_x[i].astype(str)), 2) - (2 ** (num_bits - 1)) + 1
+            )
+        return (output * scale_factor).astype(np.float32)
+
+
+def throughput(compressor, x, repetitions):
+    """
+    Measures compression and decompression throughput
+
+    Parameters
+    ----------
+    compressor : decentralizepy.compression.Compression
+        Compressor to measure
+    x : np.ndarray
+        Parameters to compress
+    repetitions : int
+        Number of measured repetitions
+
+    Returns
+    -------
+    tuple
+        (compressed bytes, compress params/s, decompress params/s)
+
+    """
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        compressed = compressor.compress_float(x)
+    compress_time = (time.perf_counter() - start) / repetitions
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        compressor.decompress_float(compressed)
+    decompress_time = (time.perf_counter() - start) / repetitions
+    return len(compressed), x.shape[0] / compress_time, x.shape[0] / decompress_time
+
+
+if __name__ == "__main__":
+    # Usage: python benchmark_quantization.py [num_params] [repetitions]
+    num_params = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    x = np.random.default_rng(90).standard_normal(num_params).astype(np.float32)
+
+    print(
+        "{:>5} {:>14} {:>12} {:>16} {:>16}".format(
+            "bits", "implementation", "bytes", "compress p/s", "decompress p/s"
+        )
+    )
+    for num_bits in [4, 8, 12, 16, 24]:
+        float_precision = 2 ** (num_bits - 1) - 1
+        for name, compressor in [
+            ("loop", LoopQuantization(float_precision)),
+            ("vectorized", Quantization(float_precision)),
+            ("stochastic", Quantization(float_precision, stochastic_rounding=True)),
+        ]:
+            size, compress_rate, decompress_rate = throughput(
+                compressor, x, repetitions
+            )
+            print(
+                "{:>5} {:>14} {:>12} {:>16.0f} {:>16.0f}".format(
+                    num_bits, name, size, compress_rate, decompress_rate
+                )
+            )
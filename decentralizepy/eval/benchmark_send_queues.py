@@ -0,0 +1,191 @@
+import json
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+
+import numpy as np
+
+from decentralizepy.communication.TCP import TCP
+from decentralizepy.mappings.Linear import Linear
+
+
+def resident_mb():
+    """
+    Resident memory of this process
+
+    Returns
+    -------
+    float
+        RSS in MiB
+
+    """
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def slow_peer(uid, n_procs, addresses, offset, delay, options, results):
+    """
+    Receives models until the END message, taking `delay` seconds per model
+
+    Parameters
+    ----------
+    uid : int
+        Unique ID of the peer
+    n_procs : int
+        Number of processes
+    addresses : str
+        JSON file with machine_id -> ip mapping
+    offset : int
+        Port offset of the processes
+    delay : float
+        Seconds spent on each model
+    options : dict
+        Keyword arguments of the TCP communication
+    results : multiprocessing.Queue
+        Gets (uid, models received, growth of the RSS in MiB)
+
+    """
+    communication = TCP(
+        uid, 0, Linear(1, n_procs), n_procs, addresses, offset, **options
+    )
+    baseline = peak = resident_mb()
+    received = 0
+    while True:
+        _, data = communication.receive()
+        if data["CHANNEL"] == "END":
+            break
+        received += 1
+        time.sleep(delay)
+        peak = max(peak, resident_mb())
+    results.put((uid, received, peak - baseline))
+    communication.context.destroy(linger=0)
+
+
+def stress(addresses, offset, n_peers, rounds, size, delay, options):
+    """
+    Sends a model to every slow peer each round, as fast as the sender can
+
+    Parameters
+    ----------
+    addresses : str
+        JSON file with machine_id -> ip mapping
+    offset : int
+        Port offset of the processes
+    n_peers : int
+        Number of slow peers
+    rounds : int
+        Number of models sent to each peer
+    size : int
+        Number of float32 parameters per model
+    delay : float
+        Seconds a peer spends on each model
+    options : dict
+        Keyword arguments of the TCP communication of all processes
+
+    Returns
+    -------
+    dict
+        Memory growth, delivered models and time of the run
+
+    """
+    n_procs = n_peers + 1
+    results = Queue()
+    peers = [
+        Process(
+            target=slow_peer,
+            args=(uid, n_procs, addresses, offset, delay, options, results),
+        )
+        for uid in range(1, n_procs)
+    ]
+    for p in peers:
+        p.start()
+
+    sender = TCP(0, 0, Linear(1, n_procs), n_procs, addresses, offset, **options)
+    params = np.random.default_rng(90).random(size, dtype=np.float32)
+    baseline = peak = resident_mb()
+    start = time.perf_counter()
+    for i in range(rounds):
+        for uid in range(1, n_procs):
+            sender.send(uid, {"CHANNEL": "DPSGD", "iteration": i, "params": params})
+        peak = max(peak, resident_mb())
+    send_time = time.perf_counter() - start
+    for uid in range(1, n_procs):
+        sender.send(uid, {"CHANNEL": "END"})
+    while sender.queued_bytes > 0:
+        sender.receive(timeout=0.1)
+
+    received = [results.get() for _ in peers]
+    elapsed = time.perf_counter() - start
+    for p in peers:
+        p.join()
+    result = {
+        "send_seconds": send_time,
+        "seconds": elapsed,
+        "sender_mb": peak - baseline,
+        "peak_queued_mb": sender.peak_queued_bytes / 2**20,
+        "peer_mb": max(r[2] for r in received),
+        "delivered": sum(r[1] for r in received),
+        "skipped": sender.dropped_messages + sender.coalesced_messages,
+    }
+    sender.context.destroy(linger=0)
+    return result
+
+
+if __name__ == "__main__":
+    # Usage: python benchmark_send_queues.py [peers] [rounds] [parameters per model] [seconds per model] [port offset]
+    # Memory of a sender and its slow peers with unbounded and bounded send queues.
+    # Unbounded, the models pile up at the peers and grow with the rounds. Bounded,
+    # a peer holds about recv_hwm models and the sender about the budget plus
+    # send_hwm models per peer
+    n_peers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 2000000
+    delay = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+    offset = int(sys.argv[5]) if len(sys.argv) > 5 else 33000
+
+    budget = 2 * 4 * size
+    configurations = [
+        ("unbounded (SNDHWM=RCVHWM=0)", dict()),
+        ("block, 2 models", dict(max_queued_bytes=budget, recv_hwm=1)),
+        (
+            "coalesce, 2 models",
+            dict(max_queued_bytes=budget, overflow="coalesce", recv_hwm=1),
+        ),
+        ("drop, 2 models", dict(max_queued_bytes=budget, overflow="drop", recv_hwm=1)),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        addresses = os.path.join(directory, "ip.json")
+        with open(addresses, "w") as f:
+            json.dump({"0": "127.0.0.1"}, f)
+
+        print(
+            "{:<28} {:>7} {:>8} {:>10} {:>10} {:>8} {:>10} {:>8}".format(
+                "send queues",
+                "send s",
+                "total s",
+                "sender MB",
+                "queued MB",
+                "peer MB",
+                "delivered",
+                "skipped",
+            )
+        )
+        for i, (name, options) in enumerate(configurations):
+            r = stress(
+                addresses, offset + 10 * i, n_peers, rounds, size, delay, options
+            )
+            print(
+                "{:<28} {:>7.2f} {:>8.2f} {:>10.1f} {:>10.1f} {:>8.1f} {:>10} {:>8}".format(
+                    name,
+                    r["send_seconds"],
+                    r["seconds"],
+                    r["sender_mb"],
+                    r["peak_queued_mb"],
+                    r["peer_mb"],
+                    r["delivered"],
+                    r["skipped"],
+                )
+            )
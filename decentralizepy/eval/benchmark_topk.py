@@ -0,0 +1,92 @@
+import sys
+import time
+
+import numpy as np
+import torch
+
+from decentralizepy.sharing.ParameterLog import ParameterLogReader
+from decentralizepy.sharing.TopK import TopK
+
+
+def model_change(path):
+    """
+    Absolute model change to select from
+
+    Parameters
+    ----------
+    path : str or None
+        A model change log written with save_accumulated (model_change/<rank>/model_change)
+        or None for a synthetic ResNet-sized model change. The last round is used.
+
+    Returns
+    -------
+    torch.Tensor
+        1-D magnitudes
+
+    """
+    if path is None:
+        rng = np.random.default_rng(90)
+        # Per-layer scales give the change a layer-wise structure
+        layer_sizes = rng.integers(1000, 600000, size=60)
+        scales = rng.lognormal(sigma=1.5, size=60)
+        change = np.concatenate(
+            [rng.laplace(scale=s, size=n) for s, n in zip(scales, layer_sizes)]
+        )
+    else:
+        reader = ParameterLogReader(path)
+        change = reader.vector(reader.rounds()[-1])
+    return torch.tensor(np.abs(change), dtype=torch.float32)
+
+
+def sort_topk(magnitudes, alpha):
+    """
+    Previous selection: full top-k followed by a sort of the indices
+
+    """
+    _, index = torch.topk(
+        magnitudes, round(alpha * magnitudes.shape[0]), dim=0, sorted=True
+    )
+    index, _ = torch.sort(index)
+    return index
+
+
+def measure(select, magnitudes, alpha, repetitions):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        index = select(magnitudes, alpha)
+    return index, (time.perf_counter() - start) / repetitions
+
+
+if __name__ == "__main__":
+    # Usage: python benchmark_topk.py [model_change log | ""] [repetitions]
+    path = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] else None
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    magnitudes = model_change(path)
+    topk = TopK()
+
+    print("Change source: {}".format(path if path else "synthetic"))
+    print("Parameters: {}".format(magnitudes.shape[0]))
+    print(
+        "{:>6} {:>12} {:>12} {:>8} {:>10}".format(
+            "alpha", "topk+sort ms", "TopK ms", "speedup", "same set"
+        )
+    )
+    for alpha in [0.01, 0.05, 0.1, 0.2, 0.3, 0.5]:
+        expected, sort_time = measure(sort_topk, magnitudes, alpha, repetitions)
+        index, topk_time = measure(topk.select_fraction, magnitudes, alpha, repetitions)
+        print(
+            "{:>6} {:>12.1f} {:>12.1f} {:>8.2f} {:>10}".format(
+                alpha,
+                sort_time * 1000,
+                topk_time * 1000,
+                sort_time / topk_time,
+                # Ties at the k-th magnitude may be broken differently
+                str(
+                    torch.equal(
+                        torch.sort(magnitudes[expected])[0],
+                        torch.sort(magnitudes[index])[0],
+                    )
+                ),
+            )
+        )
+    print("Exact fallbacks: {}".format(topk.fallbacks))
@@ -0,0 +1,16 @@
+import sys
+
+from decentralizepy.graphs.CSRGraph import CSRGraph
+
+if __name__ == "__main__":
+    # Usage: python convert_graph.py <graph file> <edges|adjacency|binary> <output file> [edges|adjacency|binary]
+    # Converts e.g. a text graph to the binary CSR format that CSRGraph memory-maps
+    graph = CSRGraph()
+    graph.read_graph_from_file(sys.argv[1], sys.argv[2])
+    output_type = sys.argv[4] if len(sys.argv) > 4 else "binary"
+    graph.write_graph_to_file(sys.argv[3], output_type)
+    print(
+        "{} nodes, {} edges, connected: {}".format(
+            graph.n_procs, len(graph.indices) // 2, graph.is_connected()
+        )
+    )
@@ -8,6 +8,8 @@ import pandas as pd
 import torch
 from matplotlib import pyplot as plt
 
+from decentralizepy.sharing.ParameterLog import ParameterLogReader
+
 
 def get_stats(l):
     assert len(l) > 0
@@ -289,22 +291,20 @@ def plot_parameters(path):
         if not os.path.isdir(folder_path):
             continue
         files = os.listdir(folder_path)
-        files = [f for f in files if f.endswith("_shared_params.json")]
+        files = [f for f in files if f.endswith("shared_params.index")]
         for f in files:
-            filepath = os.path.join(folder_path, f)
+            filepath = os.path.join(folder_path, f[: -len(".index")])
             print("Working with ", filepath)
-            with open(filepath, "r") as inf:
-                loaded_dict = json.load(inf)
-                del loaded_dict["order"]
-                del loaded_dict["shapes"]
-            assert len(loaded_dict["0"]) > 0
-            assert "0" in loaded_dict.keys()
-            counts = np.zeros(len(loaded_dict["0"]))
-            for key in loaded_dict.keys():
-                indices = np.array(loaded_dict[key])
+            reader = ParameterLogReader(filepath)
+            assert len(reader) > 0
+            counts = np.zeros(0)
+            for round in reader.rounds():
+                indices = reader.indices(round)
+                if len(indices) == 0:
+                    continue
                 counts = np.pad(
                     counts,
-                    max(np.max(indices) - counts.shape[0], 0),
+                    (0, max(np.max(indices) + 1 - counts.shape[0], 0)),
                     "constant",
                     constant_values=0,
                 )
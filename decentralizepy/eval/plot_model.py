@@ -1,11 +1,11 @@
-import json
 import os
 import sys
 from pathlib import Path
 
 import numpy as np
 from matplotlib import pyplot as plt
-from pyexpat import model
+
+from decentralizepy.sharing.ParameterLog import ParameterLogReader
 
 
 def plot(x, y, label, *args):
@@ -20,17 +20,49 @@ def reject_outliers(data, m=2.0):
     return data[s < m]
 
 
-def plot_model(path, title):
+def read_log(path, name):
+    """
+    Opens the ParameterLog `name` of a node folder
+
+    Parameters
+    ----------
+    path : str
+        Folder of the log
+    name : str
+        Name of the log without extension
+
+    Returns
+    -------
+    decentralizepy.sharing.ParameterLog.ParameterLogReader or None
+        The reader, None if the folder has no such log
+
+    """
+    log_path = os.path.join(path, name)
+    if not os.path.exists(log_path + ".index"):
+        print("No {} log in {}".format(name, path))
+        return None
+    return ParameterLogReader(log_path)
+
+
+def logged_vector(reader, round):
+    """
+    Vector of a round in float32, magnitudes for complex vectors
+
+    """
+    vector = reader.vector(round)
+    if np.iscomplexobj(vector):
+        return np.abs(vector)
+    return vector.astype(np.float32)
+
+
+def plot_model(path, name, title):
     model_path = os.path.join(path, "plots")
+    reader = read_log(path, name)
+    if reader is None:
+        return
     Path(model_path).mkdir(parents=True, exist_ok=True)
-    files = [f for f in os.listdir(path) if f.endswith("json")]
-    for file in files:
-        filepath = os.path.join(path, file)
-        with open(filepath, "r") as inf:
-            model_vec = json.load(inf)
-            del model_vec["order"]
-            del model_vec["shapes"]
-            model_vec = np.array(model_vec[list(model_vec.keys())[0]])
+    for round in reader.rounds():
+        model_vec = logged_vector(reader, round)
         num_elements = model_vec.shape[0]
         x_axis = np.arange(1, num_elements + 1)
         plt.clf()
@@ -38,30 +70,21 @@ def plot_model(path, title):
         plot(x_axis, model_vec, "unsorted", ".")
         model_vec = np.sort(model_vec)
         plot(x_axis, model_vec, "sorted")
-        plt.savefig(os.path.join(model_path, file[0:-5]))
+        plt.savefig(os.path.join(model_path, str(round + 1)))
 
 
 def plot_ratio(path_change, path_val, title):
     model_path = os.path.join(path_change, "plots_ratio")
+    reader_change = read_log(path_change, "model_change")
+    reader_val = read_log(path_val, "model_val")
+    if reader_change is None or reader_val is None:
+        return
     Path(model_path).mkdir(parents=True, exist_ok=True)
-    files_change = [f for f in os.listdir(path_change) if f.endswith("json")]
-    files_val = [f for f in os.listdir(path_val) if f.endswith("json")]
-    for i, file in enumerate(files_change):
-        print("Processed ", file)
-        filepath_change = os.path.join(path_change, file)
-        filepath_val = os.path.join(path_val, files_val[i])
-        with open(filepath_change, "r") as inf:
-            model_change = json.load(inf)
-            del model_change["order"]
-            del model_change["shapes"]
-            model_change = np.array(model_change[list(model_change.keys())[0]])
-        with open(filepath_val, "r") as inf:
-            model_val = json.load(inf)
-            del model_val["order"]
-            del model_val["shapes"]
-            model_val = np.array(model_val[list(model_val.keys())[0]])
-        num_elements = model_val.shape[0]
-        x_axis = np.arange(1, num_elements + 1)
+    rounds = sorted(set(reader_change.rounds()) & set(reader_val.rounds()))
+    for round in rounds:
+        print("Processed round ", round)
+        model_change = logged_vector(reader_change, round)
+        model_val = logged_vector(reader_val, round)
         plt.clf()
         plt.title(title)
         model_vec = np.divide(
@@ -76,15 +99,23 @@ def plot_ratio(path_change, path_val, title):
         plot(x_axis, model_vec, "unsorted", ".")
         model_vec = np.sort(model_vec)
         plot(x_axis, model_vec, "sorted")
-        plt.savefig(os.path.join(model_path, file[0:-5]))
+        plt.savefig(os.path.join(model_path, str(round + 1)))
 
 
 if __name__ == "__main__":
+    # Usage: python plot_model.py <log folder> <rank>
+    # Plots every round of the model_change (and model_val) ParameterLogs of a node
     assert len(sys.argv) == 3
     plot_model(
-        os.path.join(sys.argv[1], "model_change", sys.argv[2]), "Change in Weights"
+        os.path.join(sys.argv[1], "model_change", sys.argv[2]),
+        "model_change",
+        "Change in Weights",
+    )
+    plot_model(
+        os.path.join(sys.argv[1], "model_val", sys.argv[2]),
+        "model_val",
+        "Model Parameters",
     )
-    plot_model(os.path.join(sys.argv[1], "model_val", sys.argv[2]), "Model Parameters")
     plot_ratio(
         os.path.join(sys.argv[1], "model_change", sys.argv[2]),
         os.path.join(sys.argv[1], "model_val", sys.argv[2]),
@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from decentralizepy.sharing.ParameterLog import ParameterLog, ParameterLogReader
+
+
+def to_json(reader, round):
+    """
+    Legacy JSON layout of one round of a log
+
+    Parameters
+    ----------
+    reader : decentralizepy.sharing.ParameterLog.ParameterLogReader
+        Log to convert
+    round : int
+        Communication round
+
+    Returns
+    -------
+    dict
+        {"order", "shapes", round: indices, "alpha"} for shared indices,
+        {"order", "shapes", "tensor"} for vectors
+
+    """
+    output_dict = dict()
+    output_dict["order"] = reader.order
+    output_dict["shapes"] = reader.shapes
+    if reader.entry(round)["kind"] == ParameterLog.INDICES:
+        output_dict[round] = reader.indices(round).tolist()
+        if not np.isnan(reader.alpha(round)):
+            output_dict["alpha"] = reader.alpha(round)
+    else:
+        vector = reader.vector(round)
+        if np.iscomplexobj(vector):
+            output_dict["tensor"] = np.stack([vector.real, vector.imag], 1).tolist()
+        else:
+            output_dict["tensor"] = vector.astype(np.float32).tolist()
+    return output_dict
+
+
+if __name__ == "__main__":
+    # Usage: python read_parameter_log.py <log path without extension> [output folder]
+    # Prints a summary of the log. With an output folder, writes every round
+    # in the legacy per-round JSON files.
+    path = sys.argv[1]
+    reader = ParameterLogReader(path)
+    print("Log: {}, rounds: {}".format(path, len(reader)))
+    for round in reader.rounds():
+        entry = reader.entry(round)
+        print(
+            "round {:>6} kind {} count {:>10} width {}".format(
+                round, int(entry["kind"]), int(entry["count"]), int(entry["width"])
+            )
+        )
+    if len(sys.argv) > 2:
+        os.makedirs(sys.argv[2], exist_ok=True)
+        name = os.path.basename(path)
+        for round in reader.rounds():
+            if name == "shared_params":
+                filename = "{}_shared_params.json".format(round + 1)
+            else:
+                filename = "{}.json".format(round + 1)
+            with open(os.path.join(sys.argv[2], filename), "w") as of:
+                json.dump(to_json(reader, round), of)
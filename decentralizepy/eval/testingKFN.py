@@ -6,6 +6,7 @@ from localconfig import LocalConfig
 from torch import multiprocessing as mp
 
 from decentralizepy import utils
+from decentralizepy.graphs.CSRGraph import CSRGraph
 from decentralizepy.graphs.Graph import Graph
 from decentralizepy.mappings.Linear import Linear
 from decentralizepy.node.KFNNode import KFNNode
@@ -43,7 +44,7 @@ if __name__ == "__main__":
     copy(args.graph_file, args.log_dir)
     utils.write_args(args, args.log_dir)
 
-    g = Graph()
+    g = CSRGraph() if args.graph_type == "binary" else Graph()
     g.read_graph_from_file(args.graph_file, args.graph_type)
     n_machines = args.machines
     procs_per_machine = args.procs_per_machine[0]
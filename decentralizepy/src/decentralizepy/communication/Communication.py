@@ -75,14 +75,21 @@ class Communication:
         """
         raise NotImplementedError
 
-    def receive(self):
+    def receive(self, block=True, timeout=None):
         """
         Returns ONE message received.
 
+        Parameters
+        ----------
+        block : bool, optional
+            Wait for a message, otherwise return None right away if there is none
+        timeout : float, optional
+            Maximum number of seconds to wait, None to wait until a message arrives
+
         Returns
         ----------
-        dict
-            Received and decrypted data
+        tuple or None
+            (sender, received and decrypted data), None if no message arrived in time
 
         """
         raise NotImplementedError
@@ -0,0 +1,107 @@
+import logging
+import os
+
+import numpy as np
+import torch
+
+
+class PayloadRecorder:
+    """
+    Records the payloads a node sends into a corpus directory, to replay real
+    traffic through the compression codecs (eval/benchmark_compression.py).
+    Only messages carrying "params" are recorded, before compression and
+    serialization, one file per message: <directory>/<uid>_<count>.pt.
+    A dict sent to several neighbors is recorded once.
+
+    """
+
+    def __init__(self, directory, uid, limit=100, every=1):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        directory : str
+            Directory of the corpus
+        uid : int
+            Unique ID of the recording node
+        limit : int, optional
+            Maximum number of payloads recorded by this node
+        every : int, optional
+            Record the payloads of every n-th iteration only
+
+        """
+        self.directory = directory
+        self.uid = uid
+        self.limit = limit
+        self.every = every
+        self.count = 0
+        self.last = None
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def kind(data):
+        """
+        Kind of sharing that produced a payload
+
+        Parameters
+        ----------
+        data : dict
+            Payload
+
+        Returns
+        -------
+        str
+            "sparse" for index/value updates, "chunk" for VNodeSharing chunks,
+            "full" for full models
+
+        """
+        if "indices" in data:
+            return "sparse"
+        if "start_index" in data:
+            return "chunk"
+        return "full"
+
+    @staticmethod
+    def to_numpy(value):
+        if isinstance(value, torch.Tensor):
+            return value.detach().cpu().numpy()
+        return np.asarray(value)
+
+    def record(self, receiver, data):
+        """
+        Records a payload if it is one to keep
+
+        Parameters
+        ----------
+        receiver : int
+            Neighbor's unique ID
+        data : dict
+            Message as a Python dictionary, before serialization
+
+        """
+        if self.count >= self.limit or data is self.last or "params" not in data:
+            return
+        self.last = data
+        iteration = data.get("iteration", 0)
+        if iteration % self.every != 0:
+            return
+        if isinstance(data["params"], (bytes, bytearray)) or isinstance(
+            data.get("indices", None), (bytes, bytearray)
+        ):
+            logging.warning("Payload is already compressed, not recording it")
+            return
+        payload = {
+            "kind": self.kind(data),
+            "sender": self.uid,
+            "receiver": receiver,
+            "iteration": iteration,
+            "params": self.to_numpy(data["params"]),
+        }
+        if "indices" in data:
+            payload["indices"] = self.to_numpy(data["indices"])
+        torch.save(
+            payload,
+            os.path.join(self.directory, "{}_{}.pt".format(self.uid, self.count)),
+        )
+        self.count += 1
@@ -0,0 +1,184 @@
+from collections import OrderedDict, deque
+from time import perf_counter
+
+
+class SendWindow:
+    """
+    Sending side of the reliable channel to one peer. Messages get consecutive
+    sequence numbers and at most `window` messages and `max_bytes` bytes are
+    in flight (at least one message, however large). The receiver acknowledges
+    cumulatively with the next sequence number it expects, and selectively
+    with the sequence numbers it holds out of order. A message that is missing
+    below one the receiver holds was lost, it is sent again at once. When
+    nothing is acknowledged in time, every message in flight that the receiver
+    does not hold is sent again and the timeout doubles, up to
+    max_resend_timeout.
+
+    """
+
+    def __init__(self, window, max_bytes, resend_timeout, max_resend_timeout):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        window : int
+            Maximum number of messages in flight
+        max_bytes : int
+            Maximum number of bytes in flight
+        resend_timeout : float
+            Seconds before the oldest message is sent again
+        max_resend_timeout : float
+            Bound of the exponential backoff, in seconds
+
+        """
+        self.window = window
+        self.max_bytes = max_bytes
+        self.resend_timeout = resend_timeout
+        self.max_resend_timeout = max_resend_timeout
+        self.timeout = resend_timeout
+        self.next_seq = 0
+        # (seq, frames, size) waiting for room in the window
+        self.backlog = deque()
+        # seq -> (frames, size), in order
+        self.in_flight = OrderedDict()
+        self.in_flight_bytes = 0
+        # Deadline of the oldest message in flight, None if nothing is in flight
+        self.deadline = None
+        # Messages in flight that the receiver holds out of order
+        self.selected = set()
+        # Messages in flight sent again since the last timeout
+        self.resent = set()
+
+    def add(self, frames, size):
+        """
+        Queues a message
+
+        Parameters
+        ----------
+        frames : list(byte)
+            Encoded message, numbered with next_seq
+        size : int
+            Size of the message in bytes
+
+        Returns
+        -------
+        int
+            Sequence number of the message
+
+        """
+        seq = self.next_seq
+        self.next_seq += 1
+        self.backlog.append((seq, frames, size))
+        return seq
+
+    def ready(self):
+        """
+        Moves queued messages into the window while there is room
+
+        Returns
+        -------
+        list
+            Frames of the messages to send now
+
+        """
+        to_send = []
+        while len(self.backlog) > 0 and (
+            len(self.in_flight) == 0
+            or (
+                len(self.in_flight) < self.window
+                and self.in_flight_bytes + self.backlog[0][2] <= self.max_bytes
+            )
+        ):
+            seq, frames, size = self.backlog.popleft()
+            if len(self.in_flight) == 0:
+                self.deadline = perf_counter() + self.timeout
+            self.in_flight[seq] = (frames, size)
+            self.in_flight_bytes += size
+            to_send.append(frames)
+        return to_send
+
+    def acknowledge(self, ack):
+        """
+        Removes the messages acknowledged by a cumulative ack
+
+        Parameters
+        ----------
+        ack : int
+            Next sequence number expected by the receiver
+
+        Returns
+        -------
+        int
+            Number of messages newly acknowledged
+
+        """
+        acknowledged = 0
+        while len(self.in_flight) > 0 and next(iter(self.in_flight)) < ack:
+            seq, (_, size) = self.in_flight.popitem(last=False)
+            self.in_flight_bytes -= size
+            self.selected.discard(seq)
+            self.resent.discard(seq)
+            acknowledged += 1
+        if acknowledged > 0:
+            self.timeout = self.resend_timeout
+            self.deadline = (
+                perf_counter() + self.timeout if len(self.in_flight) > 0 else None
+            )
+        return acknowledged
+
+    def expired(self, now):
+        """
+        Messages in flight that the receiver does not hold, if the deadline
+        has passed. Backs off.
+
+        Parameters
+        ----------
+        now : float
+            Current perf_counter()
+
+        Returns
+        -------
+        list
+            (frames, size) of the messages to send again
+
+        """
+        if self.deadline is None or now < self.deadline:
+            return []
+        self.timeout = min(2 * self.timeout, self.max_resend_timeout)
+        self.deadline = now + self.timeout
+        self.resent = set(self.in_flight) - self.selected
+        return [m for seq, m in self.in_flight.items() if seq in self.resent]
+
+    def selective(self, received):
+        """
+        Messages lost below the ones the receiver holds out of order. Each
+        one is sent again once, after that only by the timeout.
+
+        Parameters
+        ----------
+        received : list(int)
+            Sequence numbers the receiver holds out of order
+
+        Returns
+        -------
+        list
+            (frames, size) of the messages to send again
+
+        """
+        held = len(self.selected)
+        self.selected.update(seq for seq in received if seq in self.in_flight)
+        if len(self.selected) == 0:
+            return []
+        if len(self.selected) > held:
+            # The peer receives, the losses are not congestion
+            self.timeout = self.resend_timeout
+        last = max(self.selected)
+        lost = []
+        for seq, message in self.in_flight.items():
+            if seq > last:
+                break
+            if seq not in self.selected and seq not in self.resent:
+                self.resent.add(seq)
+                lost.append(message)
+        return lost
@@ -1,14 +1,15 @@
 import json
 import logging
 import socket
-from collections import deque
+from collections import OrderedDict, deque
 from io import BytesIO
-from time import sleep
+from time import perf_counter, sleep
 
 import torch
 import zmq
 
 from decentralizepy.communication.Communication import Communication
+from decentralizepy.communication.PayloadRecorder import PayloadRecorder
 
 HELLO = b"HELLO"
 BYE = b"BYE"
@@ -53,6 +54,15 @@ class TCP(Communication):
         addresses_filepath,
         offset=9000,
         recv_timeout=50,
+        record_dir=None,
+        record_limit=100,
+        record_every=1,
+        max_connections=None,
+        lazy_connect=False,
+        max_queued_bytes=None,
+        overflow="block",
+        send_hwm=None,
+        recv_hwm=0,
     ):
         """
         Constructor
@@ -73,6 +83,33 @@ class TCP(Communication):
             Import path of a module that implements the compression.Compression.Compression class
         compression_class : str
             Name of the compression class inside the compression package
+        record_dir : str, optional
+            Directory to record the sent payloads into, for eval/benchmark_compression.py
+        record_limit : int, optional
+            Maximum number of payloads recorded
+        record_every : int, optional
+            Record the payloads of every n-th iteration only
+        max_connections : int, optional
+            Maximum number of open peer sockets, the least recently used are closed.
+            Messages sent before and after reconnecting to a peer may be reordered
+        lazy_connect : bool, optional
+            Nodes skip the HELLO handshake, sockets are opened by the first send
+        max_queued_bytes : int, optional
+            Budget of the send queue of each peer, in bytes, None for unbounded.
+            Messages are handed to zmq only while the peer's socket is below its
+            high water mark, the others wait in the queue
+        overflow : str, optional
+            What to do with a model that does not fit in the budget: "block" waits
+            for room, "coalesce" replaces the queued models of the same channel,
+            "drop" does not send it. Messages without "params" are always queued.
+            Only nodes that do not wait for every neighbor's model, such as
+            EL_Local_Timeout, can use "coalesce" and "drop"
+        send_hwm : int, optional
+            High water mark of the peer sockets, in messages, 0 for unlimited.
+            Defaults to 1 with a budget and 0 without one
+        recv_hwm : int, optional
+            High water mark of the router per peer, in messages, 0 for unlimited.
+            A bounded one lets slow receivers push back on their senders
 
         """
         super().__init__(rank, machine_id, mapping, total_procs)
@@ -86,24 +123,55 @@ class TCP(Communication):
         self.mapping = mapping
         self.offset = offset
         self.recv_timeout = recv_timeout
+        self.max_connections = max_connections
+        self.lazy_connect = lazy_connect
+        self.max_queued_bytes = max_queued_bytes
+        assert overflow in ["block", "coalesce", "drop"]
+        self.overflow = overflow
+        if send_hwm is None:
+            send_hwm = 0 if max_queued_bytes is None else 1
+        self.send_hwm = send_hwm
         self.uid = mapping.get_uid(rank, machine_id)
         self.identity = str(self.uid).encode()
         self.context = zmq.Context()
-        self.context.set(zmq.MAX_SOCKETS, 1000000)
+        self.context.set(
+            zmq.MAX_SOCKETS, max_connections + 16 if max_connections else 1000000
+        )
         self.router = self.context.socket(zmq.ROUTER)
         self.router.setsockopt(zmq.IDENTITY, self.identity)
-        self.router.setsockopt(zmq.RCVTIMEO, self.recv_timeout)
         self.router.setsockopt(zmq.ROUTER_MANDATORY, 1)
         self.router.setsockopt(zmq.SNDHWM, 0)
-        self.router.setsockopt(zmq.RCVHWM, 0)
+        self.router.setsockopt(zmq.RCVHWM, recv_hwm)
         # self.router.bind(self.addr(rank, machine_id))
         self.router.bind("tcp://*:{}".format(self.uid + self.offset + 1))
+        self.poller = zmq.Poller()
+        self.poller.register(self.router, zmq.POLLIN)
 
         self.total_data = 0
         self.total_meta = 0
 
         self.peer_deque = deque()
-        self.peer_sockets = dict()
+        # Least recently used first
+        self.peer_sockets = OrderedDict()
+        self.connections_opened = 0
+
+        # uid -> deque of (channel of a model or None, encoded message)
+        self.send_queues = dict()
+        self.send_queue_bytes = dict()
+        self.queued_bytes = 0
+        self.peak_queued_bytes = 0
+        self.coalesced_messages = 0
+        self.dropped_messages = 0
+        # Peer sockets registered in the poller until their queue is empty
+        self.writable = set()
+        # Messages received while waiting for room in a send queue
+        self.received = deque()
+
+        self.recorder = None
+        if record_dir:
+            self.recorder = PayloadRecorder(
+                record_dir, self.uid, int(record_limit), int(record_every)
+            )
 
         # sleep(2) # Sleep for socket creation everywhere
 
@@ -176,15 +244,27 @@ class TCP(Communication):
         logging.debug("Connecting to my neighbour: {}".format(neighbor))
         id = str(neighbor).encode()
         req = self.context.socket(zmq.DEALER)
-        req.setsockopt(zmq.IDENTITY, self.identity)
-        req.setsockopt(zmq.SNDHWM, 0)
+        req.setsockopt(zmq.SNDHWM, self.send_hwm)
         req.setsockopt(zmq.RCVHWM, 0)
         req.connect(self.addr(*self.mapping.get_machine_and_rank(neighbor)))
         self.peer_sockets[id] = req
+        self.connections_opened += 1
+
+        while self.max_connections and len(self.peer_sockets) > self.max_connections:
+            old_id, old_socket = self.peer_sockets.popitem(last=False)
+            logging.debug("Closing the connection to {}".format(old_id))
+            if old_socket in self.writable:
+                self.poller.unregister(old_socket)
+                self.writable.discard(old_socket)
+            # Messages still queued are delivered after the close
+            old_socket.close()
 
     def destroy_connection(self, neighbor, linger=None):
         id = str(neighbor).encode()
         if self.already_connected(neighbor):
+            if self.peer_sockets[id] in self.writable:
+                self.poller.unregister(self.peer_sockets[id])
+                self.writable.discard(self.peer_sockets[id])
             self.peer_sockets[id].close(linger=linger)
             del self.peer_sockets[id]
 
@@ -192,34 +272,209 @@ class TCP(Communication):
         id = str(neighbor).encode()
         return id in self.peer_sockets
 
-    def receive(self, block=True):
+    def receive(self, block=True, timeout=None):
         """
         Returns ONE message received.
+        Waits on a zmq.Poller, so an idle process does not use the CPU.
+        Queued messages are handed to zmq meanwhile.
+
+        Parameters
+        ----------
+        block : bool, optional
+            Wait for a message, otherwise return None right away if there is none
+        timeout : float, optional
+            Maximum number of seconds to wait, None to wait until a message arrives
+
+        Returns
+        ----------
+        tuple or None
+            (sender, received and decrypted data), None if no message arrived in time
+
+        """
+        if len(self.received) > 0:
+            return self.received.popleft()
+        if not block:
+            timeout = 0
+        deadline = None if timeout is None else perf_counter() + max(timeout, 0)
+        while True:
+            self.flush()
+            events = dict(
+                self.poller.poll(
+                    None
+                    if deadline is None
+                    else max(deadline - perf_counter(), 0) * 1000
+                )
+            )
+            if self.router in events:
+                # The sender is sent along, a peer may reconnect while its previous
+                # connection still delivers, so connections have their own identities
+                _, sender, recv = self.router.recv_multipart()
+                return self.decrypt(sender, recv)
+            if len(events) == 0 or (
+                deadline is not None and perf_counter() >= deadline
+            ):
+                return None
+
+    def peer_socket(self, uid):
+        """
+        Socket to a peer, connects on the first use or again after closing it.
+
+        Parameters
+        ----------
+        uid : int
+            Neighbor's unique ID
 
         Returns
+        -------
+        zmq.Socket
+            The DEALER socket
+
+        """
+        id = str(uid).encode()
+        if id not in self.peer_sockets:
+            self.init_connection(uid)
+        self.peer_sockets.move_to_end(id)
+        return self.peer_sockets[id]
+
+    def flush(self):
+        """
+        Hands the queued messages to zmq while the peer sockets have room.
+        Sockets with messages left are polled until they can take more.
+
+        """
+        for uid in list(self.send_queues):
+            queue = self.send_queues[uid]
+            socket = self.peer_socket(uid)
+            while len(queue) > 0:
+                try:
+                    socket.send_multipart([self.identity, queue[0][1]], zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                _, message = queue.popleft()
+                self.send_queue_bytes[uid] -= len(message)
+                self.queued_bytes -= len(message)
+                # Coalesced messages never reach zmq and are not counted
+                self.total_bytes += len(message)
+            if len(queue) == 0:
+                del self.send_queues[uid]
+                del self.send_queue_bytes[uid]
+                if socket in self.writable:
+                    self.poller.unregister(socket)
+                    self.writable.discard(socket)
+            elif socket not in self.writable:
+                self.poller.register(socket, zmq.POLLOUT)
+                self.writable.add(socket)
+
+    def has_room(self, uid):
+        """
+        Whether a peer keeps up: nothing waits in its send queue.
+
+        Parameters
         ----------
+        uid : int
+            Neighbor's unique ID
+
+        Returns
+        -------
+        bool
+            False if the peer did not take the previous messages yet
+
+        """
+        self.flush()
+        return self.send_queue_bytes.get(uid, 0) == 0
+
+    def queue_depths(self):
+        """
+        Messages waiting in the send queues, not counting the send_hwm messages
+        per peer that zmq already holds.
+
+        Returns
+        -------
         dict
-            Received and decrypted data
+            uid -> (number of messages, bytes)
 
-        Raises
-        ------
-        RuntimeError
-            If received HELLO
+        """
+        return {
+            uid: (len(queue), self.send_queue_bytes[uid])
+            for uid, queue in self.send_queues.items()
+        }
 
+    def enqueue(self, uid, data, to_send):
         """
-        while True:
-            try:
-                sender, recv = self.router.recv_multipart()
-                s, r = self.decrypt(sender, recv)
-                return s, r
-            except zmq.ZMQError as exc:
-                if exc.errno == zmq.EAGAIN:
-                    if not block:
-                        return None
-                    else:
-                        continue
-                else:
-                    raise
+        Queues an encoded message within the byte budget of the peer.
+
+        Parameters
+        ----------
+        uid : int
+            Neighbor's unique ID
+        data : dict or bytes
+            Message before encoding
+        to_send : bytes
+            Encoded message
+
+        Returns
+        -------
+        bool
+            False if the message was dropped
+
+        """
+        size = len(to_send)
+        channel = None
+        if isinstance(data, dict) and "params" in data:
+            channel = data["CHANNEL"]
+        self.flush()
+        queue = self.send_queues.get(uid, deque())
+        if channel is not None and self.send_queue_bytes.get(uid, 0) > 0:
+            if (
+                self.overflow == "coalesce"
+                and self.send_queue_bytes[uid] + size > self.max_queued_bytes
+            ):
+                # The older models of the channel are stale
+                for stale in [m for m in queue if m[0] == channel]:
+                    queue.remove(stale)
+                    self.send_queue_bytes[uid] -= len(stale[1])
+                    self.queued_bytes -= len(stale[1])
+                    self.coalesced_messages += 1
+            elif self.overflow == "block":
+                self.wait_for_room(uid, size)
+            if (
+                self.send_queue_bytes.get(uid, 0) > 0
+                and self.send_queue_bytes[uid] + size > self.max_queued_bytes
+            ):
+                logging.debug("Send queue to {} is full, dropping".format(uid))
+                self.dropped_messages += 1
+                return False
+        queue.append((channel, to_send))
+        self.send_queues[uid] = queue
+        self.send_queue_bytes[uid] = self.send_queue_bytes.get(uid, 0) + size
+        self.queued_bytes += size
+        self.peak_queued_bytes = max(self.peak_queued_bytes, self.queued_bytes)
+        self.flush()
+        return True
+
+    def wait_for_room(self, uid, size):
+        """
+        Waits until a message fits in the send queue of a peer. Messages
+        received meanwhile are kept for receive, so that two nodes waiting
+        for each other do not deadlock.
+
+        Parameters
+        ----------
+        uid : int
+            Neighbor's unique ID
+        size : int
+            Size of the message in bytes
+
+        """
+        while (
+            self.send_queue_bytes.get(uid, 0) > 0
+            and self.send_queue_bytes[uid] + size > self.max_queued_bytes
+        ):
+            events = dict(self.poller.poll())
+            if self.router in events:
+                _, sender, recv = self.router.recv_multipart()
+                self.received.append(self.decrypt(sender, recv))
+            self.flush()
 
     def send(self, uid, data, encrypt=True):
         """
@@ -232,15 +487,26 @@ class TCP(Communication):
         data : dict
             Message as a Python dictionary
 
+        Returns
+        -------
+        bool
+            False if the message was dropped because the peer's send queue is full.
+            Queued messages count in total_bytes once flush hands them to zmq
+
         """
 
         if encrypt:
+            if self.recorder:
+                self.recorder.record(uid, data)
             to_send = self.encrypt(data)
         else:
             to_send = data
         data_size = len(to_send)
-        self.total_bytes += data_size
-        id = str(uid).encode()
-        self.peer_sockets[id].send(to_send)
+        if self.max_queued_bytes is None:
+            self.peer_socket(uid).send_multipart([self.identity, to_send])
+            self.total_bytes += data_size
+        elif not self.enqueue(uid, data, to_send):
+            return False
         logging.debug("{} sent the message to {}.".format(self.uid, uid))
         logging.debug("Sent message size: {}".format(data_size))
+        return True
@@ -2,24 +2,31 @@ import json
 import logging
 import pickle
 import queue
+import random
 import socket
 from collections import deque
-from threading import Event, Lock, Thread
-from time import sleep
+from threading import Condition, Event, Thread
+from time import perf_counter
 
 import zmq
 
 from decentralizepy.communication.Communication import Communication
+from decentralizepy.communication.SendWindow import SendWindow
 
 HELLO = b"HELLO"
 BYE = b"BYE"
 RESEND_TIMEOUT = 0.5  # s
+MAX_RESEND_TIMEOUT = 4.0  # s
 RECV_TIMEOUT = 50  # ms
 
 
 class TCP(Communication):
     """
-    TCP Communication API
+    TCP Communication API with acknowledgements.
+    Every peer gets a sliding window of numbered messages (see SendWindow).
+    The receiver buffers messages that arrive out of order, acknowledges
+    cumulatively and selectively, and delivers every message exactly once,
+    in order.
 
     """
 
@@ -54,6 +61,12 @@ class TCP(Communication):
         addresses_filepath,
         offset=9000,
         recv_timeout=RECV_TIMEOUT,
+        window=32,
+        max_in_flight_bytes=64 * 1024 * 1024,
+        resend_timeout=RESEND_TIMEOUT,
+        max_resend_timeout=MAX_RESEND_TIMEOUT,
+        loss_rate=0.0,
+        loss_seed=None,
     ):
         """
         Constructor
@@ -70,10 +83,20 @@ class TCP(Communication):
             Total number of processes
         addresses_filepath : str
             JSON file with machine_id -> ip mapping
-        compression_package : str
-            Import path of a module that implements the compression.Compression.Compression class
-        compression_class : str
-            Name of the compression class inside the compression package
+        recv_timeout : int, optional
+            Milliseconds between two checks for termination by the receiver thread
+        window : int, optional
+            Maximum number of unacknowledged messages per peer
+        max_in_flight_bytes : int, optional
+            Maximum number of unacknowledged bytes per peer
+        resend_timeout : float, optional
+            Seconds before an unacknowledged message is sent again
+        max_resend_timeout : float, optional
+            Bound of the exponential backoff, in seconds
+        loss_rate : float, optional
+            Fraction of the outgoing frames dropped, to simulate a lossy network
+        loss_seed : int, optional
+            Seed of the simulated losses
 
         """
         super().__init__(rank, machine_id, mapping, total_procs)
@@ -87,85 +110,123 @@ class TCP(Communication):
         self.mapping = mapping
         self.offset = offset
         self.recv_timeout = recv_timeout
+        self.window = window
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.resend_timeout = resend_timeout
+        self.max_resend_timeout = max_resend_timeout
+        self.loss_rate = loss_rate
+        self.loss_rng = random.Random(loss_seed)
         self.uid = mapping.get_uid(rank, machine_id)
         self.identity = str(self.uid).encode()
         self.context = zmq.Context()
         self.context.set(zmq.MAX_SOCKETS, 1000000)
         self.router = self.context.socket(zmq.ROUTER)
         self.router.setsockopt(zmq.IDENTITY, self.identity)
-        self.router.setsockopt(zmq.RCVTIMEO, self.recv_timeout)
         self.router.setsockopt(zmq.ROUTER_MANDATORY, 1)
         self.router.bind(self.addr(rank, machine_id))
+        self.poller = zmq.Poller()
+        self.poller.register(self.router, zmq.POLLIN)
 
         self.total_data = 0
         self.total_meta = 0
+        self.resent_messages = 0
+        self.resent_bytes = 0
+        self.dropped_frames = 0
 
         self.peer_deque = deque()
         self.peer_sockets = dict()
 
         self.receiverQueue = queue.Queue()
-        self.mutex = Lock()
+        # Guards the DEALER sockets and the windows, wakes up the sender thread
+        self.mutex = Condition()
         self.senderThread = Thread(target=self.keep_sending, daemon=True)
         self.receiverThread = Thread(target=self.keep_receiving, daemon=True)
-        self.senderQueue = dict()
         self.terminateEvent = Event()
 
-        self.sent_IDs = dict()
-        self.received_IDs = dict()
+        # uid -> SendWindow
+        self.send_windows = dict()
+        # uid -> next sequence number to deliver
+        self.expected = dict()
+        # uid -> {sequence number: message received ahead}
+        self.out_of_order = dict()
 
         self.senderThread.start()
         self.receiverThread.start()
 
     def keep_sending(self):
-        while True:
-            if self.terminateEvent.is_set():
-                return
+        """
+        Sends again the unacknowledged messages of the peers whose deadline
+        passed. Sleeps until the next deadline.
 
-            self.mutex.acquire()
-            for key in self.senderQueue:
-                for _, m in self.senderQueue[key]:
-                    self.push_message(key, m)
-            self.mutex.release()
-            sleep(RESEND_TIMEOUT)
+        """
+        with self.mutex:
+            while not self.terminateEvent.is_set():
+                now = perf_counter()
+                deadlines = []
+                for uid, window in self.send_windows.items():
+                    self.resend(uid, window.expired(now))
+                    if window.deadline is not None:
+                        deadlines.append(window.deadline)
+                self.mutex.wait(min(deadlines) - now if deadlines else None)
 
     def keep_receiving(self):
-        while True:
-            if self.terminateEvent.is_set():
-                return
-
-            try:
-                sender, recv = self.router.recv_multipart()
-            except zmq.ZMQError as exc:
-                if exc.errno == zmq.EAGAIN:
-                    continue
-                else:
-                    raise
-
-            s, id, isAck, r = self.decrypt(sender, recv)
-            if isAck:
-                logging.debug("Received acknowledgement from {} id {}".format(s, id))
-                self.mutex.acquire()
-                self.senderQueue[s][:] = [
-                    tup for tup in self.senderQueue[s] if id != tup[0]
-                ]
-                # for i, v in enumerate(self.senderQueue[s]):
-                #     if id == v[0]:
-                #         del self.senderQueue[s][i]
-                #         break
-                self.mutex.release()
-            else:
-                logging.debug("Sending acknowledgement to {} id {}".format(s, id))
-                self.mutex.acquire()
-                self.push_message(s, self.encrypt({}, id, isAck=True))
-                self.mutex.release()
-                if s not in self.received_IDs:
-                    self.received_IDs[s] = set()
-                if id not in self.received_IDs[s]:
-                    logging.debug("Received {} from {}".format(id, s))
-                    self.received_IDs[s].add(id)
-                    self.receiverQueue.put((s, r))
+        """
+        Receives all the available frames, then sends one ack to every peer
+        that sent data.
+
+        """
+        while not self.terminateEvent.is_set():
+            # Wakes up every recv_timeout ms to check terminateEvent
+            if self.router not in dict(self.poller.poll(self.recv_timeout)):
+                continue
+            to_acknowledge = set()
+            while True:
+                try:
+                    sender, *frames = self.router.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                s, seq, isAck, r = self.decrypt(sender, frames)
+                if isAck:
+                    with self.mutex:
+                        window = self.send_windows.get(s, None)
+                        if window is None:
+                            continue
+                        if window.acknowledge(seq) > 0:
+                            self.push_ready(s)
+                            self.mutex.notify()
+                        self.resend(s, window.selective(r["received"]))
                 else:
-                    logging.debug("Duplicate {} from {}".format(id, s))
+                    self.deliver(s, seq, r)
+                    to_acknowledge.add(s)
+            with self.mutex:
+                for s in to_acknowledge:
+                    self.push_ack(s)
+
+    def deliver(self, sender, seq, data):
+        """
+        Delivers a message once and in order, buffers messages received ahead
+
+        Parameters
+        ----------
+        sender : int
+            uid of the sender
+        seq : int
+            Sequence number of the message
+        data : dict
+            Message
+
+        """
+        expected = self.expected.get(sender, 0)
+        buffered = self.out_of_order.setdefault(sender, dict())
+        if seq < expected or seq in buffered:
+            logging.debug("Duplicate {} from {}".format(seq, sender))
+            return
+        buffered[seq] = data
+        while expected in buffered:
+            logging.debug("Received {} from {}".format(expected, sender))
+            self.receiverQueue.put((sender, buffered.pop(expected)))
+            expected += 1
+        self.expected[sender] = expected
 
     def __del__(self):
         """
@@ -176,28 +237,34 @@ class TCP(Communication):
 
     def encrypt(self, data, id=0, isAck=False):
         """
-        Encode data as python pickle.
+        Encode data as python pickle. The params are pickled in a frame of
+        their own, so they are counted without pickling them twice.
 
         Parameters
         ----------
         data : dict
             Data dict to send
+        id : int
+            Sequence number of the message, or cumulative ack
+        isAck : bool
+            True for an acknowledgement
 
         Returns
         -------
-        byte
-            Encoded data
+        list
+            Encoded frames
 
         """
-        data_len = 0
+        params = None
         if "params" in data:
-            data_len = len(pickle.dumps(data["params"]))
-        output = pickle.dumps({"id": id, "isAck": isAck, "data": data})
-        self.total_meta += len(output) - data_len
-        self.total_data += data_len
-        return output
-
-    def decrypt(self, sender, data):
+            data = dict(data)
+            params = pickle.dumps(data.pop("params"))
+        frames = [pickle.dumps({"id": id, "isAck": isAck, "data": data})]
+        if params is not None:
+            frames.append(params)
+        return frames
+
+    def decrypt(self, sender, frames):
         """
         Decode received pickle data.
 
@@ -205,8 +272,8 @@ class TCP(Communication):
         ----------
         sender : byte
             sender of the data
-        data : byte
-            Data received
+        frames : list(byte)
+            Frames received
 
         Returns
         -------
@@ -215,8 +282,10 @@ class TCP(Communication):
 
         """
         sender = int(sender.decode())
-        data = pickle.loads(data)
+        data = pickle.loads(frames[0])
         id, isAck, data = data["id"], data["isAck"], data["data"]
+        if len(frames) > 1:
+            data["params"] = pickle.loads(frames[1])
         return sender, id, isAck, data
 
     def init_connection(self, neighbor):
@@ -234,66 +303,117 @@ class TCP(Communication):
         req = self.context.socket(zmq.DEALER)
         req.setsockopt(zmq.IDENTITY, self.identity)
         req.connect(self.addr(*self.mapping.get_machine_and_rank(neighbor)))
-        self.peer_sockets[id] = req
+        with self.mutex:
+            self.peer_sockets[id] = req
+            # Acks to this neighbor were dropped until now
+            if neighbor in self.expected:
+                self.push_ack(neighbor)
+            if neighbor in self.send_windows:
+                self.push_ready(neighbor)
 
     def destroy_connection(self, neighbor, linger=None):
         id = str(neighbor).encode()
-        if self.already_connected(neighbor):
-            self.peer_sockets[id].close(linger=linger)
-            del self.peer_sockets[id]
+        with self.mutex:
+            if self.already_connected(neighbor):
+                self.peer_sockets[id].close(linger=linger)
+                del self.peer_sockets[id]
 
     def already_connected(self, neighbor):
         id = str(neighbor).encode()
         return id in self.peer_sockets
 
-    def receive(self, block=True):
+    def receive(self, block=True, timeout=None):
         """
         Returns ONE message received.
 
+        Parameters
+        ----------
+        block : bool, optional
+            Wait for a message, otherwise return None right away if there is none
+        timeout : float, optional
+            Maximum number of seconds to wait, None to wait until a message arrives
+
         Returns
         -------
-        dict
-            Received and decrypted data
-
-        Raises
-        ------
-        RuntimeError
-            If received HELLO
+        tuple or None
+            (sender, received and decrypted data), None if no message arrived in time
 
         """
-        while True:
-            try:
-                return self.receiverQueue.get(block=True, timeout=self.recv_timeout)
-            except queue.Empty as _:
-                if not block:
-                    return None
-                else:
-                    continue
-
-    def push_message(self, uid, data):
+        try:
+            return self.receiverQueue.get(
+                block=block, timeout=None if timeout is None else max(timeout, 0)
+            )
+        except queue.Empty as _:
+            return None
+
+    def push_message(self, uid, frames):
         """
-        Send a message to a process.
+        Send frames to a process, unless the simulated network drops them.
+        The caller holds the mutex.
 
         Parameters
         ----------
         uid : int
             Neighbor's unique ID
-        data : dict
-            Message as a Python dictionary
+        frames : list(byte)
+            Encoded message
 
         """
         id = str(uid).encode()
-        if id in self.peer_sockets:
-            self.peer_sockets[id].send(data)
+        if self.loss_rate > 0 and self.loss_rng.random() < self.loss_rate:
+            self.dropped_frames += 1
+        elif id in self.peer_sockets:
+            self.peer_sockets[id].send_multipart(frames)
         else:
             logging.debug("Not sending message to {}: Initialize Connection".format(id))
 
-    def get_message_id(self, uid):
-        if uid not in self.sent_IDs:
-            self.sent_IDs[uid] = 0
-        m_id = self.sent_IDs[uid]
-        self.sent_IDs[uid] += 1
-        return m_id
+    def resend(self, uid, messages):
+        """
+        Sends messages in flight again. The caller holds the mutex.
+
+        Parameters
+        ----------
+        uid : int
+            Neighbor's unique ID
+        messages : list
+            (frames, size) from the SendWindow
+
+        """
+        for frames, size in messages:
+            logging.debug("Resending to {}".format(uid))
+            self.resent_messages += 1
+            self.resent_bytes += size
+            self.push_message(uid, frames)
+
+    def push_ready(self, uid):
+        """
+        Sends the queued messages that fit in the window of a peer.
+        The caller holds the mutex.
+
+        Parameters
+        ----------
+        uid : int
+            Neighbor's unique ID
+
+        """
+        for frames in self.send_windows[uid].ready():
+            self.push_message(uid, frames)
+
+    def push_ack(self, uid):
+        """
+        Sends the cumulative ack of a peer, with the sequence numbers
+        received out of order. The caller holds the mutex.
+
+        Parameters
+        ----------
+        uid : int
+            Neighbor's unique ID
+
+        """
+        received = list(self.out_of_order.get(uid, dict()))
+        self.push_message(
+            uid, self.encrypt({"received": received}, self.expected[uid], isAck=True)
+        )
 
     def send(self, uid, data, encrypt=True):
         """
@@ -308,29 +428,43 @@ class TCP(Communication):
 
         """
         assert encrypt
-        message_id = self.get_message_id(uid)
-        to_send = self.encrypt(data, message_id)
-
-        data_size = len(to_send)
+        # Pickled outside of the mutex, only the header depends on the sequence number
+        params = []
+        if "params" in data:
+            data = dict(data)
+            params = [pickle.dumps(data.pop("params"))]
+
+        with self.mutex:
+            if uid not in self.send_windows:
+                self.send_windows[uid] = SendWindow(
+                    self.window,
+                    self.max_in_flight_bytes,
+                    self.resend_timeout,
+                    self.max_resend_timeout,
+                )
+            window = self.send_windows[uid]
+            frames = self.encrypt(data, window.next_seq) + params
+            data_size = sum(len(f) for f in frames)
+            window.add(frames, data_size)
+            self.push_ready(uid)
+            self.mutex.notify()
+
+        params_size = len(params[0]) if params else 0
+        self.total_data += params_size
+        self.total_meta += data_size - params_size
         self.total_bytes += data_size
 
-        self.mutex.acquire()
-
-        if uid not in self.senderQueue:
-            self.senderQueue[uid] = []
-        self.senderQueue[uid].append((message_id, to_send))
-
-        self.push_message(uid, to_send)
-        self.mutex.release()
-
         logging.debug("{} sent the message to {}.".format(self.uid, uid))
         logging.debug("Sent message size: {}".format(data_size))
 
-    # def terminate(self):
-    #     """
-    #     Safely terminate the communication sockets.
+    def terminate(self):
+        """
+        Stops the sender and receiver threads. Messages not acknowledged yet
+        are not sent again.
 
-    #     """
-    #     self.terminateEvent.set()
-    #     self.senderThread.join()
-    #     self.receiverThread.join()
+        """
+        self.terminateEvent.set()
+        with self.mutex:
+            self.mutex.notify()
+        self.senderThread.join()
+        self.receiverThread.join()
@@ -2,8 +2,8 @@ import json
 import logging
 import pickle
 import socket
-from collections import deque
-from time import sleep
+from collections import OrderedDict, deque
+from time import perf_counter, sleep
 
 import zmq
 
@@ -50,6 +50,9 @@ class TCP(Communication):
         addresses_filepath,
         offset=9000,
         recv_timeout=50,
+        max_connections=None,
+        lazy_connect=False,
+        connect_timeout=10,
     ):
         """
         Constructor
@@ -70,6 +73,14 @@ class TCP(Communication):
             Import path of a module that implements the compression.Compression.Compression class
         compression_class : str
             Name of the compression class inside the compression package
+        max_connections : int, optional
+            Maximum number of outgoing connections, the least recently used are closed
+        lazy_connect : bool, optional
+            Nodes skip the HELLO handshake. A message goes over the connection
+            the peer opened to this process if there is one, otherwise a
+            connection is opened by the first send
+        connect_timeout : float, optional
+            Seconds to wait for a new connection before the first send fails
 
         """
         super().__init__(rank, machine_id, mapping, total_procs)
@@ -83,21 +94,27 @@ class TCP(Communication):
         self.mapping = mapping
         self.offset = offset
         self.recv_timeout = recv_timeout
+        self.max_connections = max_connections
+        self.lazy_connect = lazy_connect
+        self.connect_timeout = connect_timeout
         self.uid = mapping.get_uid(rank, machine_id)
         self.identity = str(self.uid).encode()
         self.context = zmq.Context()
         self.context.set(zmq.MAX_SOCKETS, 1000000)
         self.router = self.context.socket(zmq.ROUTER)
         self.router.setsockopt(zmq.IDENTITY, self.identity)
-        self.router.setsockopt(zmq.RCVTIMEO, self.recv_timeout)
         self.router.setsockopt(zmq.ROUTER_MANDATORY, 1)
         self.router.bind(self.addr(rank, machine_id))
+        self.poller = zmq.Poller()
+        self.poller.register(self.router, zmq.POLLIN)
 
         self.total_data = 0
         self.total_meta = 0
 
         self.peer_deque = deque()
-        self.peer_sockets = dict()
+        # Outgoing connections, least recently used first
+        self.peer_sockets = OrderedDict()
+        self.connections_opened = 0
 
         # sleep(2) # Sleep for socket creation everywhere
 
@@ -172,16 +189,24 @@ class TCP(Communication):
                     self.addr(*self.mapping.get_machine_and_rank(neighbor))
                 )
                 self.peer_sockets[id] = True
-                return
+                self.connections_opened += 1
+                break
             except zmq.ZMQError as e:
                 retries += 1
                 sleep(retry_wait)
+        else:
+            raise RuntimeError(
+                "Could not connect to neighbor {} after {} retries.".format(
+                    neighbor, max_retries
+                )
+            )
 
-        raise RuntimeError(
-            "Could not connect to neighbor {} after {} retries.".format(
-                neighbor, max_retries
+        while self.max_connections and len(self.peer_sockets) > self.max_connections:
+            old_id, _ = self.peer_sockets.popitem(last=False)
+            logging.debug("Closing the connection to {}".format(old_id))
+            self.router.disconnect(
+                self.addr(*self.mapping.get_machine_and_rank(int(old_id.decode())))
             )
-        )
 
     def destroy_connection(self, neighbor, linger=None):
         id = str(neighbor).encode()
@@ -195,34 +220,33 @@ class TCP(Communication):
         id = str(neighbor).encode()
         return id in self.peer_sockets
 
-    def receive(self, block=True):
+    def receive(self, block=True, timeout=None):
         """
         Returns ONE message received.
+        Waits on a zmq.Poller, so an idle process does not use the CPU.
 
-        Returns
+        Parameters
         ----------
-        dict
-            Received and decrypted data
+        block : bool, optional
+            Wait for a message, otherwise return None right away if there is none
+        timeout : float, optional
+            Maximum number of seconds to wait, None to wait until a message arrives
 
-        Raises
-        ------
-        RuntimeError
-            If received HELLO
+        Returns
+        ----------
+        tuple or None
+            (sender, received and decrypted data), None if no message arrived in time
 
         """
-        while True:
-            try:
-                sender, recv = self.router.recv_multipart()
-                s, r = self.decrypt(sender, recv)
-                return s, r
-            except zmq.ZMQError as exc:
-                if exc.errno == zmq.EAGAIN:
-                    if not block:
-                        return None
-                    else:
-                        continue
-                else:
-                    raise
+        if not block:
+            timeout = 0
+        events = dict(
+            self.poller.poll(None if timeout is None else max(timeout, 0) * 1000)
+        )
+        if self.router not in events:
+            return None
+        sender, recv = self.router.recv_multipart()
+        return self.decrypt(sender, recv)
 
     def send(self, uid, data, encrypt=True):
         """
@@ -244,6 +268,19 @@ class TCP(Communication):
         data_size = len(to_send)
         self.total_bytes += data_size
         id = str(uid).encode()
-        self.router.send_multipart([id, to_send])
+        if id in self.peer_sockets:
+            self.peer_sockets.move_to_end(id)
+        deadline = perf_counter() + self.connect_timeout
+        while True:
+            try:
+                self.router.send_multipart([id, to_send])
+                break
+            except zmq.ZMQError as exc:
+                # Not routable until a connection in either direction is up
+                if exc.errno != zmq.EHOSTUNREACH or perf_counter() > deadline:
+                    raise
+                if not self.already_connected(uid):
+                    self.init_connection(uid)
+                sleep(0.001)
         logging.debug("{} sent the message to {}.".format(self.uid, uid))
         logging.debug("Sent message size: {}".format(data_size))
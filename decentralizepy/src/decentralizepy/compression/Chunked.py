@@ -0,0 +1,308 @@
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from decentralizepy.compression.Compression import Compression
+
+
+class Chunked(Compression):
+    """
+    Block-wise compression of large arrays in a thread pool.
+    Arrays are split into blocks of block_size elements which are compressed
+    independently, so codecs that release the GIL run in parallel. The output
+    starts with a block table (BLOCK_DTYPE) so the receiver can decompress the
+    blocks in parallel or one after the other as they arrive.
+    Blocks that do not shrink are stored raw. When a whole array compresses
+    worse than min_ratio, the next probe_interval arrays of the same kind are
+    stored raw without trying.
+    Subclasses choose the codec by overriding compress_block and decompress_block,
+    this class uses zlib.
+
+    """
+
+    HEADER_DTYPE = np.dtype([("num_blocks", "<i8"), ("dtype", "<i8")])
+    BLOCK_DTYPE = np.dtype([("count", "<i8"), ("nbytes", "<i8"), ("raw", "<i8")])
+    DTYPES = [np.float32, np.float64, np.int32, np.int64]
+
+    def __init__(
+        self,
+        block_size=2**18,
+        num_threads=None,
+        min_ratio=0.9,
+        probe_interval=10,
+        *args,
+        **kwargs
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        block_size : int, optional
+            Number of elements per block
+        num_threads : int, optional
+            Size of the thread pool, defaults to torch.get_num_threads() when the
+            pool is first needed, which the nodes set to threads_per_proc
+        min_ratio : float, optional
+            Compressed arrays larger than min_ratio times the raw size are poorly compressible
+        probe_interval : int, optional
+            Number of arrays stored raw after a poorly compressible one
+
+        """
+        self.block_size = block_size
+        self.num_threads = num_threads
+        self.min_ratio = min_ratio
+        self.probe_interval = probe_interval
+        # kind -> number of arrays left to store raw
+        self.skip = {"float": 0, "index": 0}
+        self.pool = None
+
+    def map(self, function, iterable):
+        """
+        Maps over the thread pool, or inline when there is nothing to parallelize
+
+        """
+        items = list(iterable)
+        if self.num_threads is None:
+            self.num_threads = torch.get_num_threads()
+        if len(items) <= 1 or self.num_threads <= 1:
+            return [function(item) for item in items]
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.num_threads)
+        return list(self.pool.map(function, items))
+
+    def compress_block(self, block):
+        """
+        Compresses one block
+
+        Parameters
+        ----------
+        block : np.ndarray
+            Contiguous block of the array
+
+        Returns
+        -------
+        bytes
+            Compressed block
+
+        """
+        return zlib.compress(block.tobytes(), 1)
+
+    def decompress_block(self, data, dtype, count):
+        """
+        Decompresses one block
+
+        Parameters
+        ----------
+        data : bytes
+            Compressed block
+        dtype : np.dtype
+            Type of the elements
+        count : int
+            Number of elements
+
+        Returns
+        -------
+        np.ndarray
+            The block
+
+        """
+        return np.frombuffer(zlib.decompress(data), dtype=dtype, count=count)
+
+    def compress_array(self, arr, kind):
+        """
+        Compresses an array into a block table followed by the blocks
+
+        Parameters
+        ----------
+        arr : np.ndarray
+            1-D array of one of DTYPES
+        kind : str
+            "float" or "index", arrays of a kind share the adaptive skipping
+
+        Returns
+        -------
+        bytes
+            Compressed array
+
+        """
+        arr = np.ascontiguousarray(arr).reshape(-1)
+        blocks = [
+            arr[start : start + self.block_size]
+            for start in range(0, len(arr), self.block_size)
+        ]
+        if self.skip[kind] > 0:
+            self.skip[kind] -= 1
+            compressed = [None] * len(blocks)
+        else:
+            compressed = self.map(self.compress_block, blocks)
+            ratio = sum(len(c) for c in compressed) / max(arr.nbytes, 1)
+            if ratio > self.min_ratio:
+                logging.debug(
+                    "Compression ratio {:.2f} of {} arrays is poor, storing the next {} raw".format(
+                        ratio, kind, self.probe_interval
+                    )
+                )
+                self.skip[kind] = self.probe_interval
+
+        header = np.array(
+            [(len(blocks), self.DTYPES.index(arr.dtype.type))], dtype=self.HEADER_DTYPE
+        )
+        table = np.zeros(len(blocks), dtype=self.BLOCK_DTYPE)
+        payloads = []
+        for i, (block, c) in enumerate(zip(blocks, compressed)):
+            if c is None or len(c) >= block.nbytes:
+                c = block.tobytes()
+                table[i]["raw"] = 1
+            table[i]["count"] = len(block)
+            table[i]["nbytes"] = len(c)
+            payloads.append(c)
+        return b"".join([header.tobytes(), table.tobytes()] + payloads)
+
+    def read_table(self, bytes):
+        """
+        Reads the block table of a compressed array
+
+        Parameters
+        ----------
+        bytes : bytes
+            Compressed array
+
+        Returns
+        -------
+        tuple
+            (dtype, block table, offsets of the blocks)
+
+        """
+        header = np.frombuffer(bytes, dtype=self.HEADER_DTYPE, count=1)[0]
+        num_blocks = int(header["num_blocks"])
+        table = np.frombuffer(
+            bytes,
+            dtype=self.BLOCK_DTYPE,
+            count=num_blocks,
+            offset=self.HEADER_DTYPE.itemsize,
+        )
+        start = self.HEADER_DTYPE.itemsize + table.nbytes
+        offsets = start + np.cumsum(table["nbytes"]) - table["nbytes"]
+        return np.dtype(self.DTYPES[int(header["dtype"])]), table, offsets
+
+    def decode_block(self, bytes, dtype, entry, offset):
+        data = memoryview(bytes)[offset : offset + int(entry["nbytes"])]
+        if entry["raw"]:
+            return np.frombuffer(data, dtype=dtype, count=int(entry["count"]))
+        return self.decompress_block(data, dtype, int(entry["count"]))
+
+    def decompress_blocks(self, bytes):
+        """
+        Generator of the decompressed blocks in order
+
+        Parameters
+        ----------
+        bytes : bytes
+            Compressed array
+
+        Yields
+        ------
+        np.ndarray
+            Block of the array
+
+        """
+        dtype, table, offsets = self.read_table(bytes)
+        for entry, offset in zip(table, offsets):
+            yield self.decode_block(bytes, dtype, entry, offset)
+
+    def decompress_array(self, bytes):
+        """
+        Decompresses all the blocks in parallel
+
+        Parameters
+        ----------
+        bytes : bytes
+            Compressed array
+
+        Returns
+        -------
+        np.ndarray
+            The array
+
+        """
+        dtype, table, offsets = self.read_table(bytes)
+        blocks = self.map(
+            lambda i: self.decode_block(bytes, dtype, table[i], offsets[i]),
+            range(len(table)),
+        )
+        if len(blocks) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.concatenate(blocks)
+
+    def compress(self, arr):
+        """
+        compression function
+
+        Parameters
+        ----------
+        arr : np.ndarray
+            Data to compress
+
+        Returns
+        -------
+        bytes
+            encoded data as bytes
+
+        """
+        diff = np.diff(np.sort(arr), prepend=0).astype(np.int32)
+        return self.compress_array(diff, "index")
+
+    def decompress(self, bytes):
+        """
+        decompression function
+
+        Parameters
+        ----------
+        bytes : bytes
+            compressed data
+
+        Returns
+        -------
+        arr : np.ndarray
+            decompressed data as array
+
+        """
+        return np.cumsum(self.decompress_array(bytes), dtype=np.int64).astype(np.int32)
+
+    def compress_float(self, arr):
+        """
+        compression function for float arrays
+
+        Parameters
+        ----------
+        arr : np.ndarray
+            Data to compress
+
+        Returns
+        -------
+        bytes
+            encoded data as bytes
+
+        """
+        return self.compress_array(arr, "float")
+
+    def decompress_float(self, bytes):
+        """
+        decompression function for compressed float arrays
+
+        Parameters
+        ----------
+        bytes : bytes
+            compressed data
+
+        Returns
+        -------
+        arr : np.ndarray
+            decompressed data as array
+
+        """
+        return self.decompress_array(bytes)
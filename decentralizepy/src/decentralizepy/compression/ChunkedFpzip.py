@@ -0,0 +1,22 @@
+import fpzip
+import numpy as np
+
+from decentralizepy.compression.Chunked import Chunked
+
+
+class ChunkedFpzip(Chunked):
+    """
+    Chunked lossless compression of float blocks with fpzip.
+    Index blocks are not floats and use the zlib codec of Chunked.
+
+    """
+
+    def compress_block(self, block):
+        if not np.issubdtype(block.dtype, np.floating):
+            return super().compress_block(block)
+        return fpzip.compress(block, precision=0, order="C")
+
+    def decompress_block(self, data, dtype, count):
+        if not np.issubdtype(dtype, np.floating):
+            return super().decompress_block(data, dtype, count)
+        return fpzip.decompress(bytes(data), order="C").reshape(-1)
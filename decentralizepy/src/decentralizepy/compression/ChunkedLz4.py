@@ -0,0 +1,17 @@
+import lz4.frame
+import numpy as np
+
+from decentralizepy.compression.Chunked import Chunked
+
+
+class ChunkedLz4(Chunked):
+    """
+    Chunked compression with lz4 frames, which release the GIL
+
+    """
+
+    def compress_block(self, block):
+        return lz4.frame.compress(block.tobytes())
+
+    def decompress_block(self, data, dtype, count):
+        return np.frombuffer(lz4.frame.decompress(data), dtype=dtype, count=count)
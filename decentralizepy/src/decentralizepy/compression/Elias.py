@@ -32,7 +32,7 @@ class Elias(Compression):
             encoded data as bytes
 
         """
-        arr.sort()
+        arr = np.sort(arr)
         first = arr[0]
         arr = np.diff(arr).astype(np.int32)
         arr = arr.view(f"u{arr.itemsize}")
@@ -0,0 +1,202 @@
+import numpy as np
+
+from decentralizepy.compression.Compression import Compression
+
+
+class EliasGamma(Compression):
+    """
+    Elias-gamma coding of the gaps between sorted indices.
+    The unary length prefixes and the binary payloads of the codewords are
+    stored in two separate bitstreams. Decoding is then fully vectorized: the
+    lengths are the distances between the ones of the unary stream and the
+    payload offsets are their prefix sums. Large index sets are coded in
+    chunks, which can be streamed and decoded one after the other.
+
+    """
+
+    def __init__(self, chunk_size=2**20, *args, **kwargs):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        chunk_size : int, optional
+            Number of indices coded per chunk
+
+        """
+        super().__init__()
+        self.chunk_size = chunk_size
+
+    def encode_chunk(self, gaps):
+        """
+        Encodes positive integers
+
+        Parameters
+        ----------
+        gaps : np.ndarray
+            Positive integers to encode
+
+        Returns
+        -------
+        bytes
+            Encoded chunk
+
+        """
+        gaps = gaps.astype(np.int64)
+        # Number of bits after the leading one, exact for all int64
+        lengths = np.log2(gaps).astype(np.int64)
+        lengths -= (np.left_shift(1, lengths) > gaps).astype(np.int64)
+        lengths += (np.left_shift(1, lengths + 1) <= gaps).astype(np.int64)
+
+        # Unary stream: `length` zeros followed by a one for every gap
+        unary = np.zeros(int(lengths.sum()) + len(gaps), dtype=np.uint8)
+        unary[np.cumsum(lengths + 1) - 1] = 1
+
+        # Payload stream: the bits after the leading one, most significant first
+        num_payload_bits = int(lengths.sum())
+        owner = np.repeat(np.arange(len(gaps)), lengths)
+        offsets = np.cumsum(lengths) - lengths
+        position = np.arange(num_payload_bits) - offsets[owner]
+        payload = (
+            np.right_shift(gaps[owner], lengths[owner] - 1 - position) & 1
+        ).astype(np.uint8)
+
+        header = np.array([len(gaps), len(unary), num_payload_bits], dtype=np.int64)
+        return b"".join(
+            [
+                header.tobytes(),
+                np.packbits(unary).tobytes(),
+                np.packbits(payload).tobytes(),
+            ]
+        )
+
+    def decode_chunk(self, buffer, start=0):
+        """
+        Decodes a chunk
+
+        Parameters
+        ----------
+        buffer : bytes
+            Compressed data
+        start : int, optional
+            Offset of the chunk in the buffer
+
+        Returns
+        -------
+        tuple
+            (decoded positive integers, offset of the next chunk)
+
+        """
+        n, num_unary_bits, num_payload_bits = np.frombuffer(
+            buffer, dtype=np.int64, count=3, offset=start
+        )
+        start += 24
+        unary_bytes = (int(num_unary_bits) + 7) // 8
+        payload_bytes = (int(num_payload_bits) + 7) // 8
+        unary = np.unpackbits(
+            np.frombuffer(buffer, dtype=np.uint8, count=unary_bytes, offset=start),
+            count=int(num_unary_bits),
+        )
+        start += unary_bytes
+        payload = np.unpackbits(
+            np.frombuffer(buffer, dtype=np.uint8, count=payload_bytes, offset=start),
+            count=int(num_payload_bits),
+        )
+        start += payload_bytes
+
+        # Leading zero counts are the gaps between the ones of the unary stream
+        lengths = np.diff(np.flatnonzero(unary), prepend=-1) - 1
+        ends = np.cumsum(lengths)
+        owner = np.repeat(np.arange(n), lengths)
+        position = np.arange(int(num_payload_bits)) - (ends - lengths)[owner]
+        weighted = np.left_shift(
+            payload.astype(np.int64), lengths[owner] - 1 - position
+        )
+        prefix = np.concatenate(([0], np.cumsum(weighted)))
+        gaps = np.left_shift(1, lengths) + prefix[ends] - prefix[ends - lengths]
+        return gaps, start
+
+    def compress_chunks(self, arr):
+        """
+        Generator of the encoded chunks of an index array.
+        The input is not modified.
+
+        Parameters
+        ----------
+        arr : np.ndarray
+            Unique non-negative indices
+
+        Yields
+        ------
+        bytes
+            Encoded chunk
+
+        """
+        arr = np.sort(np.asarray(arr, dtype=np.int64), kind="stable")
+        previous = -1
+        for start in range(0, len(arr), self.chunk_size):
+            chunk = arr[start : start + self.chunk_size]
+            yield self.encode_chunk(np.diff(chunk, prepend=previous))
+            previous = chunk[-1]
+
+    def decompress_chunks(self, bytes):
+        """
+        Generator of the decoded chunks of compressed indices
+
+        Parameters
+        ----------
+        bytes : bytes
+            compressed data
+
+        Yields
+        ------
+        np.ndarray
+            Sorted indices of the chunk
+
+        """
+        num_chunks = np.frombuffer(bytes, dtype=np.int64, count=1)[0]
+        start = 8
+        previous = -1
+        for _ in range(num_chunks):
+            gaps, start = self.decode_chunk(bytes, start)
+            chunk = previous + np.cumsum(gaps)
+            previous = chunk[-1]
+            yield chunk
+
+    def compress(self, arr):
+        """
+        compression function
+
+        Parameters
+        ----------
+        arr : np.ndarray
+            Data to compress
+
+        Returns
+        -------
+        bytes
+            encoded data as bytes
+
+        """
+        chunks = list(self.compress_chunks(arr))
+        return np.array([len(chunks)], dtype=np.int64).tobytes() + b"".join(chunks)
+
+    def decompress(self, bytes):
+        """
+        decompression function
+
+        Parameters
+        ----------
+        bytes : bytes
+            compressed data
+
+        Returns
+        -------
+        arr : np.ndarray
+            decompressed data as array
+
+        """
+        chunks = list(self.decompress_chunks(bytes))
+        if len(chunks) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(chunks)
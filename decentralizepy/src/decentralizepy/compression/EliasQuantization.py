@@ -8,7 +8,13 @@ class EliasQuantization(Elias, Quantization):
 
     """
 
-    def __init__(self, float_precision: int = 2**15 - 1, *args, **kwargs):
+    def __init__(
+        self,
+        float_precision: int = 2**15 - 1,
+        stochastic_rounding: bool = False,
+        *args,
+        **kwargs
+    ):
         """
         Constructor
 
@@ -16,6 +22,9 @@ class EliasQuantization(Elias, Quantization):
         ----------
         float_precision : int, optional
             Quantization parameter
+        stochastic_rounding : bool, optional
+            Round up with probability equal to the fractional part instead of to nearest
         """
         super().__init__(float_precision=float_precision, *args, **kwargs)
         self.k = float_precision
+        self.stochastic_rounding = stochastic_rounding
@@ -13,7 +13,13 @@ class Quantization(Compression):
 
     """
 
-    def __init__(self, float_precision: int = 2**15 - 1, *args, **kwargs):
+    def __init__(
+        self,
+        float_precision: int = 2**15 - 1,
+        stochastic_rounding: bool = False,
+        *args,
+        **kwargs
+    ):
         """
         Constructor
 
@@ -21,9 +27,13 @@ class Quantization(Compression):
         ----------
         float_precision : int, optional
             Quantization parameter
+        stochastic_rounding : bool, optional
+            Round up with probability equal to the fractional part instead of to nearest
         """
         super().__init__(*args, **kwargs)
         self.k = float_precision
+        self.stochastic_rounding = stochastic_rounding
+        self.rng = np.random.default_rng()
 
     def compress_float(self, x):
         """
@@ -48,7 +58,11 @@ class Quantization(Compression):
         # Normalize x to [-k, k]
         norm_factor = np.max(np.abs(x)) / self.k
         x = x / norm_factor
-        x = x.round().astype(np.int32)
+        if self.stochastic_rounding:
+            x = np.floor(x + self.rng.random(x.shape, dtype=np.float32))
+        else:
+            x = x.round()
+        x = x.astype(np.int32)
 
         # Get the maximum absolute value from the input array
         max_abs = np.max(np.abs(x))
@@ -68,15 +82,9 @@ class Quantization(Compression):
 
         x = np.asarray(x, dtype=np.uint32)
 
-        # Create a numpy array of shape (x.shape, num_bits) and fill it with zeros
-        bit_rep = np.zeros((x.shape[0], num_bits), dtype=np.uint8)
-
-        # Iterate over x and convert each number to binary
-        for i in range(len(x)):
-            str_bit = np.binary_repr(x[i], width=num_bits)
-            array_bit = np.array(list(str_bit), dtype=np.uint8)
-            indices_with_1 = np.where(array_bit == 1)[0]
-            bit_rep[i][indices_with_1] = 1
+        # Bits of each number in a row of shape (x.shape, num_bits), most significant first
+        shifts = np.arange(num_bits - 1, -1, -1, dtype=np.uint32)
+        bit_rep = ((x[:, None] >> shifts) & 1).astype(np.uint8)
 
         bit_rep = bit_rep.reshape(-1)
 
@@ -117,14 +125,9 @@ class Quantization(Compression):
         received_x = np.unpackbits(rest_of_x, bitorder="little", count=padding)
         received_x = received_x.reshape((-1, num_bits)).astype(np.uint8)
 
-        # Initialize an unit8 array with the same number of rows as received_x
-        output = np.zeros(received_x.shape[0], dtype=np.int32)
-
-        # Convert each row into an integer
-        for i in range(received_x.shape[0]):
-            output[i] = (
-                int("".join(received_x[i].astype(str)), 2) - (2 ** (num_bits - 1)) + 1
-            )
+        # Convert each row into an integer, the first bit is the most significant
+        powers = np.left_shift(1, np.arange(num_bits - 1, -1, -1, dtype=np.int64))
+        output = received_x @ powers - (2 ** (num_bits - 1)) + 1
 
         # Denormalize the output
         output = output * scale_factor
@@ -0,0 +1,349 @@
+import networkx as nx
+import numpy as np
+
+from decentralizepy.graphs.Graph import Graph
+
+
+class CSRGraph(Graph):
+    """
+    Graph topology stored as a compressed sparse row adjacency: the neighbors
+    of node i are indices[indptr[i] : indptr[i + 1]], sorted by uid.
+    Besides the edges and adjacency text formats, graphs can be written to a
+    binary file (HEADER_DTYPE followed by indptr and indices as int32) that
+    every process memory-maps instead of parsing its own copy.
+
+    """
+
+    HEADER_DTYPE = np.dtype([("magic", "S8"), ("n_procs", "<i8"), ("nnz", "<i8")])
+    MAGIC = b"DPYCSR1"
+
+    def __init__(self, n_procs=None, indptr=None, indices=None):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        n_procs : int, optional
+            Number of processes in the graph, if already known
+        indptr : np.ndarray, optional
+            CSR row pointers, defaults to a graph without edges
+        indices : np.ndarray, optional
+            CSR column indices
+
+        """
+        if n_procs != None:
+            self.n_procs = n_procs
+            if indptr is None:
+                indptr = np.zeros(n_procs + 1, dtype=np.int32)
+                indices = np.zeros(0, dtype=np.int32)
+            self.indptr = indptr
+            self.indices = indices
+
+    def set_directed_edges(self, sources, destinations):
+        """
+        Replaces the adjacency by the directed edges sources[i] -> destinations[i].
+        Duplicate edges are merged.
+
+        Parameters
+        ----------
+        sources : np.ndarray
+            Sources of the edges
+        destinations : np.ndarray
+            Destinations of the edges
+
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        destinations = np.asarray(destinations, dtype=np.int64)
+        keys = np.unique(sources * self.n_procs + destinations)
+        self.indptr = np.zeros(self.n_procs + 1, dtype=np.int32)
+        np.cumsum(
+            np.bincount(keys // self.n_procs, minlength=self.n_procs),
+            out=self.indptr[1:],
+        )
+        self.indices = (keys % self.n_procs).astype(np.int32)
+
+    def set_edges(self, u, v):
+        """
+        Replaces the adjacency by the undirected edges u[i] - v[i].
+        Duplicate edges are merged.
+
+        Parameters
+        ----------
+        u : np.ndarray
+            First endpoints of the edges
+        v : np.ndarray
+            Second endpoints of the edges
+
+        """
+        self.set_directed_edges(np.concatenate([u, v]), np.concatenate([v, u]))
+
+    def __insert_adj__(self, node, neighbours):
+        """
+        Inserts `neighbours` into the adjacency list of `node`.
+        Rebuilds the arrays, so insert many edges at once with set_edges.
+
+        Parameters
+        ----------
+        node : int
+            The vertex in question
+        neighbours : list(int)
+            A list of neighbours of the `node`
+
+        """
+        neighbours = np.fromiter(neighbours, dtype=np.int64)
+        sources, destinations = self.edges()
+        self.set_directed_edges(
+            np.concatenate([sources, np.full(len(neighbours), node)]),
+            np.concatenate([destinations, neighbours]),
+        )
+
+    def __insert_edge__(self, x, y):
+        """
+        Inserts edge `x -> y` into the graph, in both directions.
+        Rebuilds the arrays, so insert many edges at once with set_edges.
+
+        Parameters
+        ----------
+        x : int
+            The source vertex
+        y : int
+            The destination vertex
+
+        """
+        sources, destinations = self.edges()
+        self.set_directed_edges(
+            np.concatenate([sources, [x, y]]), np.concatenate([destinations, [y, x]])
+        )
+
+    def edges(self):
+        """
+        Directed edges of the adjacency, both directions of every edge
+
+        Returns
+        -------
+        tuple
+            (sources, destinations) as np.ndarray
+
+        """
+        return np.repeat(np.arange(self.n_procs), self.degrees()), self.indices
+
+    @property
+    def adj_list(self):
+        """
+        Copy of the adjacency as sets, edit the graph with the insert methods
+
+        """
+        return [set(self.neighbors(uid).tolist()) for uid in range(self.n_procs)]
+
+    def read_graph_from_file(self, file, type="edges", force_connect=False):
+        """
+        Reads the graph from a given file
+
+        Parameters
+        ----------
+        file : str
+            path to the file
+        type : str
+            `edges`, `adjacency` or `binary`. Binary files are memory-mapped
+        force_connect : bool, optional
+            Should the graph be force-connected using a ring
+
+        Returns
+        -------
+        int
+            Number of processes
+
+        Raises
+        ------
+        ValueError
+            If the type is not one of `edges`, `adjacency` or `binary`
+
+        """
+        if type == "binary":
+            header = np.fromfile(file, dtype=self.HEADER_DTYPE, count=1)[0]
+            assert header["magic"] == self.MAGIC, "{} is not a CSR graph".format(file)
+            self.n_procs = int(header["n_procs"])
+            self.indptr = np.memmap(
+                file,
+                dtype="<i4",
+                mode="r",
+                offset=self.HEADER_DTYPE.itemsize,
+                shape=(self.n_procs + 1,),
+            )
+            self.indices = np.memmap(
+                file,
+                dtype="<i4",
+                mode="r",
+                offset=self.HEADER_DTYPE.itemsize + self.indptr.nbytes,
+                shape=(int(header["nnz"]),),
+            )
+        elif type == "edges":
+            with open(file, "r") as inf:
+                self.n_procs = int(inf.readline().strip())
+                edges = np.loadtxt(inf, dtype=np.int64, ndmin=2)
+            self.set_edges(edges[:, 0], edges[:, 1])
+        elif type == "adjacency":
+            with open(file, "r") as inf:
+                self.n_procs = int(inf.readline().strip())
+                rows = [np.array(line.split(), dtype=np.int64) for line in inf]
+            self.set_edges(
+                np.repeat(np.arange(len(rows)), [len(r) for r in rows]),
+                np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64),
+            )
+        else:
+            raise ValueError("type must be from {edges, adjacency, binary}!")
+
+        if force_connect:
+            self.connect_graph()
+
+        return self.n_procs
+
+    def write_graph_to_file(self, file, type="edges"):
+        """
+        Writes graph to file
+
+        Parameters
+        ----------
+        file : str
+            File path
+        type : str
+            One of {"edges", "adjacency", "binary"}. Writes the corresponding format.
+
+        """
+        if type == "binary":
+            header = np.array(
+                [(self.MAGIC, self.n_procs, len(self.indices))], dtype=self.HEADER_DTYPE
+            )
+            with open(file, "wb") as of:
+                of.write(header.tobytes())
+                of.write(np.asarray(self.indptr, dtype="<i4").tobytes())
+                of.write(np.asarray(self.indices, dtype="<i4").tobytes())
+            return
+        with open(file, "w") as of:
+            of.write(str(self.n_procs) + "\n")
+            if type == "edges":
+                np.savetxt(of, np.stack(self.edges(), axis=1), fmt="%d")
+            elif type == "adjacency":
+                for uid in range(self.n_procs):
+                    of.write(" ".join(map(str, self.neighbors(uid).tolist())) + "\n")
+            else:
+                raise ValueError("type must be from {edges, adjacency, binary}!")
+
+    def connect_graph(self):
+        """
+        Connects the graph using a Ring
+
+        """
+        sources, destinations = self.edges()
+        ring = np.arange(self.n_procs)
+        self.set_edges(
+            np.concatenate([sources, ring]),
+            np.concatenate([destinations, (ring + 1) % self.n_procs]),
+        )
+
+    def neighbors(self, uid):
+        """
+        Gives the neighbors of a node
+
+        Parameters
+        ----------
+        uid : int
+            globally unique identifier of the node
+
+        Returns
+        -------
+        np.ndarray
+            a view of the sorted neighbours
+
+        """
+        return self.indices[self.indptr[uid] : self.indptr[uid + 1]]
+
+    def degrees(self):
+        """
+        Degrees of all the nodes
+
+        Returns
+        -------
+        np.ndarray
+            Number of neighbors of every node
+
+        """
+        return np.diff(self.indptr)
+
+    def metropolis_hastings_weights(self):
+        """
+        Metropolis-Hastings averaging weights, 1 / (max(degree_i, degree_j) + 1)
+        for every edge and the rest of the mass on the node itself
+
+        Returns
+        -------
+        tuple
+            (weights aligned with indices, self weights) as np.ndarray
+
+        """
+        degrees = self.degrees()
+        sources = np.repeat(np.arange(self.n_procs), degrees)
+        weights = 1.0 / (np.maximum(degrees[sources], degrees[self.indices]) + 1)
+        self_weights = 1.0 - np.bincount(
+            sources, weights=weights, minlength=self.n_procs
+        )
+        return weights, self_weights
+
+    def components(self):
+        """
+        Connected components by label propagation with pointer jumping
+
+        Returns
+        -------
+        np.ndarray
+            Smallest uid of the component of every node
+
+        """
+        labels = np.arange(self.n_procs)
+        has_neighbors = self.degrees() > 0
+        starts = self.indptr[:-1][has_neighbors]
+        while True:
+            new_labels = labels.copy()
+            if len(starts) > 0:
+                new_labels[has_neighbors] = np.minimum(
+                    labels[has_neighbors],
+                    np.minimum.reduceat(labels[self.indices], starts),
+                )
+            # Labels only decrease, so following them to their own label is safe
+            new_labels = new_labels[new_labels]
+            if np.array_equal(new_labels, labels):
+                return labels
+            labels = new_labels
+
+    def is_connected(self):
+        """
+        Checks that the graph has a single connected component
+
+        Returns
+        -------
+        bool
+            True if connected
+
+        """
+        return self.n_procs == 0 or self.components().max() == 0
+
+    def centr(self):
+        """
+        Averaging weights inversely proportional to the betweenness centrality
+        of the destination, the same in every row
+
+        Returns
+        -------
+        np.ndarray
+            [n_procs, n_procs] averaging weights
+
+        """
+        nxGraph = nx.Graph()
+        nxGraph.add_nodes_from(range(self.n_procs))
+        nxGraph.add_edges_from(zip(*(e.tolist() for e in self.edges())))
+        centrality = nx.betweenness_centrality(nxGraph)
+        inverse = 1.0 / (
+            np.array([centrality[i] for i in range(self.n_procs)], dtype=float) + 0.01
+        )
+        self.averaging_weights = np.tile(inverse / inverse.sum(), (self.n_procs, 1))
+        return self.averaging_weights
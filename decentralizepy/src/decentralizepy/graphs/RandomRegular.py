@@ -0,0 +1,134 @@
+import logging
+
+import numpy as np
+
+from decentralizepy.graphs.CSRGraph import CSRGraph
+
+
+def pairing(n_procs, degree, rng):
+    """
+    Random simple regular graph with the pairing model.
+    All the stubs are paired at once. The stubs of the self-loops and
+    multi-edges are then re-paired together with the stubs of as many random
+    edges, until every edge is simple. Only the re-paired edges are checked
+    against the sorted keys of the others, so a repair round is cheap.
+
+    Parameters
+    ----------
+    n_procs : int
+        total number of nodes in the graph
+    degree : int
+        Neighbors of each node
+    rng : np.random.Generator
+        Source of randomness
+
+    Returns
+    -------
+    tuple
+        (u, v) endpoints of the edges as np.ndarray
+
+    """
+    stubs = np.repeat(np.arange(n_procs, dtype=np.int64), degree)
+    rng.shuffle(stubs)
+    u, v = stubs[0::2], stubs[1::2]
+    keys = np.sort(np.minimum(u, v) * n_procs + np.maximum(u, v))
+    duplicate = np.zeros(len(keys), dtype=bool)
+    duplicate[1:] = keys[1:] == keys[:-1]
+    bad = duplicate | (keys // n_procs == keys % n_procs)
+    pool = np.concatenate([keys[bad] // n_procs, keys[bad] % n_procs])
+    keys = keys[~bad]
+    while len(pool) > 0:
+        alive = np.ones(len(keys), dtype=bool)
+        added = set()
+        if len(keys) > 0:
+            # Break up as many simple edges as there are edges to repair
+            extra = np.unique(rng.integers(0, len(keys), size=len(pool) // 2 + 1))
+            alive[extra] = False
+            pool = np.concatenate([pool, keys[extra] // n_procs, keys[extra] % n_procs])
+        rng.shuffle(pool)
+        a, b = np.minimum(pool[0::2], pool[1::2]), np.maximum(pool[0::2], pool[1::2])
+        taken = np.zeros(len(a), dtype=bool)
+        if len(keys) > 0:
+            positions = np.minimum(
+                np.searchsorted(keys, a * n_procs + b), len(keys) - 1
+            )
+            taken = (keys[positions] == a * n_procs + b) & alive[positions]
+        rejected = []
+        for x, y, t in zip(a.tolist(), b.tolist(), taken.tolist()):
+            key = x * n_procs + y
+            if x == y or t or key in added:
+                rejected += [x, y]
+            else:
+                added.add(key)
+        pool = np.array(rejected, dtype=np.int64)
+        # Nearly sorted, timsort merges the repaired edges in linear time
+        keys = np.sort(
+            np.concatenate([keys[alive], np.fromiter(added, dtype=np.int64)]),
+            kind="stable",
+        )
+    return keys // n_procs, keys % n_procs
+
+
+class RandomRegular(CSRGraph):
+    """
+    Random regular topology generated with NumPy, stored as a CSR adjacency.
+    Equivalent to Regular without networkx and the per-node Python sets.
+    Neighbors are returned as arrays, like for every CSRGraph.
+
+    """
+
+    def __init__(self, n_procs, degree, seed=None, connected=True, max_tries=100):
+        """
+        Constructor. Generates a random regular graph
+
+        Parameters
+        ----------
+        n_procs : int
+            total number of nodes in the graph
+        degree : int
+            Neighbors of each node
+        seed : int, optional
+            Seed of the generator
+        connected : bool, optional
+            Redraw disconnected graphs, and connect with a Ring after max_tries
+        max_tries : int, optional
+            Number of graphs drawn before connecting with a Ring
+
+        """
+        assert (n_procs * degree) % 2 == 0 and degree < n_procs
+        super().__init__(n_procs)
+        self.degree = degree
+        rng = np.random.default_rng(seed)
+        for _ in range(max_tries):
+            u, v = self.draw(rng)
+            self.set_edges(u, v)
+            if not connected or self.is_connected():
+                return
+        logging.info("Random regular graph is disconnected, connecting with a Ring")
+        self.connect_graph()
+
+    def draw(self, rng):
+        """
+        Draws the edges of a random regular graph, dense graphs are drawn as
+        the complement of a sparse one
+
+        Parameters
+        ----------
+        rng : np.random.Generator
+            Source of randomness
+
+        Returns
+        -------
+        tuple
+            (u, v) endpoints of the edges as np.ndarray
+
+        """
+        complement_degree = self.n_procs - 1 - self.degree
+        if complement_degree >= self.degree:
+            return pairing(self.n_procs, self.degree, rng)
+        adjacency = np.ones((self.n_procs, self.n_procs), dtype=bool)
+        if complement_degree > 0:
+            u, v = pairing(self.n_procs, complement_degree, rng)
+            adjacency[u, v] = False
+            adjacency[v, u] = False
+        return np.nonzero(np.triu(adjacency, k=1))
@@ -0,0 +1,126 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from decentralizepy.graphs.RandomRegular import RandomRegular
+
+
+class SeededRegular:
+    """
+    Sequence of random regular graphs fully determined by (random_seed, iteration).
+    The peer samplers and the nodes build the same graph of an iteration from
+    the same seed, so a node can compute its own neighbors without asking the
+    peer sampler. The graphs of the next iterations can be generated in a
+    background thread while the current round runs. The graphs of the last
+    few iterations are kept.
+
+    """
+
+    def __init__(
+        self, n_procs, degree, random_seed, dynamic=True, offset=0, keep=2, prefetch=0
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        n_procs : int
+            total number of nodes in the graph
+        degree : int
+            Neighbors of each node
+        random_seed : int
+            Seed of the run
+        dynamic : bool, optional
+            A new graph every iteration, otherwise the same graph for all of them
+        offset : int, optional
+            uid of the node 0 of the graph, the virtual nodes start at n_procs_real
+        keep : int, optional
+            Number of graphs of past iterations kept, including the current one
+        prefetch : int, optional
+            Number of graphs of the next iterations generated in the background
+
+        """
+        self.n_procs = n_procs
+        self.degree = degree
+        self.random_seed = random_seed
+        self.dynamic = dynamic
+        self.offset = offset
+        self.keep = keep
+        self.prefetch = prefetch
+        # seed -> Future of the graph
+        self.graphs = dict()
+        self.pool = None
+
+    def seed(self, iteration):
+        """
+        Seed of the graph of an iteration
+
+        Parameters
+        ----------
+        iteration : int or None
+            Communication round
+
+        Returns
+        -------
+        int
+            Seed of the generator
+
+        """
+        if not self.dynamic or iteration is None:
+            return self.random_seed
+        return self.random_seed * 100000 + iteration
+
+    def graph(self, iteration):
+        """
+        Graph of an iteration, generated on the first request
+
+        Parameters
+        ----------
+        iteration : int or None
+            Communication round
+
+        Returns
+        -------
+        decentralizepy.graphs.RandomRegular
+            The graph
+
+        """
+        seed = self.seed(iteration)
+        if seed not in self.graphs:
+            self.graphs[seed] = Future()
+            self.graphs[seed].set_result(
+                RandomRegular(self.n_procs, self.degree, seed=seed)
+            )
+        graph = self.graphs[seed].result()
+
+        older = sorted(s for s in self.graphs if s < seed)
+        for s in older[: max(len(older) - self.keep + 1, 0)]:
+            del self.graphs[s]
+        if self.prefetch and self.dynamic and iteration is not None:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=1)
+            for i in range(1, self.prefetch + 1):
+                s = self.seed(iteration + i)
+                if s not in self.graphs:
+                    self.graphs[s] = self.pool.submit(
+                        RandomRegular, self.n_procs, self.degree, seed=s
+                    )
+        return graph
+
+    def neighbors(self, uid, iteration=None):
+        """
+        Neighbors of a node in the graph of an iteration
+
+        Parameters
+        ----------
+        uid : int
+            Unique ID of the node
+        iteration : int or None
+            Communication round
+
+        Returns
+        -------
+        set
+            Unique IDs of the neighbors
+
+        """
+        neighbors = self.graph(iteration).neighbors(uid - self.offset)
+        return set((neighbors + self.offset).tolist())
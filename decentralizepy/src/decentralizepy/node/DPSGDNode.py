@@ -5,6 +5,7 @@ import logging
 import math
 import os
 from collections import deque
+from time import perf_counter
 
 import torch
 from matplotlib import pyplot as plt
@@ -78,7 +79,9 @@ class DPSGDNode(Node):
             new_neighbors = self.get_neighbors()
 
             self.my_neighbors = new_neighbors
+            connect_start_time = perf_counter()
             self.connect_neighbors()
+            connect_time = perf_counter() - connect_start_time
             logging.debug("Connected to all neighbors")
 
             to_send = self.sharing.get_data_to_send(degree=len(self.my_neighbors))
@@ -132,10 +135,35 @@ class DPSGDNode(Node):
                     "total_bytes": {},
                     "total_meta": {},
                     "total_data_per_n": {},
+                    "connect_time": {},
+                    "open_connections": {},
+                    "connections_opened": {},
+                    "queued_bytes": {},
+                    "peak_queued_bytes": {},
+                    "dropped_messages": {},
                 }
 
             results_dict["total_bytes"][iteration + 1] = self.communication.total_bytes
+            results_dict["connect_time"][iteration + 1] = connect_time
+            if hasattr(self.communication, "connections_opened"):
+                results_dict["open_connections"][iteration + 1] = len(
+                    self.communication.peer_sockets
+                )
+                results_dict["connections_opened"][
+                    iteration + 1
+                ] = self.communication.connections_opened
 
+            if hasattr(self.communication, "queued_bytes"):
+                results_dict["queued_bytes"][
+                    iteration + 1
+                ] = self.communication.queued_bytes
+                results_dict["peak_queued_bytes"][
+                    iteration + 1
+                ] = self.communication.peak_queued_bytes
+                results_dict["dropped_messages"][iteration + 1] = (
+                    self.communication.dropped_messages
+                    + self.communication.coalesced_messages
+                )
             if hasattr(self.communication, "total_meta"):
                 results_dict["total_meta"][
                     iteration + 1
@@ -276,6 +304,12 @@ class DPSGDNode(Node):
         comm_module = importlib.import_module(comm_configs["comm_package"])
         comm_class = getattr(comm_module, comm_configs["comm_class"])
         comm_params = utils.remove_keys(comm_configs, ["comm_package", "comm_class"])
+        if comm_params.get("overflow", "block") != "block":
+            # A skipped model would leave its receiver waiting for the round
+            raise ValueError(
+                "overflow = {} needs a node that does not wait for every "
+                "neighbor, such as EL_Local_Timeout".format(comm_params["overflow"])
+            )
         self.addresses_filepath = comm_params.get("addresses_filepath", None)
         self.communication = comm_class(
             self.rank, self.machine_id, self.mapping, self.graph.n_procs, **comm_params
@@ -354,6 +388,7 @@ class DPSGDNode(Node):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
         self.my_neighbors = self.graph.neighbors(self.uid)
 
         self.init_sharing(config["SHARING"])
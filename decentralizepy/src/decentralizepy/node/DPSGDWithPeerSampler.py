@@ -6,6 +6,7 @@ from collections import deque
 import torch
 
 from decentralizepy.graphs.Graph import Graph
+from decentralizepy.graphs.SeededRegular import SeededRegular
 from decentralizepy.mappings.Mapping import Mapping
 from decentralizepy.node.DPSGDNode import DPSGDNode
 
@@ -16,10 +17,17 @@ class DPSGDWithPeerSampler(DPSGDNode):
 
     """
 
+    # Set with local_topology in [NODE] to compute the neighbors without the peer sampler
+    topology = None
+
     def receive_neighbors(self):
         return self.receive_channel("PEERS")[1]["NEIGHBORS"]
 
     def get_neighbors(self, node=None):
+        if self.topology is not None:
+            my_neighbors = self.topology.neighbors(self.uid, self.iteration)
+            logging.debug("Neighbors this round: {}".format(my_neighbors))
+            return my_neighbors
         logging.debug("Requesting neighbors from the peer sampler.")
         self.communication.send(
             self.peer_sampler_uid,
@@ -123,6 +131,16 @@ class DPSGDWithPeerSampler(DPSGDNode):
 
         self.message_queue["PEERS"] = deque()
 
+        nodeConfigs = config["NODE"] if "NODE" in config else dict()
+        if nodeConfigs.get("local_topology", False):
+            # Same graphs as PeerSamplerDynamic, derived from (random_seed, iteration)
+            self.topology = SeededRegular(
+                self.graph.n_procs,
+                nodeConfigs["graph_degree"],
+                config["DATASET"].get("random_seed", 97),
+                prefetch=nodeConfigs.get("prefetch_graphs", 1),
+            )
+
         self.peer_sampler_uid = peer_sampler_uid
         self.connect_neighbor(self.peer_sampler_uid)
         self.wait_for_hello(self.peer_sampler_uid)
@@ -384,6 +384,7 @@ class EL_Local(Node):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
         self.my_neighbors = self.graph.neighbors(self.uid)
 
         self.init_sharing(config["SHARING"])
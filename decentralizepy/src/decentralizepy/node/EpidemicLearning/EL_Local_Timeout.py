@@ -51,8 +51,8 @@ class EL_Local(Node):
     def get_neighbors(self, node=None):
         return set(self.rng.sample(self.my_neighbors, self.degree))
 
-    def receive_DPSGD(self):
-        return self.receive_channel("DPSGD", block=False)
+    def receive_DPSGD(self, timeout=None):
+        return self.receive_channel("DPSGD", timeout=timeout)
 
     def run(self):
         """
@@ -81,7 +81,12 @@ class EL_Local(Node):
             self.iteration = iteration
             self.trainer.train(self.dataset)
 
-            neighbors_this_round = self.get_neighbors()
+            neighbors_this_round = self.sharing.ready_neighbors(self.get_neighbors())
+            logging.debug(
+                "Sending to {} of {} neighbors, the others are behind".format(
+                    len(neighbors_this_round), self.degree
+                )
+            )
 
             to_send = self.sharing.get_data_to_send()
             to_send["CHANNEL"] = "DPSGD"
@@ -92,11 +97,11 @@ class EL_Local(Node):
                 logging.info("Sending to neighbor: %d", neighbor)
                 self.communication.send(neighbor, to_send)
 
-            init_time = perf_counter()
+            deadline = perf_counter() + self.timeout
             at_least_one_response = False
 
             while True:
-                response = self.receive_DPSGD()
+                response = self.receive_DPSGD(timeout=deadline - perf_counter())
                 if response:
                     sender, data = response
                     at_least_one_response = True
@@ -113,8 +118,7 @@ class EL_Local(Node):
                     else:
                         self.peer_deques[sender].append(data)
 
-                cur_time = perf_counter()
-                if cur_time - init_time > self.timeout:
+                if perf_counter() > deadline:
                     break
 
             if at_least_one_response:
@@ -150,6 +154,9 @@ class EL_Local(Node):
                     "total_meta": {},
                     "total_data_per_n": {},
                     "received_this_round": {},
+                    "queued_bytes": {},
+                    "peak_queued_bytes": {},
+                    "dropped_messages": {},
                 }
 
             results_dict["total_bytes"][iteration + 1] = self.communication.total_bytes
@@ -162,6 +169,17 @@ class EL_Local(Node):
                 results_dict["total_data_per_n"][
                     iteration + 1
                 ] = self.communication.total_data
+            if hasattr(self.communication, "queued_bytes"):
+                results_dict["queued_bytes"][
+                    iteration + 1
+                ] = self.communication.queued_bytes
+                results_dict["peak_queued_bytes"][
+                    iteration + 1
+                ] = self.communication.peak_queued_bytes
+                results_dict["dropped_messages"][iteration + 1] = (
+                    self.communication.dropped_messages
+                    + self.communication.coalesced_messages
+                )
             if hasattr(self.communication, "received_this_round"):
                 results_dict["received_this_round"][
                     iteration + 1
@@ -349,6 +367,7 @@ class EL_Local(Node):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
         self.my_neighbors = self.graph.neighbors(self.uid)
 
         self.init_sharing(config["SHARING"])
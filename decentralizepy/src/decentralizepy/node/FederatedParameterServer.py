@@ -207,6 +207,7 @@ class FederatedParameterServer(Node):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
 
         self.peer_deques = dict()
 
@@ -82,7 +82,8 @@ class KNN(OverlayNode):
         return message
 
     def receive_KNN_message(self):
-        return self.receive_channel("KNNConstr", block=False)
+        # Wakes up regularly to check exit_receiver
+        return self.receive_channel("KNNConstr", timeout=0.05)
 
     def process_init_receive(self, message):
         self.mutex.acquire()
@@ -3,6 +3,7 @@ import logging
 import math
 import os
 from collections import deque
+from time import perf_counter
 
 import numpy as np
 import torch
@@ -21,24 +22,49 @@ class Node:
     def connect_neighbor(self, neighbor):
         """
         Connects given neighbor. Sends HELLO.
+        With lazy_connect in [COMMUNICATION], the socket is opened by the
+        first send and there is no HELLO, the neighbor only joins the barrier.
 
         """
+        if getattr(self.communication, "lazy_connect", False):
+            self.barrier.add(neighbor)
+            return
         logging.debug("Sending connection request to {}".format(neighbor))
         self.communication.init_connection(neighbor)
         self.communication.send(neighbor, {"HELLO": self.uid, "CHANNEL": "CONNECT"})
 
-    def receive_channel(self, channel, block=True):
+    def receive_channel(self, channel, block=True, timeout=None):
+        """
+        Returns ONE message of a channel, messages of other channels are queued.
+
+        Parameters
+        ----------
+        channel : str
+            Channel of the message
+        block : bool, optional
+            Wait for a message, otherwise return None right away if there is none
+        timeout : float, optional
+            Maximum number of seconds to wait, None to wait until a message arrives
+
+        Returns
+        -------
+        tuple or None
+            (sender, data), None if no message of the channel arrived in time
+
+        """
         if channel not in self.message_queue:
             self.message_queue[channel] = deque()
 
         if len(self.message_queue[channel]) > 0:
             return self.message_queue[channel].popleft()
         else:
-            x = self.communication.receive(block=block)
+            deadline = None if timeout is None else perf_counter() + timeout
+            x = self.communication.receive(block=block, timeout=timeout)
             if x == None:
-                assert not block
+                assert not block or timeout is not None
                 return None
             sender, recv = x
+            self.learn_peer(sender, recv)
 
             logging.debug(
                 "Received some message from {} with CHANNEL: {}".format(
@@ -50,11 +76,15 @@ class Node:
                 if recv["CHANNEL"] not in self.message_queue:
                     self.message_queue[recv["CHANNEL"]] = deque()
                 self.message_queue[recv["CHANNEL"]].append((sender, recv))
-                x = self.communication.receive(block=block)
+                x = self.communication.receive(
+                    block=block,
+                    timeout=None if deadline is None else deadline - perf_counter(),
+                )
                 if x == None:
-                    assert not block
+                    assert not block or timeout is not None
                     return None
                 sender, recv = x
+                self.learn_peer(sender, recv)
                 logging.debug(
                     "Received some message from {} with CHANNEL: {}".format(
                         sender, recv["CHANNEL"]
@@ -62,6 +92,32 @@ class Node:
                 )
             return (sender, recv)
 
+    def learn_peer(self, sender, data):
+        """
+        Without HELLOs (lazy_connect), peers that message this node join the
+        barrier, so that they get a BYE when disconnecting. Messages sent
+        before a BYE can arrive after it when max_connections reconnects, so
+        peers that said BYE never join again.
+
+        Parameters
+        ----------
+        sender : int
+            uid of the sender of a received message
+        data : dict
+            The received message
+
+        """
+        if not getattr(self.communication, "lazy_connect", False):
+            return
+        if sender not in self.barrier and sender not in self.said_bye:
+            self.barrier.add(sender)
+            if self.sent_disconnections:
+                self.communication.send(
+                    sender, {"BYE": self.uid, "CHANNEL": "DISCONNECT"}
+                )
+        if data["CHANNEL"] == "DISCONNECT":
+            self.said_bye.add(sender)
+
     def receive_hello(self):
         return self.receive_channel("CONNECT")
 
@@ -386,6 +442,7 @@ class Node:
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
         self.my_neighbors = self.graph.neighbors(self.uid)
 
         self.init_sharing(config["SHARING"])
@@ -344,6 +344,7 @@ class OverlayNode(Node):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
         self.my_neighbors = self.graph.neighbors(self.uid)
 
         self.init_sharing(config["SHARING"])
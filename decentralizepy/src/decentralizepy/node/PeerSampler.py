@@ -170,6 +170,7 @@ class PeerSampler(Node):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
 
         self.init_comm(config["COMMUNICATION"])
         self.my_neighbors = self.graph.get_all_nodes()
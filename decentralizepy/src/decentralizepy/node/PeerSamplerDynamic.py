@@ -1,7 +1,7 @@
 import logging
 
 from decentralizepy.graphs.Graph import Graph
-from decentralizepy.graphs.Regular import Regular
+from decentralizepy.graphs.SeededRegular import SeededRegular
 from decentralizepy.mappings.Mapping import Mapping
 from decentralizepy.node.PeerSampler import PeerSampler
 
@@ -14,22 +14,7 @@ class PeerSamplerDynamic(PeerSampler):
 
     def get_neighbors(self, node, iteration=None):
         if iteration != None:
-            if iteration > self.iteration:
-                logging.debug(
-                    "iteration, self.iteration: {}, {}".format(
-                        iteration, self.iteration
-                    )
-                )
-                assert iteration == self.iteration + 1
-                self.iteration = iteration
-                self.graphs.append(
-                    Regular(
-                        self.graph.n_procs,
-                        self.graph_degree,
-                        seed=self.random_seed * 100000 + iteration,
-                    )
-                )
-            return self.graphs[iteration].neighbors(node)
+            return self.topology.neighbors(node, iteration)
         else:
             return self.graph.neighbors(node)
 
@@ -83,9 +68,6 @@ class PeerSamplerDynamic(PeerSampler):
 
         """
 
-        self.iteration = -1
-        self.graphs = []
-
         nodeConfigs = config["NODE"]
         self.graph_degree = nodeConfigs["graph_degree"]
 
@@ -101,6 +83,14 @@ class PeerSamplerDynamic(PeerSampler):
             *args
         )
 
+        # Nodes with local_topology in [NODE] build the same graphs themselves
+        self.topology = SeededRegular(
+            self.graph.n_procs,
+            self.graph_degree,
+            self.random_seed,
+            prefetch=nodeConfigs.get("prefetch_graphs", 1),
+        )
+
         self.run()
 
         logging.info("Peer Sampler exiting")
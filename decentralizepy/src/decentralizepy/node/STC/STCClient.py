@@ -245,6 +245,7 @@ class STCClient(Node):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
 
         self.participated = 0
 
@@ -242,6 +242,7 @@ class STCServer(Node):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
 
         self.peer_deques = dict()
 
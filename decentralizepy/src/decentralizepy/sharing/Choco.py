@@ -331,10 +331,15 @@ class Choco(Sharing):
         logging.debug(
             "type(alpha): %s, value: %s", str(type(self.alpha)), str(self.alpha)
         )
-        model_state_dict = model.state_dict()
-        self.model_hat = zeros_like_state_dict(model_state_dict)
-        self.s = zeros_like_state_dict(model_state_dict)
-        self.my_q = None
+        # Flat buffers of the model, x_hat, s and the difference q = x - x_hat
+        self.x = flatten_state_dict(model.state_dict()).clone()
+        self.x_hat = torch.zeros_like(self.x)
+        self.s = torch.zeros_like(self.x)
+        self.q = torch.zeros_like(self.x)
+        self.q_abs = torch.zeros_like(self.x)
+        # Sparse q sent this round
+        self.q_indices = torch.zeros(0, dtype=torch.long)
+        self.q_values = torch.zeros(0, dtype=self.x.dtype)
 
     def compress_data(self, data):
         result = dict(data)
@@ -353,8 +358,35 @@ class Choco(Sharing):
                 data["params"] = self.compressor.decompress_float(data["params"])
         return data
 
-    def _compress(self, x):
-        return topk_sparsification(x, self.alpha)
+    def flatten_model(self):
+        """
+        Copies the model parameters into self.x
+
+        """
+        torch.cat([v.flatten() for v in self.model.state_dict().values()], out=self.x)
+
+    def _compress(self):
+        """
+        Global topk sparsification of self.q. Keeps every value whose magnitude is at
+        least the k-th largest one, and drops zeros.
+
+        Returns
+        -------
+        tuple
+            (indices, values) of the kept entries of self.q
+
+        """
+        torch.abs(self.q, out=self.q_abs)
+        numel_to_keep = round(self.alpha * self.q.numel())
+        if numel_to_keep > 0:
+            cutoff_value, _ = torch.kthvalue(
+                self.q_abs, self.q.numel() - numel_to_keep + 1
+            )
+            keep = (self.q_abs >= cutoff_value) & (self.q_abs > 0)
+        else:
+            keep = self.q_abs > 0
+        indices = keep.nonzero(as_tuple=True)[0]
+        return indices, self.q[indices]
 
     def _pre_step(self):
         """
@@ -362,9 +394,9 @@ class Choco(Sharing):
 
         """
         with torch.no_grad():
-            self.my_q = self._compress(
-                subtract_state_dicts(self.model.state_dict(), self.model_hat)
-            )
+            self.flatten_model()
+            torch.sub(self.x, self.x_hat, out=self.q)
+            self.q_indices, self.q_values = self._compress()
 
     def serialized_model(self):
         """
@@ -376,13 +408,36 @@ class Choco(Sharing):
             Model converted to dict
 
         """
-        values, indices = serialize_sparse_state_dict(self.my_q)
         data = dict()
-        data["params"] = values.numpy()
-        data["indices"] = indices.numpy()
+        data["params"] = self.q_values.numpy()
+        data["indices"] = self.q_indices.numpy()
         data["send_partial"] = True
         return self.compress_data(data)
 
+    def deserialized_sparse(self, m):
+        """
+        Convert received dict to a sparse flat vector.
+
+        Parameters
+        ----------
+        m : dict
+            received dict
+
+        Returns
+        -------
+        tuple
+            (indices, values) of the received vector
+
+        """
+        with torch.no_grad():
+            if "send_partial" not in m:
+                values = flatten_state_dict(super().deserialized_model(m))
+                return torch.arange(values.shape[0]), values
+            m = self.decompress_data(m)
+            indices = torch.tensor(m["indices"], dtype=torch.long)
+            values = torch.tensor(m["params"])
+            return indices, values
+
     def deserialized_model(self, m):
         """
         Convert received dict to state_dict.
@@ -402,9 +457,7 @@ class Choco(Sharing):
             return super().deserialized_model(m)
 
         with torch.no_grad():
-            m = self.decompress_data(m)
-            indices = torch.tensor(m["indices"], dtype=torch.long)
-            values = torch.tensor(m["params"])
+            indices, values = self.deserialized_sparse(m)
             return deserialize_sparse_state_dict(
                 values, indices, self.model.state_dict()
             )
@@ -415,7 +468,8 @@ class Choco(Sharing):
 
         """
         with torch.no_grad():
-            self_add_state_dict(self.model_hat, self.my_q)  # x_hat = q_self + x_hat
+            # x_hat = q_self + x_hat
+            self.x_hat.index_add_(0, self.q_indices, self.q_values)
             weight_total = 0
             for i, n in enumerate(peer_deques):
                 data = peer_deques[n].popleft()
@@ -428,27 +482,23 @@ class Choco(Sharing):
                         n, iteration
                     )
                 )
-                data = self.deserialized_model(data)
+                indices, values = self.deserialized_sparse(data)
                 # Metro-Hastings
                 weight = 1 / (max(len(peer_deques), degree) + 1)
                 weight_total += weight
-                for key, value in data.items():
-                    if key in self.s:
-                        self.s[key] += value * weight
-                    # else:
-                    #     self.s[key] = value * weight
-
-            for key, value in self.my_q.items():
-                self.s[key] += (1 - weight_total) * value  # Metro-Hastings
-
-            total = self.model.state_dict().copy()
-            self_add_state_dict(
-                total,
-                subtract_state_dicts(self.s, self.model_hat),
-                constant=self.step_size,
-            )  # x = x + gamma * (s - x_hat)
-
-        self.model.load_state_dict(total)
+                self.s.index_add_(0, indices, values, alpha=weight)
+
+            # Metro-Hastings
+            self.s.index_add_(0, self.q_indices, self.q_values, alpha=1 - weight_total)
+
+            # x = x + gamma * (s - x_hat)
+            self.flatten_model()
+            torch.sub(self.s, self.x_hat, out=self.q)
+            self.x.add_(self.q, alpha=self.step_size)
+
+        self.model.load_state_dict(
+            unflatten_state_dict(self.x, self.model.state_dict())
+        )
         self._post_step()
         self.communication_round += 1
 
@@ -1,12 +1,11 @@
-import json
 import logging
-import os
 
 import numpy as np
 import torch
 import torch.fft as fft
 
 from decentralizepy.sharing.PartialModel import PartialModel
+from decentralizepy.sharing.SparseAccumulator import SparseAccumulator
 
 
 def change_transformer_fft(x):
@@ -117,6 +116,8 @@ class FFT(PartialModel):
             compression_class,
         )
         self.change_based_selection = change_based_selection
+        flat_fft = change_transformer_fft(self.init_model)
+        self.accumulator = SparseAccumulator(flat_fft.shape[0], dtype=flat_fft.dtype)
 
     def apply_fft(self):
         """
@@ -134,18 +135,11 @@ class FFT(PartialModel):
         with torch.no_grad():
             flat_fft = self.pre_share_model_transformed
             if self.change_based_selection:
-                diff = self.model.model_change
-                _, index = torch.topk(
-                    diff.abs(), round(self.alpha * len(diff)), dim=0, sorted=False
+                index = self.topk.select_fraction(
+                    self.model.model_change.abs(), self.alpha
                 )
             else:
-                _, index = torch.topk(
-                    flat_fft.abs(),
-                    round(self.alpha * len(flat_fft)),
-                    dim=0,
-                    sorted=False,
-                )
-        index, _ = torch.sort(index)
+                index = self.topk.select_fraction(flat_fft.abs(), self.alpha)
         return flat_fft[index], index
 
     def serialized_model(self):
@@ -174,25 +168,9 @@ class FFT(PartialModel):
             self.model.rewind_accumulation(indices)
 
             if self.save_shared:
-                shared_params = dict()
-                shared_params["order"] = list(self.model.state_dict().keys())
-                shapes = dict()
-                for k, v in self.model.state_dict().items():
-                    shapes[k] = list(v.shape)
-                shared_params["shapes"] = shapes
-
-                shared_params[self.communication_round] = indices.tolist()  # is slow
-
-                shared_params["alpha"] = self.alpha
-
-                with open(
-                    os.path.join(
-                        self.folder_path,
-                        "{}_shared_params.json".format(self.communication_round + 1),
-                    ),
-                    "w",
-                ) as of:
-                    json.dump(shared_params, of)
+                self.shared_log.append_indices(
+                    self.communication_round, indices, self.alpha
+                )
 
             if not self.dict_ordered:
                 raise NotImplementedError
@@ -226,6 +204,7 @@ class FFT(PartialModel):
             params = m["params"]
             params_tensor = torch.tensor(params)
             ret["params"] = params_tensor
+            return ret
 
         with torch.no_grad():
             if not self.dict_ordered:
@@ -248,14 +227,13 @@ class FFT(PartialModel):
 
         """
         with torch.no_grad():
-            total = None
-            weight_total = 0
             tensors_to_cat = [
                 v.data.flatten() for _, v in self.model.state_dict().items()
             ]
             pre_share_model = torch.cat(tensors_to_cat, dim=0)
             flat_fft = self.change_transformer(pre_share_model)
 
+            self.accumulator.reset()
             for i, n in enumerate(peer_deques):
                 data = peer_deques[n].popleft()
                 degree, iteration = data["degree"], data["iteration"]
@@ -268,24 +246,11 @@ class FFT(PartialModel):
                     )
                 )
                 data = self.deserialized_model(data)
-                params = data["params"]
-                if "indices" in data:
-                    indices = data["indices"]
-                    # use local data to complement
-                    topkf = flat_fft.clone().detach()
-                    topkf[indices] = params
-                else:
-                    topkf = params
-
                 weight = 1 / (max(len(peer_deques), degree) + 1)  # Metro-Hastings
-                weight_total += weight
-                if total is None:
-                    total = weight * topkf
-                else:
-                    total += weight * topkf
-
-            # Metro-Hastings
-            total += (1 - weight_total) * flat_fft
+                # Coordinates that were not sent are complemented with local data
+                self.accumulator.add(data.get("indices"), data["params"], weight)
+
+            total = self.accumulator.average(flat_fft)
             reverse_total = fft.irfft(total)
 
             start_index = 0
@@ -1,12 +1,38 @@
-import json
+import functools
 import logging
-import os
 
 import numpy as np
 import pywt
 import torch
 
 from decentralizepy.sharing.PartialModel import PartialModel
+from decentralizepy.sharing.SparseAccumulator import SparseAccumulator
+
+
+@functools.lru_cache(maxsize=None)
+def wavelet_plan(wavelet, level, length):
+    """
+    Wavelet object and coefficient layout of a transform, computed once per process
+
+    Parameters
+    ----------
+    wavelet : str
+        name of the wavelet to be used in gradient compression
+    level: int
+        level of the wavelet decomposition
+    length : int
+        Length of the transformed vectors
+
+    Returns
+    -------
+    tuple
+        (pywt.Wavelet, coefficient slices, shape of the coefficient array)
+
+    """
+    wavelet = pywt.Wavelet(wavelet)
+    coeff = pywt.wavedec(np.zeros(length, dtype=np.float32), wavelet, level=level)
+    data, coeff_slices = pywt.coeffs_to_array(coeff)
+    return wavelet, coeff_slices, data.shape
 
 
 def change_transformer_wavelet(x, wavelet, level):
@@ -27,9 +53,10 @@ def change_transformer_wavelet(x, wavelet, level):
     x : torch.Tensor
         Representation of the change int the wavelet domain
     """
+    wavelet, _, _ = wavelet_plan(wavelet, level, len(x))
     coeff = pywt.wavedec(x, wavelet, level=level)
-    data, coeff_slices = pywt.coeffs_to_array(coeff)
-    return torch.from_numpy(data.ravel())
+    # Same layout as pywt.coeffs_to_array for 1-D coefficients
+    return torch.from_numpy(np.concatenate(coeff))
 
 
 class Wavelet(PartialModel):
@@ -133,11 +160,13 @@ class Wavelet(PartialModel):
 
         self.change_based_selection = change_based_selection
 
-        # Do a dummy transform to get the shape and coefficents slices
-        coeff = pywt.wavedec(self.init_model.numpy(), self.wavelet, level=self.level)
-        data, coeff_slices = pywt.coeffs_to_array(coeff)
-        self.wt_shape = data.shape
-        self.coeff_slices = coeff_slices
+        # Shape and coefficents slices of the transform
+        self.wavelet_object, self.coeff_slices, self.wt_shape = wavelet_plan(
+            self.wavelet, self.level, self.init_model.shape[0]
+        )
+        self.accumulator = SparseAccumulator(
+            self.wt_shape[0], dtype=self.init_model.dtype
+        )
 
     def apply_wavelet(self):
         """
@@ -154,21 +183,9 @@ class Wavelet(PartialModel):
         logging.debug("Returning wavelet compressed model weights")
         data = self.pre_share_model_transformed
         if self.change_based_selection:
-            diff = self.model.model_change
-            _, index = torch.topk(
-                diff.abs(),
-                round(self.alpha * len(diff)),
-                dim=0,
-                sorted=False,
-            )
+            index = self.topk.select_fraction(self.model.model_change.abs(), self.alpha)
         else:
-            _, index = torch.topk(
-                data.abs(),
-                round(self.alpha * len(data)),
-                dim=0,
-                sorted=False,
-            )
-        index, _ = torch.sort(index)
+            index = self.topk.select_fraction(data.abs(), self.alpha)
         return data[index], index
 
     def serialized_model(self):
@@ -196,26 +213,9 @@ class Wavelet(PartialModel):
             self.model.shared_parameters_counter[indices] += 1
             self.model.rewind_accumulation(indices)
             if self.save_shared:
-                shared_params = dict()
-                shared_params["order"] = list(self.model.state_dict().keys())
-                shapes = dict()
-                for k, v in self.model.state_dict().items():
-                    shapes[k] = list(v.shape)
-                shared_params["shapes"] = shapes
-
-                # is slow
-                shared_params[self.communication_round] = indices.tolist()
-
-                shared_params["alpha"] = self.alpha
-
-                with open(
-                    os.path.join(
-                        self.folder_path,
-                        "{}_shared_params.json".format(self.communication_round + 1),
-                    ),
-                    "w",
-                ) as of:
-                    json.dump(shared_params, of)
+                self.shared_log.append_indices(
+                    self.communication_round, indices, self.alpha
+                )
 
             if not self.dict_ordered:
                 raise NotImplementedError
@@ -272,9 +272,8 @@ class Wavelet(PartialModel):
 
         """
         with torch.no_grad():
-            total = None
-            weight_total = 0
             wt_params = self.pre_share_model_transformed
+            self.accumulator.reset()
             for i, n in enumerate(peer_deques):
                 data = peer_deques[n].popleft()
                 degree, iteration = data["degree"], data["iteration"]
@@ -287,32 +286,18 @@ class Wavelet(PartialModel):
                     )
                 )
                 data = self.deserialized_model(data)
-                params = data["params"]
-                if "indices" in data:
-                    indices = data["indices"]
-                    # use local data to complement
-                    topkwf = wt_params.clone().detach()
-                    topkwf[indices] = params
-                    topkwf = topkwf.reshape(self.wt_shape)
-                else:
-                    topkwf = params.reshape(self.wt_shape)
-
                 # Metro-Hastings
                 weight = 1 / (max(len(peer_deques), degree) + 1)
-                weight_total += weight
-                if total is None:
-                    total = weight * topkwf
-                else:
-                    total += weight * topkwf
+                # Coordinates that were not sent are complemented with local data
+                self.accumulator.add(data.get("indices"), data["params"], weight)
 
-            # Metro-Hastings
-            total += (1 - weight_total) * wt_params
+            total = self.accumulator.average(wt_params)
 
             avg_wf_params = pywt.array_to_coeffs(
                 total.numpy(), self.coeff_slices, output_format="wavedec"
             )
             reverse_total = torch.from_numpy(
-                pywt.waverec(avg_wf_params, wavelet=self.wavelet)
+                pywt.waverec(avg_wf_params, wavelet=self.wavelet_object)
             )
 
             start_index = 0
@@ -334,8 +319,8 @@ class Wavelet(PartialModel):
 
         """
         with torch.no_grad():
-            total = None
             wt_params = self.pre_share_model_transformed
+            self.accumulator.reset()
             for i, n in enumerate(peer_deques):
                 data = peer_deques[n].popleft()
                 degree, iteration = data["degree"], data["iteration"]
@@ -348,27 +333,17 @@ class Wavelet(PartialModel):
                     )
                 )
                 data = self.deserialized_model(data)
-                params = data["params"]
-                if "indices" in data:
-                    indices = data["indices"]
-                    # use local data to complement
-                    topkwf = wt_params.clone().detach()
-                    topkwf[indices] = params
-                    topkwf = topkwf.reshape(self.wt_shape)
-                else:
-                    topkwf = params.reshape(self.wt_shape)
-
                 weight = 1 / len(peer_deques)
-                if total is None:
-                    total = weight * topkwf
-                else:
-                    total += weight * topkwf
+                # Coordinates that were not sent are complemented with local data
+                self.accumulator.add(data.get("indices"), data["params"], weight)
+
+            total = self.accumulator.average(wt_params)
 
             avg_wf_params = pywt.array_to_coeffs(
                 total.numpy(), self.coeff_slices, output_format="wavedec"
             )
             reverse_total = torch.from_numpy(
-                pywt.waverec(avg_wf_params, wavelet=self.wavelet)
+                pywt.waverec(avg_wf_params, wavelet=self.wavelet_object)
             )
 
             start_index = 0
@@ -0,0 +1,282 @@
+import json
+import os
+
+import numpy as np
+import torch
+
+
+class ParameterLog:
+    """
+    Append-only binary log of shared indices and model change vectors.
+    A log consists of three files:
+    <path>.json holds the order and shapes of the state_dict.
+    <path>.log holds the records, each padded to 8 bytes.
+    <path>.index holds one fixed-size entry per record (RECORD_DTYPE).
+    Indices are delta-coded in the smallest unsigned type that fits the
+    largest gap. Vectors are stored in float16, with real and imaginary parts
+    interleaved for complex vectors. The entry of a record is written after its
+    data, so a partially written record is never indexed.
+
+    """
+
+    INDICES = 0
+    VECTOR = 1
+    COMPLEX_VECTOR = 2
+
+    RECORD_DTYPE = np.dtype(
+        [
+            ("round", "<i8"),
+            ("kind", "<i8"),
+            ("width", "<i8"),
+            ("offset", "<i8"),
+            ("count", "<i8"),
+            ("first", "<i8"),
+            ("alpha", "<f8"),
+        ]
+    )
+
+    def __init__(self, path, order, shapes):
+        """
+        Constructor. Appends to the log if it already exists.
+
+        Parameters
+        ----------
+        path : str
+            Path of the log without extension
+        order : list
+            Keys of the state_dict
+        shapes : dict
+            key -> shape of the parameter
+
+        """
+        self.path = path
+        self.data_path = path + ".log"
+        self.index_path = path + ".index"
+        if not os.path.exists(path + ".json"):
+            with open(path + ".json", "w") as of:
+                json.dump({"order": order, "shapes": shapes}, of)
+        self.size = (
+            os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        )
+
+    def append(self, round, kind, width, count, first, alpha, data):
+        """
+        Appends a record and its index entry
+
+        Parameters
+        ----------
+        round : int
+            Communication round
+        kind : int
+            ParameterLog.INDICES, ParameterLog.VECTOR or ParameterLog.COMPLEX_VECTOR
+        width : int
+            Bytes per stored value
+        count : int
+            Number of indices or vector elements
+        first : int
+            First index of delta-coded indices
+        alpha : float
+            Fraction of the model shared, NaN if unknown
+        data : bytes
+            Record payload
+
+        """
+        padding = -len(data) % 8
+        with open(self.data_path, "ab") as of:
+            of.write(data)
+            of.write(bytes(padding))
+        entry = np.array(
+            [(round, kind, width, self.size, count, first, alpha)],
+            dtype=self.RECORD_DTYPE,
+        )
+        with open(self.index_path, "ab") as of:
+            of.write(entry.tobytes())
+        self.size += len(data) + padding
+
+    def append_indices(self, round, indices, alpha=float("nan")):
+        """
+        Logs the shared indices of a round
+
+        Parameters
+        ----------
+        round : int
+            Communication round
+        indices : torch.Tensor or np.ndarray
+            Sorted unique indices
+        alpha : float, optional
+            Fraction of the model shared
+
+        """
+        if isinstance(indices, torch.Tensor):
+            indices = indices.detach().cpu().numpy()
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            self.append(round, self.INDICES, 1, 0, 0, alpha, b"")
+            return
+        gaps = np.diff(indices)
+        largest = gaps.max() if len(gaps) > 0 else 0
+        for dtype in [np.uint8, np.uint16, np.uint32, np.uint64]:
+            if largest <= np.iinfo(dtype).max:
+                break
+        gaps = gaps.astype(dtype)
+        self.append(
+            round,
+            self.INDICES,
+            gaps.itemsize,
+            len(indices),
+            indices[0],
+            alpha,
+            gaps.tobytes(),
+        )
+
+    def append_vector(self, round, vector):
+        """
+        Logs a vector in float16
+
+        Parameters
+        ----------
+        round : int
+            Communication round
+        vector : torch.Tensor or np.ndarray
+            Real or complex 1-D vector
+
+        """
+        if isinstance(vector, torch.Tensor):
+            vector = vector.detach().cpu().numpy()
+        vector = np.asarray(vector).reshape(-1)
+        kind = self.VECTOR
+        if np.iscomplexobj(vector):
+            kind = self.COMPLEX_VECTOR
+            vector = np.stack([vector.real, vector.imag], axis=1).reshape(-1)
+        data = vector.astype(np.float16)
+        self.append(round, kind, 2, len(data), 0, float("nan"), data.tobytes())
+
+
+class ParameterLogReader:
+    """
+    Memory-mapped reader of a ParameterLog
+
+    """
+
+    def __init__(self, path):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        path : str
+            Path of the log without extension
+
+        """
+        with open(path + ".json", "r") as inf:
+            metadata = json.load(inf)
+        self.order = metadata["order"]
+        self.shapes = metadata["shapes"]
+        index_size = os.path.getsize(path + ".index")
+        # Ignore a trailing partially written entry
+        num_records = index_size // ParameterLog.RECORD_DTYPE.itemsize
+        if num_records > 0:
+            self.index = np.memmap(
+                path + ".index",
+                dtype=ParameterLog.RECORD_DTYPE,
+                mode="r",
+                shape=(num_records,),
+            )
+        else:
+            self.index = np.zeros(0, dtype=ParameterLog.RECORD_DTYPE)
+        if os.path.getsize(path + ".log") > 0:
+            self.data = np.memmap(path + ".log", dtype=np.uint8, mode="r")
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+        # round -> record, the last record of a round wins
+        self.records = {int(r): i for i, r in enumerate(self.index["round"])}
+
+    def __len__(self):
+        return len(self.records)
+
+    def rounds(self):
+        """
+        Logged rounds in increasing order
+
+        Returns
+        -------
+        list
+            Communication rounds
+
+        """
+        return sorted(self.records)
+
+    def entry(self, round):
+        return self.index[self.records[round]]
+
+    def alpha(self, round):
+        """
+        Fraction of the model shared in a round
+
+        Parameters
+        ----------
+        round : int
+            Communication round
+
+        Returns
+        -------
+        float
+            alpha, NaN if it was not logged
+
+        """
+        return float(self.entry(round)["alpha"])
+
+    def indices(self, round):
+        """
+        Shared indices of a round
+
+        Parameters
+        ----------
+        round : int
+            Communication round
+
+        Returns
+        -------
+        np.ndarray
+            Sorted indices
+
+        """
+        entry = self.entry(round)
+        assert entry["kind"] == ParameterLog.INDICES
+        count = int(entry["count"])
+        if count == 0:
+            return np.zeros(0, dtype=np.int64)
+        offset = int(entry["offset"])
+        width = int(entry["width"])
+        gaps = self.data[offset : offset + (count - 1) * width].view(
+            np.dtype("<u{}".format(width))
+        )
+        indices = np.empty(count, dtype=np.int64)
+        indices[0] = entry["first"]
+        np.cumsum(gaps, dtype=np.int64, out=indices[1:])
+        indices[1:] += indices[0]
+        return indices
+
+    def vector(self, round):
+        """
+        Logged vector of a round
+
+        Parameters
+        ----------
+        round : int
+            Communication round
+
+        Returns
+        -------
+        np.ndarray
+            float16 vector, complex64 for complex vectors
+
+        """
+        entry = self.entry(round)
+        assert entry["kind"] in [ParameterLog.VECTOR, ParameterLog.COMPLEX_VECTOR]
+        offset = int(entry["offset"])
+        count = int(entry["count"])
+        vector = self.data[offset : offset + 2 * count].view(np.float16)
+        if entry["kind"] == ParameterLog.COMPLEX_VECTOR:
+            vector = vector.astype(np.float32).view(np.complex64)
+        return vector
@@ -1,4 +1,3 @@
-import json
 import logging
 import os
 from pathlib import Path
@@ -6,7 +5,10 @@ from pathlib import Path
 import numpy as np
 import torch
 
+from decentralizepy.sharing.ParameterLog import ParameterLog
 from decentralizepy.sharing.Sharing import Sharing
+from decentralizepy.sharing.SparseAccumulator import SparseAccumulator
+from decentralizepy.sharing.TopK import TopK
 from decentralizepy.utils import conditional_value, identity
 
 
@@ -101,6 +103,7 @@ class PartialModel(Sharing):
         self.save_accumulated = conditional_value(save_accumulated, "", False)
         self.change_transformer = change_transformer
         self.accumulate_averaging_changes = accumulate_averaging_changes
+        self.topk = TopK()
 
         # getting the initial model
         self.shapes = []
@@ -119,11 +122,19 @@ class PartialModel(Sharing):
                 )
                 self.prev = self.init_model
         self.number_of_params = self.init_model.shape[0]
+        # Created by the first _averaging, subclasses that average in another
+        # domain set their own
+        self.accumulator = None
+        order = list(self.model.state_dict().keys())
+        shapes = {k: list(v.shape) for k, v in self.model.state_dict().items()}
         if self.save_accumulated:
             self.model_change_path = os.path.join(
                 self.log_dir, "model_change/{}".format(self.rank)
             )
             Path(self.model_change_path).mkdir(parents=True, exist_ok=True)
+            self.model_change_log = ParameterLog(
+                os.path.join(self.model_change_path, "model_change"), order, shapes
+            )
 
             self.model_val_path = os.path.join(
                 self.log_dir, "model_val/{}".format(self.rank)
@@ -139,6 +150,9 @@ class PartialModel(Sharing):
                 self.log_dir, "shared_params/{}".format(self.rank)
             )
             Path(self.folder_path).mkdir(parents=True, exist_ok=True)
+            self.shared_log = ParameterLog(
+                os.path.join(self.folder_path, "shared_params"), order, shapes
+            )
 
         self.model.shared_parameters_counter = torch.zeros(
             self.change_transformer(self.init_model).shape[0], dtype=torch.int32
@@ -178,12 +192,8 @@ class PartialModel(Sharing):
         std, mean = torch.std_mean(G_topk, unbiased=False)
         self.std = std.item()
         self.mean = mean.item()
-        _, index = torch.topk(
-            G_topk, round(self.alpha * G_topk.shape[0]), dim=0, sorted=True
-        )
-
-        index, _ = torch.sort(index)
-        return _, index
+        index = self.topk.select_fraction(G_topk, self.alpha)
+        return G_topk[index], index
 
     def serialized_model(self):
         """
@@ -208,23 +218,9 @@ class PartialModel(Sharing):
             if self.accumulation:
                 self.model.rewind_accumulation(G_topk)
             if self.save_shared:
-                shared_params = dict()
-                shared_params["order"] = list(self.model.state_dict().keys())
-                shapes = dict()
-                for k, v in self.model.state_dict().items():
-                    shapes[k] = list(v.shape)
-                shared_params["shapes"] = shapes
-
-                shared_params[self.communication_round] = G_topk.tolist()
-
-                with open(
-                    os.path.join(
-                        self.folder_path,
-                        "{}_shared_params.json".format(self.communication_round + 1),
-                    ),
-                    "w",
-                ) as of:
-                    json.dump(shared_params, of)
+                self.shared_log.append_indices(
+                    self.communication_round, G_topk, self.alpha
+                )
 
             logging.debug("Extracting topk params")
 
@@ -302,6 +298,73 @@ class PartialModel(Sharing):
 
             return state_dict
 
+    def deserialized_sparse(self, m):
+        """
+        Convert received dict to a sparse flat vector.
+
+        Parameters
+        ----------
+        m : dict
+            dict received
+
+        Returns
+        -------
+        tuple
+            (indices, values). indices is None if the whole model was received.
+
+        """
+        with torch.no_grad():
+            if "send_partial" not in m:
+                state_dict = super().deserialized_model(m)
+                return None, torch.cat([v.flatten() for v in state_dict.values()])
+            m = self.decompress_data(m)
+            indices = torch.tensor(m["indices"], dtype=torch.long)
+            return indices, torch.tensor(m["params"])
+
+    def _averaging(self, peer_deques):
+        """
+        Averages the received models with the local model. Coordinates a neighbor
+        did not send are taken from the local model.
+
+        """
+        with torch.no_grad():
+            if self.accumulator is None:
+                self.accumulator = SparseAccumulator(
+                    self.number_of_params, dtype=self.init_model.dtype
+                )
+            self.accumulator.reset()
+            for i, n in enumerate(peer_deques):
+                data = peer_deques[n].popleft()
+                degree, iteration = data["degree"], data["iteration"]
+                del data["degree"]
+                del data["iteration"]
+                del data["CHANNEL"]
+                logging.debug(
+                    "Averaging model from neighbor {} of iteration {}".format(
+                        n, iteration
+                    )
+                )
+                indices, values = self.deserialized_sparse(data)
+                # Metro-Hastings
+                weight = 1 / (max(len(peer_deques), degree) + 1)
+                self.accumulator.add(indices, values, weight)
+
+            tensors_to_cat = [
+                v.data.flatten() for _, v in self.model.state_dict().items()
+            ]
+            total = self.accumulator.average(torch.cat(tensors_to_cat, dim=0))
+
+            state_dict = self.model.state_dict()
+            start_index = 0
+            for i, key in enumerate(state_dict):
+                end_index = start_index + self.lens[i]
+                state_dict[key] = total[start_index:end_index].reshape(self.shapes[i])
+                start_index = end_index
+
+        self.model.load_state_dict(state_dict)
+        self._post_step()
+        self.communication_round += 1
+
     def _pre_step(self):
         """
         Called at the beginning of step.
@@ -352,39 +415,23 @@ class PartialModel(Sharing):
         if self.save_accumulated:
             self.save_change()
 
-    def save_vector(self, v, s):
+    def save_vector(self, v, log):
         """
-        Saves the given vector to the file.
+        Appends the given vector to a log.
 
         Parameters
         ----------
         v : torch.tensor
             The torch tensor to write to file
-        s : str
-            Path to folder to write to
+        log : decentralizepy.sharing.ParameterLog.ParameterLog
+            Log to append to
 
         """
-        output_dict = dict()
-        output_dict["order"] = list(self.model.state_dict().keys())
-        shapes = dict()
-        for k, v1 in self.model.state_dict().items():
-            shapes[k] = list(v1.shape)
-        output_dict["shapes"] = shapes
-
-        output_dict["tensor"] = v.tolist()
-
-        with open(
-            os.path.join(
-                s,
-                "{}.json".format(self.communication_round + 1),
-            ),
-            "w",
-        ) as of:
-            json.dump(output_dict, of)
+        log.append_vector(self.communication_round, v)
 
     def save_change(self):
         """
         Saves the change and the gradient values for every iteration
 
         """
-        self.save_vector(self.model.model_change, self.model_change_path)
+        self.save_vector(self.model.model_change, self.model_change_log)
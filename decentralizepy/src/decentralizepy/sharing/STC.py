@@ -7,6 +7,7 @@ import numpy as np
 import torch
 
 from decentralizepy.sharing.Sharing import Sharing
+from decentralizepy.sharing.TopK import TopK
 from decentralizepy.utils import conditional_value, identity
 
 
@@ -86,6 +87,7 @@ class STC(Sharing):
         self.alpha = alpha
         self.dict_ordered = dict_ordered
         self.change_transformer = change_transformer
+        self.topk = TopK()
 
         # getting the initial model
         self.shapes = []
@@ -181,11 +183,7 @@ class STC(Sharing):
 
         logging.debug("Returning topk gradients")
         G_topk = torch.abs(self.model.model_change)
-        _, index = torch.topk(
-            G_topk, round(self.alpha * G_topk.shape[0]), dim=0, sorted=True
-        )
-
-        index, _ = torch.sort(index)
+        index = self.topk.select_fraction(G_topk, self.alpha)
         return self.model.model_change[index], index
 
     def serialized_model(self):
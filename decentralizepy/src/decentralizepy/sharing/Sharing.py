@@ -191,6 +191,26 @@ class Sharing:
         self._post_step()
         self.communication_round += 1
 
+    def ready_neighbors(self, neighbors):
+        """
+        Neighbors that took the models sent to them before. Sending a new round
+        to the others would only queue it behind the stale ones.
+
+        Parameters
+        ----------
+        neighbors : iterable
+            Unique IDs of the neighbors of this round
+
+        Returns
+        -------
+        list
+            Unique IDs of the neighbors to send to
+
+        """
+        if not hasattr(self.communication, "has_room"):
+            return list(neighbors)
+        return [n for n in neighbors if self.communication.has_room(n)]
+
     def get_data_to_send(self, degree=None):
         self._pre_step()
         data = self.serialized_model()
@@ -0,0 +1,82 @@
+import torch
+
+
+class SparseAccumulator:
+    """
+    Weighted sum of sparse received vectors with per-coordinate weight totals.
+    A receiver of partial models fills the coordinates a neighbor did not send
+    with its own values, so the average of a coordinate is
+    local * (1 - sum of the weights of the neighbors that sent it) + weighted sum of the values sent.
+    Messages are added with index_add_, so the cost of a message scales with
+    the number of transmitted elements and no dense model-sized temporary is built.
+
+    """
+
+    def __init__(self, size, dtype=torch.float32):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        size : int
+            Length of the flat vectors
+        dtype : torch.dtype, optional
+            Type of the values, may be complex
+
+        """
+        self.sum = torch.zeros(size, dtype=dtype)
+        self.weights = torch.zeros(size, dtype=self.sum.real.dtype)
+
+    def reset(self):
+        """
+        Clears the accumulator for a new round
+
+        """
+        self.sum.zero_()
+        self.weights.zero_()
+
+    def add(self, indices, values, weight):
+        """
+        Adds a received vector
+
+        Parameters
+        ----------
+        indices : torch.Tensor or None
+            Indices of the values, None if the whole vector was received
+        values : torch.Tensor
+            Received values
+        weight : float
+            Weight of the sender
+
+        """
+        values = values.to(self.sum.dtype)
+        if indices is None:
+            self.sum.add_(values, alpha=weight)
+            self.weights += weight
+        else:
+            self.sum.index_add_(0, indices, values, alpha=weight)
+            self.weights.index_add_(
+                0,
+                indices,
+                torch.full((len(indices),), weight, dtype=self.weights.dtype),
+            )
+
+    def average(self, local):
+        """
+        Completes the average with the local vector. The result is stored in
+        self.sum and is valid until the next reset.
+
+        Parameters
+        ----------
+        local : torch.Tensor
+            Local flat vector
+
+        Returns
+        -------
+        torch.Tensor
+            The averaged flat vector
+
+        """
+        self.weights.neg_().add_(1)
+        self.sum.addcmul_(local, self.weights)
+        return self.sum
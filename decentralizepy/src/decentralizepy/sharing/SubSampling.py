@@ -6,6 +6,8 @@ from pathlib import Path
 import torch
 
 from decentralizepy.sharing.Sharing import Sharing
+from decentralizepy.sharing.SparseAccumulator import SparseAccumulator
+from decentralizepy.sharing.SubsamplingMasks import subsampling_masks
 
 
 class SubSampling(Sharing):
@@ -125,6 +127,9 @@ class SubSampling(Sharing):
         self.model.shared_parameters_counter = torch.zeros(
             self.init_model.shape[0], dtype=torch.int32
         )
+        self.accumulator = SparseAccumulator(
+            self.init_model.shape[0], dtype=self.init_model.dtype
+        )
 
     def apply_subsampling(self):
         """
@@ -139,47 +144,16 @@ class SubSampling(Sharing):
         """
 
         logging.debug("Returning subsampling gradients")
+        tensors_to_cat = [v.data.flatten() for _, v in self.model.state_dict().items()]
+        concated = torch.cat(tensors_to_cat, dim=0)
+
+        curr_seed = self.seed + self.communication_round  # is increased in step
+        indices = self.subsampling_indices(curr_seed, self.alpha)
+        subsample = concated[indices]
         if not self.layerwise:
-            tensors_to_cat = [
-                v.data.flatten() for _, v in self.model.state_dict().items()
-            ]
-            concated = torch.cat(tensors_to_cat, dim=0)
-
-            curr_seed = self.seed + self.communication_round  # is increased in step
-            self.random_generator.manual_seed(curr_seed)
-            # logging.debug("Subsampling seed for uid = " + str(self.uid) + " is: " + str(curr_seed))
-            # Or we could use torch.bernoulli
-            binary_mask = (
-                torch.rand(
-                    size=(concated.size(dim=0),), generator=self.random_generator
-                )
-                <= self.alpha
-            )
-            subsample = concated[binary_mask]
-            self.model.shared_parameters_counter[binary_mask] += 1
-            # logging.debug("Subsampling vector is of size: " + str(subsample.size(dim = 0)))
-            return (subsample, curr_seed, self.alpha)
-        else:
-            values_list = []
-            offsets = [0]
-            off = 0
-            curr_seed = self.seed + self.communication_round  # is increased in step
-            self.random_generator.manual_seed(curr_seed)
-            for _, v in self.model.state_dict().items():
-                flat = v.flatten()
-                binary_mask = (
-                    torch.rand(
-                        size=(flat.size(dim=0),), generator=self.random_generator
-                    )
-                    <= self.alpha
-                )
-                # TODO: support shared_parameters_counter
-                selected = flat[binary_mask]
-                values_list.append(selected)
-                off += selected.size(dim=0)
-                offsets.append(off)
-            subsample = torch.cat(values_list, dim=0)
-            return (subsample, curr_seed, self.alpha)
+            # TODO: support shared_parameters_counter for layerwise
+            self.model.shared_parameters_counter[indices] += 1
+        return (subsample, curr_seed, self.alpha)
 
     def serialized_model(self):
         """
@@ -232,6 +206,29 @@ class SubSampling(Sharing):
 
             return self.compress_data(m)
 
+    def subsampling_indices(self, seed, alpha):
+        """
+        Indices selected by the binary mask a node draws from the seed of its round.
+        Masks are served by the process-wide subsampling_masks, so each one is
+        drawn once per process.
+
+        Parameters
+        ----------
+        seed : int
+            Seed of the round
+        alpha : float
+            Fraction of the model shared
+
+        Returns
+        -------
+        torch.Tensor
+            Sorted indices of the flat model
+
+        """
+        return subsampling_masks.indices(
+            seed, alpha, self.lens, self.layerwise, self.communication_round
+        )
+
     def deserialized_model(self, m):
         """
         Convert received json dict to state_dict.
@@ -262,47 +259,84 @@ class SubSampling(Sharing):
             alpha = m["alpha"]
             params = m["params"]
 
-            random_generator = (
-                torch.Generator()
-            )  # new generator, such that we do not overwrite the other one
-            random_generator.manual_seed(seed)
-
-            shapes = []
-            lens = []
-            tensors_to_cat = []
-            binary_submasks = []
-            for _, v in state_dict.items():
-                shapes.append(v.shape)
-                t = v.flatten()
-                lens.append(t.shape[0])
-                tensors_to_cat.append(t)
-                if self.layerwise:
-                    binary_mask = (
-                        torch.rand(size=(t.size(dim=0),), generator=random_generator)
-                        <= alpha
-                    )
-                    binary_submasks.append(binary_mask)
-
+            tensors_to_cat = [v.flatten() for _, v in state_dict.items()]
             T = torch.cat(tensors_to_cat, dim=0)
 
             params_tensor = torch.from_numpy(params)
 
-            if not self.layerwise:
-                binary_mask = (
-                    torch.rand(size=(T.size(dim=0),), generator=random_generator)
-                    <= alpha
-                )
-            else:
-                binary_mask = torch.cat(binary_submasks, dim=0)
+            indices = self.subsampling_indices(seed, alpha)
 
-            logging.debug("Original tensor: {}".format(T[binary_mask]))
-            T[binary_mask] = params_tensor
-            logging.debug("Final tensor: {}".format(T[binary_mask]))
+            logging.debug("Original tensor: {}".format(T[indices]))
+            T[indices] = params_tensor
+            logging.debug("Final tensor: {}".format(T[indices]))
 
             start_index = 0
             for i, key in enumerate(state_dict):
-                end_index = start_index + lens[i]
-                state_dict[key] = T[start_index:end_index].reshape(shapes[i])
+                end_index = start_index + self.lens[i]
+                state_dict[key] = T[start_index:end_index].reshape(self.shapes[i])
                 start_index = end_index
 
             return state_dict
+
+    def deserialized_sparse(self, m):
+        """
+        Convert received json dict to a sparse flat vector.
+
+        Parameters
+        ----------
+        m : dict
+            json dict received
+
+        Returns
+        -------
+        tuple
+            (indices, values). indices is None if the whole model was received.
+
+        """
+        with torch.no_grad():
+            if self.alpha > self.metadata_cap:  # Share fully
+                state_dict = super().deserialized_model(m)
+                return None, torch.cat([v.flatten() for v in state_dict.values()])
+            m = self.decompress_data(m)
+            indices = self.subsampling_indices(m["seed"], m["alpha"])
+            return indices, torch.from_numpy(m["params"])
+
+    def _averaging(self, peer_deques):
+        """
+        Averages the received models with the local model. Coordinates a neighbor
+        did not send are taken from the local model.
+
+        """
+        with torch.no_grad():
+            self.accumulator.reset()
+            for i, n in enumerate(peer_deques):
+                data = peer_deques[n].popleft()
+                degree, iteration = data["degree"], data["iteration"]
+                del data["degree"]
+                del data["iteration"]
+                del data["CHANNEL"]
+                logging.debug(
+                    "Averaging model from neighbor {} of iteration {}".format(
+                        n, iteration
+                    )
+                )
+                indices, values = self.deserialized_sparse(data)
+                # Metro-Hastings
+                weight = 1 / (max(len(peer_deques), degree) + 1)
+                self.accumulator.add(indices, values, weight)
+
+            tensors_to_cat = [
+                v.data.flatten() for _, v in self.model.state_dict().items()
+            ]
+            total = self.accumulator.average(torch.cat(tensors_to_cat, dim=0))
+
+            state_dict = self.model.state_dict()
+            start_index = 0
+            for i, key in enumerate(state_dict):
+                end_index = start_index + self.lens[i]
+                state_dict[key] = total[start_index:end_index].reshape(self.shapes[i])
+                start_index = end_index
+
+        self.model.load_state_dict(state_dict)
+        self._post_step()
+        self.communication_round += 1
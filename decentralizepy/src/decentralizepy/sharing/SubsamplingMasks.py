@@ -0,0 +1,124 @@
+import logging
+
+import numpy as np
+import torch
+
+
+class SubsamplingMasks:
+    """
+    Process-wide service of the random masks of SubSampling.
+    A mask is fully determined by (seed, alpha, layerwise, layer lengths), so it
+    is drawn once per process and shared by the sender and all the receivers
+    in the same process. Masks are stored as sorted int32 indices when they are
+    sparse, and as a packed bitset otherwise. Entries of other rounds are
+    evicted as soon as the requested round changes.
+
+    """
+
+    def __init__(self):
+        """
+        Constructor
+
+        """
+        # key -> (round, kind, storage)
+        self.entries = dict()
+        self.round = None
+        self.hits = 0
+        self.misses = 0
+
+    def generate(self, seed, alpha, lens, layerwise):
+        """
+        Draws a mask exactly like the sender of SubSampling
+
+        Parameters
+        ----------
+        seed : int
+            Seed of the round
+        alpha : float
+            Fraction of the model shared
+        lens : list
+            Number of elements of every tensor of the state_dict
+        layerwise : bool
+            Draw the mask tensor by tensor
+
+        Returns
+        -------
+        torch.Tensor
+            Flat binary mask
+
+        """
+        random_generator = torch.Generator()
+        random_generator.manual_seed(seed)
+        if not layerwise:
+            return torch.rand(size=(sum(lens),), generator=random_generator) <= alpha
+        binary_submasks = []
+        for l in lens:
+            binary_mask = torch.rand(size=(l,), generator=random_generator) <= alpha
+            binary_submasks.append(binary_mask)
+        return torch.cat(binary_submasks, dim=0)
+
+    def evict(self, round):
+        """
+        Removes the masks of other rounds when the round changes
+
+        Parameters
+        ----------
+        round : int
+            Current communication round
+
+        """
+        if round == self.round:
+            return
+        self.round = round
+        stale = [key for key, (r, _, _) in self.entries.items() if r != round]
+        for key in stale:
+            del self.entries[key]
+
+    def indices(self, seed, alpha, lens, layerwise, round):
+        """
+        Indices selected by a mask
+
+        Parameters
+        ----------
+        seed : int
+            Seed of the round
+        alpha : float
+            Fraction of the model shared
+        lens : list
+            Number of elements of every tensor of the state_dict
+        layerwise : bool
+            Draw the mask tensor by tensor
+        round : int
+            Communication round of the caller, used for eviction
+
+        Returns
+        -------
+        torch.Tensor
+            Sorted indices of the mask
+
+        """
+        self.evict(round)
+        key = (seed, alpha, layerwise, tuple(lens))
+        if key in self.entries:
+            self.hits += 1
+            _, kind, storage = self.entries[key]
+            if kind == "indices":
+                return torch.from_numpy(storage).long()
+            mask = np.unpackbits(storage, count=sum(lens))
+            return torch.from_numpy(np.flatnonzero(mask))
+
+        self.misses += 1
+        mask = self.generate(seed, alpha, lens, layerwise)
+        indices = torch.nonzero(mask).flatten()
+        if 4 * len(indices) <= len(mask) // 8:
+            self.entries[key] = (round, "indices", indices.numpy().astype(np.int32))
+        else:
+            self.entries[key] = (round, "bitset", np.packbits(mask.numpy()))
+        logging.debug(
+            "Subsampling mask cache hits: {}, misses: {}".format(self.hits, self.misses)
+        )
+        return indices
+
+
+# Shared by all the SubSampling instances of the process
+subsampling_masks = SubsamplingMasks()
@@ -0,0 +1,164 @@
+import logging
+import math
+
+import torch
+
+
+class TopK:
+    """
+    Top-k selection shared by the sparsifying sharing schemes.
+    The k-th largest magnitude is estimated from a random sample, the vector
+    is filtered block by block against a slightly lower threshold and the exact
+    top-k is then selected among the few surviving candidates. The filter keeps
+    the position order, so the indices come out sorted without a sort.
+    Falls back to an exact selection when the vector is small or the
+    estimated threshold keeps fewer than k entries.
+
+    """
+
+    def __init__(
+        self,
+        sample_size=2**16,
+        block_size=2**22,
+        exact_below=2**17,
+        margin=4.0,
+        seed=90,
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        sample_size : int, optional
+            Number of entries sampled to estimate the threshold
+        block_size : int, optional
+            Number of entries filtered at once
+        exact_below : int, optional
+            Vectors shorter than this use the exact selection
+        margin : float, optional
+            Safety margin of the threshold in standard deviations of the sampled quantile
+        seed : int, optional
+            Seed of the sampling generator, separate from the global torch generator
+
+        """
+        self.sample_size = sample_size
+        self.block_size = block_size
+        self.exact_below = exact_below
+        self.margin = margin
+        self.generator = torch.Generator()
+        self.generator.manual_seed(seed)
+        self.fallbacks = 0
+
+    def keep_largest(self, values, k):
+        """
+        Mask of the k largest values. Ties at the k-th value are broken by position.
+
+        Parameters
+        ----------
+        values : torch.Tensor
+            1-D real tensor
+        k : int
+            Number of values to keep, 0 < k <= len(values)
+
+        Returns
+        -------
+        torch.Tensor
+            Boolean mask with exactly k True entries
+
+        """
+        kth, _ = torch.kthvalue(values, values.shape[0] - k + 1)
+        keep = values > kth
+        ties = values == kth
+        missing = k - int(keep.sum())
+        keep |= ties & (torch.cumsum(ties, dim=0) <= missing)
+        return keep
+
+    def threshold(self, magnitudes, k):
+        """
+        Lower estimate of the k-th largest magnitude
+
+        Parameters
+        ----------
+        magnitudes : torch.Tensor
+            1-D real tensor
+        k : int
+            Number of values to select
+
+        Returns
+        -------
+        float
+            Threshold expected to keep slightly more than k entries
+
+        """
+        n = magnitudes.shape[0]
+        sample = magnitudes[
+            torch.randint(n, (self.sample_size,), generator=self.generator)
+        ]
+        p = k / n
+        expected = p * self.sample_size
+        slack = self.margin * math.sqrt(p * (1 - p) * self.sample_size) + 1
+        rank = min(math.ceil(expected + slack), self.sample_size)
+        kth, _ = torch.kthvalue(sample, self.sample_size - rank + 1)
+        return kth.item()
+
+    def select(self, magnitudes, k):
+        """
+        Indices of the k largest magnitudes
+
+        Parameters
+        ----------
+        magnitudes : torch.Tensor
+            1-D real tensor, typically the absolute model change
+        k : int
+            Number of indices to select
+
+        Returns
+        -------
+        torch.Tensor
+            The indices in increasing order
+
+        """
+        n = magnitudes.shape[0]
+        if k <= 0:
+            return torch.zeros(0, dtype=torch.long)
+        if k >= n:
+            return torch.arange(n)
+        if n < self.exact_below or self.sample_size >= n:
+            return torch.nonzero(self.keep_largest(magnitudes, k)).flatten()
+
+        threshold = self.threshold(magnitudes, k)
+        candidates = []
+        for start in range(0, n, self.block_size):
+            block = magnitudes[start : start + self.block_size]
+            candidates.append(torch.nonzero(block >= threshold).flatten() + start)
+        candidates = torch.cat(candidates)
+        if candidates.shape[0] < k:
+            self.fallbacks += 1
+            logging.debug(
+                "TopK threshold kept {} < {} entries, using exact selection".format(
+                    candidates.shape[0], k
+                )
+            )
+            return torch.nonzero(self.keep_largest(magnitudes, k)).flatten()
+        if candidates.shape[0] == k:
+            return candidates
+        return candidates[self.keep_largest(magnitudes[candidates], k)]
+
+    def select_fraction(self, magnitudes, alpha):
+        """
+        Indices of the round(alpha * len(magnitudes)) largest magnitudes
+
+        Parameters
+        ----------
+        magnitudes : torch.Tensor
+            1-D real tensor
+        alpha : float
+            Fraction of the entries to select
+
+        Returns
+        -------
+        torch.Tensor
+            The indices in increasing order
+
+        """
+        return self.select(magnitudes, round(alpha * magnitudes.shape[0]))
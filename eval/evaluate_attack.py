@@ -1,248 +1,289 @@
-import json
 import os
 import sys
+from multiprocessing import Pool
 
 import matplotlib.pyplot as plt
 import pandas as pd
 import torch
 from matplotlib.ticker import MaxNLocator
-from sklearn.metrics import roc_auc_score, roc_curve
 
 MUFFLIATO_ROUNDS = 10
+TABLE_CACHE_FILE = "attack_table.pkl"
+TABLE_COLUMNS = [
+    "file",
+    "mtime",
+    "algorithm",
+    "attack",
+    "victim",
+    "iteration",
+    "attacker",
+    "score",
+]
+
+
+def rank_auc(scores_in, scores_out):
+    """
+    Vectorized rank-based (Mann-Whitney U) ROC AUC over a batch of attacks.
+    Ties are counted as 0.5, which matches sklearn.metrics.roc_auc_score.
+
+    Parameters
+    ----------
+    scores_in : torch.Tensor
+        [G, n_in] scores of the members for G attacks
+    scores_out : torch.Tensor
+        [G, n_out] scores of the non-members for G attacks
+
+    Returns
+    -------
+    torch.Tensor
+        [G] AUC of each attack
+
+    """
+    scores_in = scores_in.to(torch.float64)
+    scores_out = scores_out.to(torch.float64)
+    n_in = scores_in.shape[1]
+    n_out = scores_out.shape[1]
+    sorted_all, _ = torch.sort(torch.cat((scores_in, scores_out), dim=1), dim=1)
+    # Average 1-based rank of every member among all the samples
+    left = torch.searchsorted(sorted_all, scores_in, right=False)
+    right = torch.searchsorted(sorted_all, scores_in, right=True)
+    rank_sum = ((left + right + 1).to(torch.float64) / 2).sum(dim=1)
+    return (rank_sum - n_in * (n_in + 1) / 2) / (n_in * n_out)
+
+
+def _flatten_attacker_file(args):
+    """
+    Loads one `_attacker.pth` file and flattens it into table rows.
+    MIA attacks are reduced to their AUC right away (batched over all attacks
+    with the same number of in/out samples), linkability attacks keep the
+    predicted client.
+
+    Parameters
+    ----------
+    args : tuple
+        (algorithm, torch_file_path, mtime)
+
+    Returns
+    -------
+    list
+        Rows in the order of TABLE_COLUMNS
+
+    """
+    algorithm, torch_file_path, mtime = args
+    torch.set_num_threads(1)
+    attacker = int(os.path.basename(torch_file_path).split("_")[0])
+    rows = []
+    try:
+        attacker_File = torch.load(torch_file_path)
+    except (FileNotFoundError, EOFError, RuntimeError) as e:
+        print(f"Could not load {torch_file_path}: {e}")
+        return rows
+
+    for attack, victims in attacker_File.items():
+        mia_groups = {}
+        for victim_client, iterations in victims.items():
+            if "iterations" in iterations:
+                iterations = iterations["iterations"]
+            for iteration, attacks_by_attacker in iterations.items():
+                for result in attacks_by_attacker:
+                    key = (attack, victim_client, iteration)
+                    if isinstance(result, dict) and "in" in result:
+                        shape = (result["in"].numel(), result["out"].numel())
+                        mia_groups.setdefault(shape, []).append((key, result))
+                    elif not isinstance(result, torch.Tensor):
+                        score = float("nan") if result is None else float(result)
+                        rows.append(
+                            [torch_file_path, mtime, algorithm, *key, attacker, score]
+                        )
+
+        for group in mia_groups.values():
+            scores_in = torch.stack([r["in"].flatten() for _, r in group])
+            scores_out = torch.stack([r["out"].flatten() for _, r in group])
+            aucs = rank_auc(scores_in, scores_out).tolist()
+            for (key, _), auc in zip(group, aucs):
+                rows.append([torch_file_path, mtime, algorithm, *key, attacker, auc])
+    return rows
+
+
+def process_directory(directory_path, processes=None, use_cache=True):
+    """
+    Builds the flat attack table of a results directory.
+    Every `_attacker.pth` file is loaded in a process pool. The table is
+    cached in the directory and only new or modified files are rescanned.
+
+    Parameters
+    ----------
+    directory_path : str
+        Directory with one subdirectory per algorithm
+    processes : int, optional
+        Number of worker processes, defaults to os.cpu_count()
+    use_cache : bool, optional
+        Reuse the cached table of unchanged files
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per (algorithm, attack, victim, iteration, attacker) result.
+        score is the AUC for MIA attacks and the predicted client for linkability.
+
+    """
+    jobs = []
+    for algorithm in sorted(os.listdir(directory_path)):
+        algorithm_path = os.path.join(directory_path, algorithm)
+        if not os.path.isdir(algorithm_path):
+            continue
+        print("Processing Path: ", algorithm_path)
+        machine_folders = [
+            machine_folder
+            for machine_folder in sorted(os.listdir(algorithm_path))
+            if machine_folder.startswith("machine")
+        ]
+        for machine in machine_folders:
+            machine_path = os.path.join(algorithm_path, machine)
+            if os.path.isdir(machine_path):
+                for filename in sorted(os.listdir(machine_path)):
+                    if filename.endswith("_attacker.pth"):
+                        torch_file_path = os.path.join(machine_path, filename)
+                        mtime = os.path.getmtime(torch_file_path)
+                        jobs.append((algorithm, torch_file_path, mtime))
+
+    cache_path = os.path.join(directory_path, TABLE_CACHE_FILE)
+    cached = pd.DataFrame(columns=TABLE_COLUMNS)
+    if use_cache and os.path.isfile(cache_path):
+        cached = pd.read_pickle(cache_path)
+        current = {path: mtime for _, path, mtime in jobs}
+        cached = cached[
+            cached["file"].map(current).eq(cached["mtime"])
+        ]  # Drops rows of deleted or modified files
+    done = set(cached["file"].unique())
+    jobs = [job for job in jobs if job[1] not in done]
+    print("Cached files: {}, files to scan: {}".format(len(done), len(jobs)))
+
+    rows = []
+    if len(jobs) > 0:
+        with Pool(processes=processes) as pool:
+            for file_rows in pool.imap_unordered(_flatten_attacker_file, jobs):
+                rows.extend(file_rows)
+
+    table = pd.concat(
+        [cached, pd.DataFrame(rows, columns=TABLE_COLUMNS)], ignore_index=True
+    )
+    table["score"] = table["score"].astype("float64")
+    if len(jobs) > 0:
+        table.to_pickle(cache_path)
+    return table
+
+
+def _grouped_stats(series, by):
+    stats = series.groupby(by, sort=False).agg(["mean", "std", "count"])
+    return (
+        torch.tensor(stats["mean"].to_numpy()),
+        torch.tensor(stats["std"].to_numpy()),
+        torch.tensor(stats["count"].to_numpy()),
+        stats.index,
+    )
 
-def process_directory(directory_path):
-    attack_dicts_algorithms = {}
 
-    algorithms = sorted(os.listdir(directory_path))
+def get_auc_means_clients(attack_table):
+    auc_means_clients, auc_stdev_clients, counts, _ = _grouped_stats(
+        attack_table["score"], attack_table["victim"]
+    )
+    auc_means_clients, sort_indices = torch.sort(auc_means_clients, descending=False)
+    return auc_means_clients, auc_stdev_clients[sort_indices], counts[sort_indices]
 
-    for algorithm in algorithms:
-        algorithm_path = os.path.join(directory_path, algorithm)
-        print("Processing Path: ", algorithm_path)
-        if os.path.isdir(algorithm_path):
-            attack_dicts_algorithms[algorithm] = {}
-            machine_folders = os.listdir(algorithm_path)
-            machine_folders = [
-                machine_folder
-                for machine_folder in machine_folders
-                if machine_folder.startswith("machine")
-            ]
-            for machine in machine_folders:
-                machine_path = os.path.join(algorithm_path, machine)
-                print("Processing machine path: ", machine_path)
-                if os.path.isdir(machine_path):
-                    for filename in os.listdir(machine_path):
-                        if filename.endswith("_attacker.pth"):
-                            torch_file_path = os.path.join(machine_path, filename)
-
-                            try:
-                                attacker_File = torch.load(torch_file_path)
-                                for attack in attacker_File.keys():
-                                    if attack not in attack_dicts_algorithms[algorithm]:
-                                        attack_dicts_algorithms[algorithm][attack] = {}
-                                    for victim_client in attacker_File[attack].keys():
-                                        if (
-                                            victim_client
-                                            not in attack_dicts_algorithms[algorithm][
-                                                attack
-                                            ]
-                                        ):
-                                            attack_dicts_algorithms[algorithm][attack][
-                                                victim_client
-                                            ] = {}
-                                        for iteration in attacker_File[attack][
-                                            victim_client
-                                        ].keys():
-                                            if (
-                                                iteration
-                                                not in attack_dicts_algorithms[
-                                                    algorithm
-                                                ][attack][victim_client]
-                                            ):
-                                                attack_dicts_algorithms[algorithm][
-                                                    attack
-                                                ][victim_client][iteration] = []
-                                            attack_dicts_algorithms[algorithm][attack][
-                                                victim_client
-                                            ][iteration].extend(
-                                                attacker_File[attack][victim_client][
-                                                    iteration
-                                                ]
-                                            )
-
-                            except FileNotFoundError:
-                                print(f"File not found: {torch_file_path}")
-
-                            except json.JSONDecodeError:
-                                print(
-                                    f"Error decoding JSON in the file: {torch_file_path}"
-                                )
-    return attack_dicts_algorithms
-
-
-def get_roc_auc(a):
-    num_true = a["in"].numel()
-    num_false = a["out"].numel()
-
-    print("Number of non-training samples: ", num_false)
-
-    y_true_balanced = torch.zeros((num_true + num_false,), dtype=torch.int32)
-    y_true_balanced[:num_true] = 1
-
-    y_pred = a
-    y_pred_balanced = torch.zeros((num_true + num_false,), dtype=torch.float32)
-    y_pred_balanced[:num_true] = a["in"]
-    y_pred_balanced[num_true:] = y_pred["out"]
-
-    # # Use the balanced y_pred for the ROC curve
-    y_pred = y_pred_balanced.numpy()
-    y_true = y_true_balanced.numpy()
-    print("Shapes: ", y_pred.shape, y_true.shape)
-
-    fpr, tpr, thresholds = roc_curve(y_true, y_pred)
-    roc_auc = roc_auc_score(y_true, y_pred)
-    return fpr, tpr, thresholds, roc_auc
-
-
-def get_auc_means_clients(attack_dict):
-    auc_means_clients = []
-    auc_stdev_clients = []
-    counts = []
-    for victim_client in attack_dict:
-        aucs = []
-        iterations_to_attack = sorted(list(attack_dict[victim_client].keys()))
-        for iteration in iterations_to_attack:
-            if iteration in attack_dict[victim_client].keys():
-                for attack_by_each_attacker in attack_dict[victim_client][iteration]:
-                    _, _, _, roc_auc = get_roc_auc(attack_by_each_attacker)
-                    aucs.append(roc_auc)
-
-        aucs = torch.tensor(aucs)
-        auc_means_clients.append(torch.mean(aucs))
-        auc_stdev_clients.append(torch.std(aucs))
-        counts.append(aucs.numel())
-    auc_means_clients, sort_indices = torch.sort(
-        torch.tensor(auc_means_clients), descending=False
+
+def get_auc_means_iterations(attack_table, iterations_to_attack):
+    stats = (
+        attack_table.groupby("iteration")["score"]
+        .agg(["mean", "std", "count"])
+        .reindex(iterations_to_attack)
+    )
+    return (
+        torch.tensor(stats["mean"].to_numpy()),
+        torch.tensor(stats["std"].to_numpy()),
+        torch.tensor(stats["count"].fillna(0).to_numpy(), dtype=torch.int64),
+    )
+
+
+def _linkability_per_iteration(attack_table):
+    correct = attack_table["score"] == attack_table["victim"]
+    return correct.groupby(
+        [attack_table["victim"], attack_table["iteration"]], sort=False
+    ).mean()
+
+
+def get_linkability_means_clients(attack_table):
+    linkabilities = _linkability_per_iteration(attack_table)
+    linkability_means_clients, linkability_stdev_clients, counts, _ = _grouped_stats(
+        linkabilities, linkabilities.index.get_level_values("victim")
     )
-    auc_stdev_clients = torch.tensor(auc_stdev_clients)[sort_indices]
-    counts = torch.tensor(counts)[sort_indices]
-    return auc_means_clients, auc_stdev_clients, counts
-
-
-def get_auc_means_iterations(attack_dict, iterations_to_attack):
-    auc_means_iterations = []
-    auc_stdev_iterations = []
-    counts = []
-    for iteration in iterations_to_attack:
-        aucs = []
-        for victim_client in attack_dict:
-            if iteration in attack_dict[victim_client].keys():
-                for attack_by_each_attacker in attack_dict[victim_client][iteration]:
-                    _, _, _, roc_auc = get_roc_auc(attack_by_each_attacker)
-                    aucs.append(roc_auc)
-
-        aucs = torch.tensor(aucs)
-        auc_means_iterations.append(torch.mean(aucs))
-        auc_stdev_iterations.append(torch.std(aucs))
-        counts.append(aucs.numel())
-
-    auc_means_iterations = torch.tensor(auc_means_iterations)
-    auc_stdev_iterations = torch.tensor(auc_stdev_iterations)
-    counts = torch.tensor(counts)
-    return auc_means_iterations, auc_stdev_iterations, counts
-
-
-def get_linkability_means_clients(attack_dict):
-    linkability_means_clients = []
-    linkability_stdev_clients = []
-    counts = []
-    for victim_client in attack_dict:
-        linkabilities = []
-        iterations_to_attack = sorted(list(attack_dict[victim_client].keys()))
-        for iteration in iterations_to_attack:
-            if iteration in attack_dict[victim_client].keys():
-                correct_pred = 0
-                total_pred = 0
-                for attack_by_each_attacker in attack_dict[victim_client][iteration]:
-                    if attack_by_each_attacker == victim_client:
-                        correct_pred += 1
-                    total_pred += 1
-                linkabilities.append(correct_pred / total_pred)
-        linkabilities = torch.tensor(linkabilities)
-        linkability_means_clients.append(torch.mean(linkabilities))
-        linkability_stdev_clients.append(torch.std(linkabilities))
-        counts.append(linkabilities.shape[0])
     linkability_means_clients, sort_indices = torch.sort(
-        torch.tensor(linkability_means_clients), descending=False
+        linkability_means_clients, descending=False
     )
-    linkability_stdev_clients = torch.tensor(linkability_stdev_clients)[sort_indices]
-    counts = torch.tensor(counts)[sort_indices]
+    linkability_stdev_clients = linkability_stdev_clients[sort_indices]
+    counts = counts[sort_indices]
     return linkability_means_clients, linkability_stdev_clients, counts
 
 
-def get_linkability_means_iterations(attack_dict, iterations_to_attack):
-    linkability_means_clients = []
-    linkability_stdev_clients = []
-    counts = []
-    for iteration in iterations_to_attack:
-        linkabilities = []
-        for victim_client in attack_dict:
-            if iteration in attack_dict[victim_client].keys():
-                correct_pred = 0
-                total_pred = 0
-                for attack_by_each_attacker in attack_dict[victim_client][iteration]:
-                    if attack_by_each_attacker == victim_client:
-                        correct_pred += 1
-                    total_pred += 1
-                linkabilities.append(correct_pred / total_pred)
-        linkabilities = torch.tensor(linkabilities)
-        linkability_means_clients.append(torch.mean(linkabilities))
-        linkability_stdev_clients.append(torch.std(linkabilities))
-        counts.append(linkabilities.shape[0])
+def get_linkability_means_iterations(attack_table, iterations_to_attack):
+    linkabilities = _linkability_per_iteration(attack_table)
+    stats = (
+        linkabilities.groupby(level="iteration")
+        .agg(["mean", "std", "count"])
+        .reindex(iterations_to_attack)
+    )
     linkability_means_clients, sort_indices = torch.sort(
-        torch.tensor(linkability_means_clients), descending=False
+        torch.tensor(stats["mean"].to_numpy()), descending=False
     )
-    linkability_stdev_clients = torch.tensor(linkability_stdev_clients)[sort_indices]
-    counts = torch.tensor(counts)
+    linkability_stdev_clients = torch.tensor(stats["std"].to_numpy())[sort_indices]
+    counts = torch.tensor(stats["count"].fillna(0).to_numpy(), dtype=torch.int64)
     return linkability_means_clients, linkability_stdev_clients, counts
 
 
+def get_iterations_to_attack(attack_table):
+    evaluating_client = attack_table["victim"].iloc[0]
+    return sorted(
+        attack_table.loc[
+            attack_table["victim"] == evaluating_client, "iteration"
+        ].unique()
+    )
+
+
 if __name__ == "__main__":
 
-    # Check if there are 2 arguments
-    if len(sys.argv) != 2:
-        print("Usage: python evaluate_attack.py <root_directory of the dataset>")
+    # Check if there are 2 or 3 arguments
+    if len(sys.argv) not in (2, 3):
+        print(
+            "Usage: python evaluate_attack.py <root_directory of the dataset> [num_processes]"
+        )
         sys.exit(1)
     root_directory = sys.argv[1]
+    processes = int(sys.argv[2]) if len(sys.argv) == 3 else None
 
     random_seed = 90
-    attack_dict_vnodes = process_directory(root_directory)
+    attack_table = process_directory(root_directory, processes=processes)
 
     # MIA Attack
     print("Processing MIA Attack")
     print("---------------------")
 
-    evaluating_client = 0
-    attack_dicts = {
-        key: value["loss_vals"] for key, value in attack_dict_vnodes.items()
+    attack_tables = {
+        label: table
+        for label, table in attack_table[attack_table["attack"] == "loss_vals"].groupby(
+            "algorithm"
+        )
     }
 
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
 
-    for label in attack_dicts:
-        if "iterations" in attack_dicts[label][evaluating_client].keys():
-            iterations_to_attack = sorted(
-                list(attack_dicts[label][evaluating_client]["iterations"].keys())
-            )
-        else:
-            iterations_to_attack = sorted(
-                list(attack_dicts[label][evaluating_client].keys())
-            )
-            clients = torch.arange(len(list(attack_dicts[label].keys()))) + 1
+    for label in attack_tables:
+        iterations_to_attack = get_iterations_to_attack(attack_tables[label])
+        clients = torch.arange(attack_tables[label]["victim"].nunique()) + 1
         auc_means_clients, auc_stdev_clients, counts_clients = get_auc_means_clients(
-            attack_dicts[label]
+            attack_tables[label]
         )
         auc_means_iterations, auc_stdev_iterations, counts_iterations = (
-            get_auc_means_iterations(attack_dicts[label], iterations_to_attack)
+            get_auc_means_iterations(attack_tables[label], iterations_to_attack)
         )
 
         # Write the Clients AUCs to a csv file. Use pandas to write to csv file. Also include a column for counts_clients
@@ -307,32 +348,23 @@ if __name__ == "__main__":
     print("Processing Linkability Attack")
     print("---------------------")
 
-    attack_dicts = {
-        key: value["linkability"] for key, value in attack_dict_vnodes.items()
+    attack_tables = {
+        label: table
+        for label, table in attack_table[
+            attack_table["attack"] == "linkability"
+        ].groupby("algorithm")
     }
 
-    evaluating_client = 0
-
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
 
-    for label in attack_dicts:
-        iterations_to_attack = sorted(
-            list(attack_dicts[label][evaluating_client].keys())
-        )
-        if "iterations" in attack_dicts[label][evaluating_client].keys():
-            iterations_to_attack = sorted(
-                list(attack_dicts[label][evaluating_client]["iterations"].keys())
-            )
-            clients = torch.arange(len(list(attack_dicts[label].keys()))) + 1
-        else:
-            iterations_to_attack = sorted(
-                list(attack_dicts[label][evaluating_client].keys())
-            )
+    for label in attack_tables:
+        iterations_to_attack = get_iterations_to_attack(attack_tables[label])
+        clients = torch.arange(attack_tables[label]["victim"].nunique()) + 1
         mean_clients, std_clients, counts_clients = get_linkability_means_clients(
-            attack_dicts[label]
+            attack_tables[label]
         )
         mean_iterations, std_iterations, counts_iterations = (
-            get_linkability_means_iterations(attack_dicts[label], iterations_to_attack)
+            get_linkability_means_iterations(attack_tables[label], iterations_to_attack)
         )
 
         # Write the Clients AUCs to a csv file. Use pandas to write to csv file. Also include a column for counts_clients
@@ -0,0 +1,60 @@
+import logging
+from pathlib import Path
+from shutil import copy
+
+from localconfig import LocalConfig
+
+from decentralizepy import utils
+from virtualNodes.mappings.VNodeLinear import VNodeLinear
+from virtualNodes.node.VNodeInProcess import VNodeInProcess
+
+
+def read_ini(file_path):
+    config = LocalConfig(file_path)
+    for section in config:
+        print("Section: ", section)
+        for key, value in config.items(section):
+            print((key, value))
+    print(dict(config.items("DATASET")))
+    return config
+
+
+if __name__ == "__main__":
+    # Runs the real and virtual nodes of all the machines in this process and
+    # [NODE] simulation_workers worker processes, without the peer sampler
+    args = utils.get_args()
+
+    Path(args.log_dir).mkdir(parents=True, exist_ok=True)
+
+    log_level = {
+        "INFO": logging.INFO,
+        "DEBUG": logging.DEBUG,
+        "WARNING": logging.WARNING,
+        "ERROR": logging.ERROR,
+        "CRITICAL": logging.CRITICAL,
+    }
+
+    config = read_ini(args.config_file)
+    my_config = dict()
+    for section in config:
+        my_config[section] = dict(config.items(section))
+
+    copy(args.config_file, args.log_dir)
+    utils.write_args(args, args.log_dir)
+
+    n_machines = args.machines
+    procs_per_machine = args.procs_per_machine[0]
+
+    l = VNodeLinear(n_machines, procs_per_machine)
+
+    VNodeInProcess(
+        l,
+        my_config,
+        args.iterations,
+        args.log_dir,
+        args.weights_store_dir,
+        log_level[args.log_level],
+        args.test_after,
+        args.train_evaluate_after,
+        args.reset_optimizer,
+    )
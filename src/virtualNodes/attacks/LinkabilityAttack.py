@@ -1,4 +1,5 @@
 import logging
+import math
 
 import torch
 
@@ -9,10 +10,70 @@ class LinkabilityAttack:
 
     """
 
-    def __init__(self, num_clients, client_trainsets, loss) -> None:
+    def __init__(
+        self,
+        num_clients,
+        client_trainsets,
+        loss,
+        adaptive=False,
+        initial_batches=1,
+        halving_rate=2,
+        confidence=2.0,
+    ) -> None:
+        """
+        Constructor
+
+        Parameters
+        ----------
+        num_clients : int
+            Number of clients
+        client_trainsets : dict
+            client -> training set of the client
+        loss : torch.nn.Module
+            Loss function
+        adaptive : bool, optional
+            Use the successive halving search instead of evaluating every training set
+        initial_batches : int, optional
+            Batches of every client evaluated in the first adaptive step
+        halving_rate : int, optional
+            Fraction of candidates kept and growth of the batches per adaptive step
+        confidence : float, optional
+            Width of the confidence bound in standard errors. The adaptive search
+            stops when the bounds of the leading candidate and the runner-up separate.
+
+        """
         self.num_clients = num_clients
         self.client_trainsets = client_trainsets
         self.loss = loss
+        self.adaptive = adaptive
+        self.initial_batches = initial_batches
+        self.halving_rate = halving_rate
+        self.confidence = confidence
+        self.samples_evaluated = 0
+
+    def eval_batch(self, model, batch):
+        """
+        Evaluate the mean loss on one batch
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            Model to evaluate
+        batch : tuple
+            (data, target)
+
+        Returns
+        -------
+        tuple
+            (mean loss, number of samples)
+
+        """
+        data, target = batch
+        if torch.cuda.is_available():
+            data = data.cuda()
+            target = target.cuda()
+        output = model(data)
+        return self.loss(output, target), len(target)
 
     def eval_loss(self, model, trainset):
         """
@@ -31,22 +92,20 @@ class LinkabilityAttack:
         epoch_loss = 0.0
         count = 0
         with torch.no_grad():
-            for data, target in trainset:
-                if torch.cuda.is_available():
-                    data = data.cuda()
-                    target = target.cuda()
-                output = model(data)
-                loss_val = self.loss(output, target)
-                epoch_loss = loss_val * len(target) + epoch_loss
-                count += len(target)
+            for batch in trainset:
+                loss_val, batch_len = self.eval_batch(model, batch)
+                epoch_loss = loss_val * batch_len + epoch_loss
+                count += batch_len
             loss = epoch_loss / count
             loss = loss.item()
             logging.debug("Loss after iteration: {}".format(loss))
+            self.samples_evaluated += count
             return loss
 
     def attack(self, model, skip=[]):
         """
         Function to mount linkability attack on the model.
+        The number of samples evaluated is left in self.samples_evaluated.
 
         Parameters
         ----------
@@ -59,6 +118,9 @@ class LinkabilityAttack:
             Dataset ID which is the most likely to be the dataset used to train the model.
 
         """
+        self.samples_evaluated = 0
+        if self.adaptive:
+            return self.attack_adaptive(model, skip=skip)
         with torch.no_grad():
             min_loss = 10e10
             predicted_client = None
@@ -69,3 +131,84 @@ class LinkabilityAttack:
                         min_loss = cur_loss
                         predicted_client = client
             return predicted_client
+
+    def attack_adaptive(self, model, skip=[]):
+        """
+        Linkability attack with successive halving. Every client is first scored
+        on its first batches, then only the leading candidates are evaluated on
+        more batches. The search stops when the confidence bounds of the leader
+        and the runner-up separate, or when one candidate is left.
+        Training sets are not shuffled, so the first batches are a fixed sample.
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            Model to be attacked.
+
+        Returns
+        -------
+        int
+            Dataset ID which is the most likely to be the dataset used to train the model.
+
+        """
+        # .cuda() moves the module in place, it is moved back before returning
+        device = next(model.parameters()).device
+        if torch.cuda.is_available():
+            model = model.cuda()
+        candidates = [c for c in self.client_trainsets if c not in skip]
+        iterators = {c: iter(self.client_trainsets[c]) for c in candidates}
+        # client -> [sum of batch losses, sum of squared batch losses, batches, samples, weighted loss]
+        stats = {c: [0.0, 0.0, 0, 0, 0.0] for c in candidates}
+        exhausted = set()
+
+        def mean(c):
+            return stats[c][4] / max(stats[c][3], 1)
+
+        def stderr(c):
+            total_batches = len(self.client_trainsets[c])
+            s, sq, b, _, _ = stats[c]
+            if c in exhausted or b >= total_batches:
+                return 0.0
+            if b < 2:
+                return math.inf
+            var = max(sq / b - (s / b) ** 2, 0.0) * b / (b - 1)
+            return math.sqrt(var / b * (1 - b / total_batches))
+
+        batches = self.initial_batches
+        with torch.no_grad():
+            while True:
+                for c in candidates:
+                    for _ in range(batches):
+                        try:
+                            batch = next(iterators[c])
+                        except StopIteration:
+                            exhausted.add(c)
+                            break
+                        loss_val, batch_len = self.eval_batch(model, batch)
+                        loss_val = loss_val.item()
+                        stats[c][0] += loss_val
+                        stats[c][1] += loss_val**2
+                        stats[c][2] += 1
+                        stats[c][3] += batch_len
+                        stats[c][4] += loss_val * batch_len
+                        self.samples_evaluated += batch_len
+
+                candidates.sort(key=mean)
+                if len(candidates) <= 1 or all(c in exhausted for c in candidates):
+                    break
+                leader, runner_up = candidates[0], candidates[1]
+                if (
+                    mean(leader) + self.confidence * stderr(leader)
+                    < mean(runner_up) - self.confidence * stderr(runner_up)
+                ):
+                    break
+                candidates = candidates[
+                    : max(2, math.ceil(len(candidates) / self.halving_rate))
+                ]
+                batches *= self.halving_rate
+
+        logging.debug(
+            "Adaptive linkability evaluated {} samples".format(self.samples_evaluated)
+        )
+        model.to(device)
+        return candidates[0] if len(candidates) > 0 else None
@@ -12,7 +12,33 @@ class LinkabilityAttackTwitter(LinkabilityAttack):
     """
 
     def __init__(self, num_clients, client_trainsets, *args, **kwargs) -> None:
-        super().__init__(num_clients, client_trainsets, loss=None)
+        kwargs.pop("loss", None)
+        super().__init__(num_clients, client_trainsets, None, **kwargs)
+
+    def eval_batch(self, model, batch):
+        """
+        Evaluate the mean loss on one batch
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            Model to evaluate
+        batch : dict
+            Tokenized batch with input_ids, attention_mask and labels
+
+        Returns
+        -------
+        tuple
+            (mean loss, number of samples)
+
+        """
+        if torch.cuda.is_available():
+            batch = {k: v.cuda() for k, v in batch.items()}
+        input_ids = batch["input_ids"]
+        attention_mask = batch["attention_mask"]
+        labels = batch["labels"]
+        outputs = model(input_ids, attention_mask=attention_mask, labels=labels)
+        return outputs[0], len(input_ids)
 
     def eval_loss(self, model, trainset):
         """
@@ -30,16 +56,11 @@ class LinkabilityAttackTwitter(LinkabilityAttack):
         count = 0
         with torch.no_grad():
             for batch in trainset:
-                if torch.cuda.is_available():
-                    batch = {k: v.cuda() for k, v in batch.items()}
-                input_ids = batch["input_ids"]
-                attention_mask = batch["attention_mask"]
-                labels = batch["labels"]
-                outputs = model(input_ids, attention_mask=attention_mask, labels=labels)
-                loss = outputs[0]
-                epoch_loss += loss * len(input_ids)
-                count += len(input_ids)
+                loss, batch_len = self.eval_batch(model, batch)
+                epoch_loss += loss * batch_len
+                count += batch_len
         loss = (epoch_loss / count).item()
+        self.samples_evaluated += count
         # logging.info("Loss after iteration: {}".format(loss))
         model = model.cpu()
         return loss
@@ -3,10 +3,11 @@ import torch.nn.functional as F
 
 
 class LOSSMIA:
-    def __init__(self):
+    def __init__(self, score_cache=None):
         self.device = (
             torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
         )
+        self.score_cache = score_cache
 
     def model_eval(self, model, data_samples, epsilon=10e-9):
         with torch.no_grad():
@@ -37,7 +38,21 @@ class LOSSMIA:
         in_size=70000,
         out_size=30000,
         epsilon=10e-9,
+        dataset_id=None,
     ):
+        if self.score_cache is not None and dataset_id is not None:
+            return self.score_cache.get_or_compute(
+                victim_model,
+                "loss_in{}_{}_{}".format(dataset_id, in_size, out_size),
+                lambda: self.attack_dataset(
+                    victim_model,
+                    in_dataloader,
+                    out_dataloader,
+                    in_size=in_size,
+                    out_size=out_size,
+                    epsilon=epsilon,
+                ),
+            )
         victim_model.eval()
         loss_vals = {
             "in": torch.zeros((in_size,), dtype=torch.float32, device=self.device),
@@ -1,11 +1,11 @@
 import json
+import math
 import os
 
 import torch
 import torch.nn.functional as F
 import torchvision
 import torchvision.transforms as transforms
-from torch.distributions import Normal
 from torch.optim import SGD, AdamW
 from torch.utils.data import DataLoader
 from tqdm import tqdm
@@ -30,6 +30,11 @@ class TwitterDataset:
         )
 
 
+def set_worker_threads(threads):
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(threads)
+
+
 class LiRATwitter:
 
     def __read_file__(self, file_path):
@@ -112,54 +117,113 @@ class LiRATwitter:
         #     self.dataset_size += dl[2]
         #     self.training_sets.append(TwitterDataset(dl[:2]))
 
+    def shadow_model_path(self, weights_store_dir, shadow_id):
+        return os.path.join(weights_store_dir, "shadow_{}".format(shadow_id))
+
+    def pending_shadow_models(self, weights_store_dir):
+        """
+        Shadow models that are not saved yet. Models are saved to a temporary
+        directory and renamed when complete, so an existing directory is a
+        complete model.
+
+        Parameters
+        ----------
+        weights_store_dir : str
+            Directory of the shadow models
+
+        Returns
+        -------
+        list
+            Ids of the shadow models still to train
+
+        """
+        return [
+            i
+            for i in range(self.K)
+            if not os.path.isdir(self.shadow_model_path(weights_store_dir, i))
+        ]
+
+    def train_shadow_model(self, i, epochs, weights_store_dir="./weights"):
+        print("Training shadow model ", i)
+        my_model = BERT()
+        optimizer = SGD(my_model.parameters(), lr=0.005)
+        training = LLMTraining(
+            0,
+            0,
+            None,
+            my_model,
+            optimizer,
+            None,
+            "./",
+            rounds=epochs,
+            full_epochs=True,
+            batch_size=64,
+            shuffle=True,
+        )
+        print("Loaded training ", i)
+        dl = TwitterDataset(self.dataloader_from_file(i)[:2])
+        print("Training partition loading complete.")
+        training.train(dl)
+        print("Completed training, saving model ", i)
+        model_path = self.shadow_model_path(weights_store_dir, i)
+        my_model.save_pretrained(model_path + ".tmp", from_pt=True)
+        os.replace(model_path + ".tmp", model_path)
+        return i
+
     def train_batch_shadow_models(
         self, start, count, epochs, weights_store_dir="./weights", is_parallel=False
     ):
         if is_parallel:
-            torch.set_num_threads(1)
-            torch.set_num_interop_threads(1)
+            set_worker_threads(1)
+        pending = self.pending_shadow_models(weights_store_dir)
         for i in range(start, min(start + count, self.K)):
-            print("Training shadow model ", i)
-            my_model = BERT()
-            optimizer = SGD(my_model.parameters(), lr=0.005)
-            training = LLMTraining(
-                0,
-                0,
-                None,
-                my_model,
-                optimizer,
-                None,
-                "./",
-                rounds=epochs,
-                full_epochs=True,
-                batch_size=64,
-                shuffle=True,
-            )
-            print("Loaded training ", i)
-            dl = TwitterDataset(self.dataloader_from_file(i)[:2])
-            print("Training partition loading complete.")
-            training.train(dl)
-            print("Completed training, saving model ", i)
-            my_model.save_pretrained(
-                os.path.join(weights_store_dir, "shadow_{}".format(i)), from_pt=True
-            )
+            if i in pending:
+                self.train_shadow_model(i, epochs, weights_store_dir)
+
+    def train_parallel_shadow_models(
+        self, epochs, weights_store_dir="./weights", threads_per_job=1
+    ):
+        """
+        Trains the shadow models that are not saved yet, one job per shadow
+        model. The pool is sized to the available cores divided by the
+        threads of each job.
+
+        Parameters
+        ----------
+        epochs : int
+            Training epochs of each shadow model
+        weights_store_dir : str, optional
+            Directory to save the shadow models in
+        threads_per_job : int, optional
+            torch threads used by each training job
 
-    def train_parallel_shadow_models(self, epochs, weights_store_dir="./weights"):
-        import math
-        import os
+        """
         from multiprocessing import Pool
 
-        number_of_processes = 4  # os.cpu_count()
-        pool = Pool(processes=number_of_processes)
-        for i in range(number_of_processes):
-            start = math.floor(i * self.K / number_of_processes)
-            count = math.floor(self.K / number_of_processes)
-            pool.apply_async(
-                self.train_batch_shadow_models,
-                args=(start, count, epochs, weights_store_dir, True),
+        pending = self.pending_shadow_models(weights_store_dir)
+        print(
+            "{} of {} shadow models already trained.".format(
+                self.K - len(pending), self.K
             )
-        pool.close()
-        pool.join()
+        )
+        if len(pending) == 0:
+            return
+        number_of_processes = min(
+            len(pending), max(1, len(os.sched_getaffinity(0)) // threads_per_job)
+        )
+        with Pool(
+            processes=number_of_processes,
+            initializer=set_worker_threads,
+            initargs=(threads_per_job,),
+        ) as pool:
+            jobs = [
+                pool.apply_async(
+                    self.train_shadow_model, args=(i, epochs, weights_store_dir)
+                )
+                for i in pending
+            ]
+            for job in jobs:
+                print("Saved shadow model ", job.get())
 
     # def load_shadow_models(self, weights_store_dir):
     #     shadow_model_dict = dict()
@@ -169,9 +233,24 @@ class LiRATwitter:
     #     return shadow_model_dict
 
 
+def gaussian_log_prob(x, mean, std):
+    return (
+        -((x - mean) ** 2) / (2 * std**2)
+        - torch.log(std)
+        - math.log(math.sqrt(2 * math.pi))
+    )
+
+
+def gaussian_cdf(x, mean, std):
+    return 0.5 * (1 + torch.erf((x - mean) * std.reciprocal() / math.sqrt(2)))
+
+
 class LiRAMIA:
-    def __init__(self, shadow_dataset_model: LiRATwitter, weights_store_dir):
+    def __init__(
+        self, shadow_dataset_model: LiRATwitter, weights_store_dir, score_cache=None
+    ):
         self.random_seed = 1234
+        self.score_cache = score_cache
         self.weights_store_dir = weights_store_dir
         self.shadow_dataset_model = shadow_dataset_model
         # self.shadow_model_dict = shadow_dataset_model.load_shadow_models(weights_store_dir=weights_store_dir)
@@ -194,12 +273,9 @@ class LiRAMIA:
             (self.shadow_dataset_model.K, self.trainset.train_y.shape[0]),
             dtype=torch.float32,
         )
-        if torch.cuda.is_available():
-            self.device = (
-                torch.device("cuda")
-                if torch.cuda.is_available()
-                else torch.device("cpu")
-            )
+        self.device = (
+            torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+        )
         self.confidences = self.confidences.to(self.device)
 
         self.index_ranges = dict()
@@ -210,6 +286,12 @@ class LiRAMIA:
             self.index_ranges[client] = (start_index, start_index + num_samples)
             start_index += num_samples
 
+        self.membership = None
+        self.mean_in = None
+        self.std_in = None
+        self.mean_out = None
+        self.std_out = None
+
     def model_confidence(self, model, data_samples, epsilon=10e-9):
         with torch.no_grad():
             model = model.to(self.device)
@@ -236,46 +318,163 @@ class LiRAMIA:
             # model = model.cpu()
             return torch.log(ratio), loss_val
 
+    def confidence_file_path(self):
+        return os.path.join(
+            self.weights_store_dir,
+            "confidences_clamped_seed{}_K{}.pt".format(
+                self.random_seed, self.shadow_dataset_model.K
+            ),
+        )
+
+    def statistics_file_path(self, confidence_file_path):
+        return "{}_stats.pt".format(os.path.splitext(confidence_file_path)[0])
+
     def load_shadow_confidences(self, confidence_file_path):
         self.confidences = torch.load(confidence_file_path).to(self.device)
         # if torch.cuda.is_available():
         #     self.confidences = self.confidences.cuda()
         # self.confidences = self.confidences.cpu()
+        statistics_file_path = self.statistics_file_path(confidence_file_path)
+        if os.path.isfile(statistics_file_path):
+            self.load_shadow_statistics(statistics_file_path)
+        else:
+            print("Shadow statistics not found. Computing them.")
+            self.precompute_shadow_statistics(statistics_file_path)
+
+    def membership_mask(self):
+        """
+        Membership of every sample of the trainset in the training set of
+        every shadow model.
+
+        Returns
+        -------
+        torch.Tensor
+            [K, N] boolean mask, True if sample n was used to train shadow model k
+
+        """
+        membership = torch.zeros(
+            (self.shadow_dataset_model.K, self.trainset.train_y.shape[0]),
+            dtype=torch.bool,
+        )
+        for shadow_id in range(self.shadow_dataset_model.K):
+            for file in self.shadow_dataset_model.training_partitions.use(shadow_id):
+                start, end = self.index_ranges[file[:-5]]
+                membership[shadow_id, start:end] = True
+        return membership
+
+    def precompute_shadow_statistics(self, statistics_file_path=None):
+        """
+        Computes the per-sample mean and standard deviation of the shadow
+        confidences when the sample is in and out of the shadow training set.
+        These only depend on the shadow models, so they are computed once and
+        stored next to the confidences.
+
+        Parameters
+        ----------
+        statistics_file_path : str, optional
+            Where to store the statistics, defaults to next to the confidences
+
+        """
+        if statistics_file_path is None:
+            statistics_file_path = self.statistics_file_path(
+                self.confidence_file_path()
+            )
+        membership = self.membership_mask()
+        confidences = self.confidences.cpu()
+        statistics = {"membership": membership}
+        for name, mask in (("in", membership), ("out", ~membership)):
+            count = mask.sum(dim=0)
+            mean = torch.where(mask, confidences, 0.0).sum(dim=0) / count
+            sq_dev = torch.where(mask, (confidences - mean) ** 2, 0.0)
+            statistics["mean_" + name] = mean
+            statistics["std_" + name] = torch.sqrt(sq_dev.sum(dim=0) / (count - 1))
+        torch.save(statistics, statistics_file_path)
+        self.load_shadow_statistics(statistics_file_path)
+
+    def load_shadow_statistics(self, statistics_file_path):
+        statistics = torch.load(statistics_file_path)
+        self.membership = statistics["membership"]
+        self.mean_in = statistics["mean_in"].to(self.device)
+        self.std_in = statistics["std_in"].to(self.device)
+        self.mean_out = statistics["mean_out"].to(self.device)
+        self.std_out = statistics["std_out"].to(self.device)
+
+    def shadow_confidence_file_path(self, shadow_id):
+        return "{}_shadow{}.pt".format(
+            os.path.splitext(self.confidence_file_path())[0], shadow_id
+        )
+
+    def load_shadow_model(self, shadow_id):
+        shadow_model = BERT(
+            path=self.shadow_dataset_model.shadow_model_path(
+                self.weights_store_dir, shadow_id
+            )
+        )
+        shadow_model.eval()
+        return shadow_model
 
     def precompute_shadow_confidences(self, batch_size=128):
+        """
+        Computes the confidences of every shadow model on the trainset.
+        The confidences of each shadow model are checkpointed, so an
+        interrupted run resumes at the first missing shadow model. The next
+        shadow model is loaded in the background while the current one runs.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            Inference batch size
+
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
         dataloader = self.trainset.get_trainset(batch_size=batch_size, shuffle=False)
 
+        pending = []
         for shadow_id in range(self.shadow_dataset_model.K):
-            shadow_model = BERT(
-                path=os.path.join(self.weights_store_dir, "shadow_{}".format(shadow_id))
+            checkpoint = self.shadow_confidence_file_path(shadow_id)
+            if os.path.isfile(checkpoint):
+                self.confidences[shadow_id] = torch.load(checkpoint).to(self.device)
+            else:
+                pending.append(shadow_id)
+        print(
+            "Resuming with {} of {} shadow confidences computed.".format(
+                self.shadow_dataset_model.K - len(pending),
+                self.shadow_dataset_model.K,
             )
-            last = 0
-            print("Precomputing confidences for shadow model ", shadow_id)
-            shadow_model.eval()
-            for data_samples in tqdm(dataloader, leave=True):
-                confidences, _ = self.model_confidence(shadow_model, data_samples)
-                cur_batch_len = confidences.shape[0]
-                self.confidences[shadow_id, last : last + cur_batch_len] = confidences
-                last += cur_batch_len
-            torch.save(
-                self.confidences,
-                os.path.join(
-                    self.weights_store_dir,
-                    "confidences_clamped_seed{}_K{}.pt".format(
-                        self.random_seed, self.shadow_dataset_model.K
-                    ),
-                ),
+        )
+
+        with ThreadPoolExecutor(max_workers=1) as loader:
+            next_model = (
+                loader.submit(self.load_shadow_model, pending[0])
+                if len(pending) > 0
+                else None
             )
+            for position, shadow_id in enumerate(pending):
+                shadow_model = next_model.result()
+                if position + 1 < len(pending):
+                    next_model = loader.submit(
+                        self.load_shadow_model, pending[position + 1]
+                    )
+                last = 0
+                print("Precomputing confidences for shadow model ", shadow_id)
+                for data_samples in tqdm(dataloader, leave=True):
+                    confidences, _ = self.model_confidence(shadow_model, data_samples)
+                    cur_batch_len = confidences.shape[0]
+                    self.confidences[shadow_id, last : last + cur_batch_len] = (
+                        confidences
+                    )
+                    last += cur_batch_len
+                torch.save(
+                    self.confidences[shadow_id].cpu(),
+                    self.shadow_confidence_file_path(shadow_id),
+                )
+                del shadow_model
         self.confidences = self.confidences.cpu()
-        torch.save(
-            self.confidences,
-            os.path.join(
-                self.weights_store_dir,
-                "confidences_clamped_seed{}_K{}.pt".format(
-                    self.random_seed, self.shadow_dataset_model.K
-                ),
-            ),
-        )
+        torch.save(self.confidences, self.confidence_file_path())
+        for shadow_id in range(self.shadow_dataset_model.K):
+            os.remove(self.shadow_confidence_file_path(shadow_id))
+        self.precompute_shadow_statistics()
 
     # def attack_batch(self, victim_model, data_indices : torch.Tensor, data_samples : torch.Tensor, epsilon = 10e-9):
     #     batch_size = len(data_indices)
@@ -342,87 +541,26 @@ class LiRAMIA:
         data_samples: torch.Tensor,
         epsilon=10e-9,
     ):
-        batch_size = len(data_indices)
         data_indices = data_indices.to(self.device)
-        confs_out = torch.zeros(
-            (batch_size, self.shadow_dataset_model.K // 2), device=self.device
-        )
-        confs_in = torch.zeros(
-            (batch_size, self.shadow_dataset_model.K // 2), device=self.device
-        )
-        in_indices = torch.zeros((batch_size,), dtype=torch.int32, device=self.device)
-        out_indices = torch.zeros((batch_size,), dtype=torch.int32, device=self.device)
-
-        for shadow_id in range(self.shadow_dataset_model.K):
-            my_clients = list(
-                map(
-                    lambda x: x[:-5],
-                    list(self.shadow_dataset_model.training_partitions.use(shadow_id)),
-                )
-            )
-            # print("my_clients: ", len(my_clients))
-            index_ranges = torch.tensor(
-                [self.index_ranges[client] for client in my_clients], device=self.device
-            )
-
-            in_partition = (
-                (data_indices[:, None] >= index_ranges[:, 0])
-                & (data_indices[:, None] < index_ranges[:, 1])
-            ).any(dim=1)
-
-            # print("in_partition: ", in_partition.shape, in_partition)
-            not_in_partition = ~in_partition
-            selected_confs = self.confidences[shadow_id, data_indices].to(self.device)
-            # print(selected_confs.shape, selected_confs[not_in_partition].shape, selected_confs[in_partition].shape)
-            rows_to_update_out = torch.where(not_in_partition)[0]
-            rows_to_update_in = torch.where(in_partition)[0]
-            # print("confs_out[not_in_partition, out_indices]", confs_out[rows_to_update_out, out_indices[rows_to_update_out]])
-            confs_out[rows_to_update_out, out_indices[rows_to_update_out]] = (
-                selected_confs[not_in_partition]
-            )
-            confs_in[rows_to_update_in, in_indices[rows_to_update_in]] = selected_confs[
-                in_partition
-            ]
-            out_indices[rows_to_update_out] += 1
-            in_indices[rows_to_update_in] += 1
-
-            # confs_out = torch.cat((confs_out, selected_confs[~in_partition].t()[None, :]), dim=0)
-            # confs_in = torch.cat((confs_in, selected_confs[in_partition].t()[None, :]), dim=0)
-
-        # confs_out = confs_out.t()
-        # confs_in = confs_in.t()
-        # print(confs_out.shape, confs_in.shape)
-
-        # # Ensuring the output shapes are (-1, batch_size)
-        # confs_out = confs_out.t()
-        # confs_in = confs_in.t()
-
-        # return confs_out, confs_in
-
-        # confs_out = [torch.tensor(confs) for confs in confs_out]
-        # print("confs_out: ", confs_out)
-        mean_out = torch.mean(confs_out, dim=1)
-        std_out = torch.clamp(torch.std(confs_out, dim=1), epsilon, 1 / epsilon)
-        N_out = Normal(mean_out, std_out)
+        mean_in = self.mean_in[data_indices]
+        std_in = torch.clamp(self.std_in[data_indices], epsilon, 1 / epsilon)
+        mean_out = self.mean_out[data_indices]
+        std_out = torch.clamp(self.std_out[data_indices], epsilon, 1 / epsilon)
 
         victim_confs, loss_val = self.model_confidence(victim_model, data_samples)
-        # victim_confs = victim_confs.cpu()
-        # loss_val = loss_val.cpu()
-        # print("victim_confs: ", victim_confs)
-
-        # confs_in = [torch.tensor(confs) for confs in confs_in]
-        # print("confs_in: ", confs_in)
-        mean_in = torch.mean(confs_in, dim=1)
-        # print("mean_in: ", mean_in)
-        std_in = torch.clamp(torch.std(confs_in, dim=1), epsilon, 1 / epsilon)
-        # print("std_in: ", std_in)
-        N_in = Normal(mean_in, std_in)
-        # self.N_in = N_in
-        # self.N_out = N_out
-        p_in = torch.clamp(N_in.log_prob(victim_confs).exp(), epsilon, 1 / epsilon)
-        p_out = torch.clamp(N_out.log_prob(victim_confs).exp(), epsilon, 1 / epsilon)
+
+        p_in = torch.clamp(
+            gaussian_log_prob(victim_confs, mean_in, std_in).exp(),
+            epsilon,
+            1 / epsilon,
+        )
+        p_out = torch.clamp(
+            gaussian_log_prob(victim_confs, mean_out, std_out).exp(),
+            epsilon,
+            1 / epsilon,
+        )
         ret_online = torch.clamp(p_in / p_out, epsilon, 1 / epsilon)
-        return N_out.cdf(victim_confs), ret_online, 1 - loss_val
+        return gaussian_cdf(victim_confs, mean_out, std_out), ret_online, 1 - loss_val
 
     def attack_dataset(
         self,
@@ -432,7 +570,22 @@ class LiRAMIA:
         epsilon=10e-9,
         return_loss=False,
         return_both=False,
+        use_cache=True,
     ):
+        if self.score_cache is not None and use_cache:
+            return self.score_cache.get_or_compute(
+                victim_model,
+                "lira_{}_{}_{}_{}".format(online, return_loss, return_both, epsilon),
+                lambda: self.attack_dataset(
+                    victim_model,
+                    batch_size=batch_size,
+                    online=online,
+                    epsilon=epsilon,
+                    return_loss=return_loss,
+                    return_both=return_both,
+                    use_cache=False,
+                ),
+            )
         dataloader = self.trainset.get_trainset(batch_size=batch_size, shuffle=False)
         dataset_size = self.confidences.shape[1]
         victim_model.eval()
@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+import torch
+
+
+class ScoreCache:
+    """
+    Bounded, content-addressed cache of per-sample MIA scores.
+    Entries are keyed by a hash of the attacked model's parameters, so the
+    same model attacked several times (the same chunk reconstructed by several
+    attackers, or an unchanged model across attack rounds) is only evaluated
+    once. Entries live in shared memory (/dev/shm), so all the attackers on a
+    machine share the cache. Every process using the cache leaves a marker in
+    it, and the last one to close removes the cache. A process that crashes
+    leaves its marker, its cache then has to be removed by hand
+    (rm -r /dev/shm/mia_cache_*).
+
+    """
+
+    def __init__(self, namespace="default", max_bytes=256 * 2**20, cache_dir=None):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        namespace : str, optional
+            Identifies the experiment, processes with the same namespace share entries
+        max_bytes : int, optional
+            Size of the cache, the least recently used entries are evicted beyond it
+        cache_dir : str, optional
+            Directory of the cache, defaults to /dev/shm or the temporary directory
+
+        """
+        if cache_dir is None:
+            cache_dir = (
+                "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            )
+        namespace = hashlib.blake2b(namespace.encode(), digest_size=8).hexdigest()
+        self.cache_dir = os.path.join(cache_dir, "mia_cache_{}".format(namespace))
+        self.register()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def register(self):
+        """
+        Creates the cache if needed and leaves the marker of this process in it
+
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.user_path = os.path.join(
+            self.cache_dir, "{}_{}.user".format(os.getpid(), id(self))
+        )
+        open(self.user_path, "w").close()
+
+    def close(self):
+        """
+        Removes the marker of this process, and the cache if no process uses it
+
+        """
+        if self.user_path is None:
+            return
+        try:
+            os.remove(self.user_path)
+        except FileNotFoundError:
+            pass
+        self.user_path = None
+        try:
+            users = [f for f in os.listdir(self.cache_dir) if f.endswith(".user")]
+        except FileNotFoundError:
+            return
+        if len(users) == 0:
+            logging.debug("Removing the MIA score cache {}".format(self.cache_dir))
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def __del__(self):
+        self.close()
+
+    def fingerprint(self, model):
+        """
+        Fast hash of the flat parameter vector of the model
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            Model to hash
+
+        Returns
+        -------
+        str
+            Hex digest of the parameters
+
+        """
+        h = hashlib.blake2b(digest_size=16)
+        with torch.no_grad():
+            for v in model.state_dict().values():
+                h.update(
+                    v.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy()
+                )
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached value of the key
+
+        Parameters
+        ----------
+        key : str
+            Key of the entry
+
+        Returns
+        -------
+        object
+            The value, None on a miss
+
+        """
+        path = os.path.join(self.cache_dir, "{}.pt".format(key))
+        try:
+            value = torch.load(path)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, RuntimeError):
+            return None
+        return value
+
+    def put(self, key, value):
+        """
+        Stores the value in the cache, does nothing once the cache is closed
+
+        Parameters
+        ----------
+        key : str
+            Key of the entry
+        value : object
+            Value to store
+
+        """
+        if self.user_path is None:
+            return
+        # Another process may have removed the cache after its last user closed,
+        # the marker is left again so that the last close removes the new cache
+        if not os.path.exists(self.user_path):
+            self.register()
+        path = os.path.join(self.cache_dir, "{}.pt".format(key))
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        torch.save(value, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_bytes
+
+        """
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(".tmp") or filename.endswith(".user"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, filename))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, filename))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def get_or_compute(self, model, tag, compute):
+        """
+        Returns the cached scores of the model or computes and caches them
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            Attacked model
+        tag : str
+            Identifies the attack and the dataset the scores are computed on
+        compute : callable
+            Computes the scores on a miss
+
+        Returns
+        -------
+        object
+            The scores
+
+        """
+        key = "{}_{}".format(self.fingerprint(model), tag)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            logging.debug("MIA score cache hit for {}".format(key))
+            return value
+        self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
@@ -88,6 +88,12 @@ class VNode(DPSGDWithPeerSampler):
         comm_module = importlib.import_module(comm_configs["comm_package"])
         comm_class = getattr(comm_module, comm_configs["comm_class"])
         comm_params = utils.remove_keys(comm_configs, ["comm_package", "comm_class"])
+        if comm_params.get("overflow", "block") != "block":
+            # A skipped model would leave its receiver waiting for the round
+            raise ValueError(
+                "overflow = {} needs a node that does not wait for every "
+                "neighbor, such as EL_Local_Timeout".format(comm_params["overflow"])
+            )
         self.addresses_filepath = comm_params.get("addresses_filepath", None)
         self.communication = comm_class(
             self.rank,
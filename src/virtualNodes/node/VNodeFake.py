@@ -4,6 +4,7 @@ import os
 import torch
 
 from decentralizepy.graphs.Graph import Graph
+from decentralizepy.graphs.SeededRegular import SeededRegular
 from decentralizepy.mappings.Mapping import Mapping
 from decentralizepy.utils import write_results_to_csv
 from virtualNodes.node.VNode import VNode
@@ -25,10 +26,30 @@ class VNodeFake(VNode):
             True if required data has been received, False otherwise
 
         """
+        if self.my_neighbors is None:
+            # Neighbors come with the message of the master node
+            return False
         return (
             self.messages_received[self.iteration] == len(self.my_neighbors) + 1
         )  # + 1 for the initial message from the master node
 
+    def forward_chunk(self, data):
+        """
+        Forwards the chunk of the master node to the neighbors of this iteration
+
+        Parameters
+        ----------
+        data : dict
+            Chunk received from the master node
+
+        """
+        if "NEIGHBORS" in data:
+            self.my_neighbors = data.pop("NEIGHBORS")
+            self.connect_neighbors()
+        for neighbor in self.my_neighbors:
+            self.communication.send(neighbor, data)
+        self.messages_received[data["iteration"]] += 1
+
     def run(self):
         """
         Start the decentralized learning
@@ -36,28 +57,36 @@ class VNodeFake(VNode):
         """
 
         self.messages_received = [0 for _ in range(self.iterations)]
+        # Chunks of the master node for iterations not started yet
+        self.next_chunks = dict()
 
         for iteration in range(self.iterations):
 
             self.iteration = iteration
 
-            new_neighbors = self.get_neighbors()
+            if self.batched_neighbors:
+                self.my_neighbors = None
+            else:
+                self.my_neighbors = self.get_neighbors()
+                self.connect_neighbors()
 
-            self.my_neighbors = new_neighbors
-            self.connect_neighbors()
+            if iteration in self.next_chunks:
+                self.forward_chunk(self.next_chunks.pop(iteration))
 
             while not self.received_from_all():
                 sender, data = self.receive_Virtual()
 
                 if sender == self.master_node:
-                    # To forward to neighbors
-                    for neighbor in self.my_neighbors:
-                        self.communication.send(neighbor, data)
+                    if data["iteration"] > self.iteration:
+                        # The master node trains ahead with max_staleness
+                        self.next_chunks[data["iteration"]] = data
+                        continue
+                    self.forward_chunk(data)
                 else:
                     # To send to server
                     data["vSource"] = sender
                     self.communication.send(self.master_node, data)
-                self.messages_received[data["iteration"]] += 1
+                    self.messages_received[data["iteration"]] += 1
 
             self.communication.send(
                 self.master_node,
@@ -155,20 +184,35 @@ class VNodeFake(VNode):
 
         nodeConfigs = config["NODE"]
         self.vnodes_per_node = nodeConfigs["vnodes_per_node"]
+        self.batched_neighbors = nodeConfigs.get("batched_neighbors", False)
+        if nodeConfigs.get("local_topology", False):
+            # Same graphs as VNodePeerSampler, derived from (random_seed, iteration)
+            n_procs_real = mapping.get_n_procs()
+            self.topology = SeededRegular(
+                n_procs_real * self.vnodes_per_node,
+                nodeConfigs["graph_degree"],
+                config["DATASET"].get("random_seed", 97),
+                dynamic=nodeConfigs.get("dynamic", None) == True,
+                offset=n_procs_real,
+                prefetch=nodeConfigs.get("prefetch_graphs", 1),
+            )
 
         self.init_comm(config["COMMUNICATION"])
 
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
 
         self.master_node = self.get_master_node()
         self.peer_sampler_uid = peer_sampler_uid
 
         self.connect_neighbor(self.master_node)
-        self.connect_neighbor(self.peer_sampler_uid)
+        if not self.batched_neighbors:
+            self.connect_neighbor(self.peer_sampler_uid)
         self.wait_for_hello(self.master_node)
-        self.wait_for_hello(self.peer_sampler_uid)
+        if not self.batched_neighbors:
+            self.wait_for_hello(self.peer_sampler_uid)
 
     def __init__(
         self,
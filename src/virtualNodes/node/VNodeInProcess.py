@@ -0,0 +1,523 @@
+import importlib
+import logging
+import os
+from time import perf_counter
+
+import numpy as np
+import torch
+from torch import multiprocessing as mp
+
+from decentralizepy.graphs.SeededRegular import SeededRegular
+from decentralizepy.mappings.Mapping import Mapping
+from virtualNodes.node.VNodeInProcessWorker import VNodeInProcessWorker
+from virtualNodes.sharing import VNodeSharing, VNodeSharingRandom
+
+
+class VNodeInProcess:
+    """
+    Runs all the real and virtual nodes of a VNodeReal/VNodeFake experiment in
+    one process, or a small pool of worker processes that train the real nodes.
+    The models are the rows of one [n_procs_real, P] matrix in shared memory,
+    with the columns ordered by chunk, so that the chunk sent to the j-th
+    virtual node of every real node is one contiguous slice. A round of
+    forwarding through the virtual nodes then averages each slice with a
+    sparse [n_procs_real, n_procs_real] matrix that counts the copies of the
+    chunk each real node receives from the others. The topologies are the
+    SeededRegular graphs of VNodePeerSampler, and the results CSVs of the real
+    and the virtual nodes have the same columns as with VNodeReal and VNodeFake.
+
+    Only synchronous rounds with the chunks of VNodeSharing or VNodeSharingRandom
+    without sparsity are simulated. The sharing classes that change what is sent
+    or how it is averaged, such as the attacks, are rejected, and the bytes are
+    those of the parameters only.
+
+    The learning rate decays as in VNodeReal: every reduce_lr_after rounds the
+    lr of the current optimizer is multiplied by reduce_by. With reset_optimizer
+    the optimizer is rebuilt with the configured lr after every round, so only
+    the rounds that are multiples of reduce_lr_after train with the decayed lr.
+    Without it the decay compounds.
+
+    """
+
+    def chunk_permutation(self, model, random_chunks):
+        """
+        Flattened state_dict index of every column, ordered by chunk, as
+        VNodeSharing or VNodeSharingRandom split the model.
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            Model of the nodes
+        random_chunks : bool
+            Chunks drawn with the random permutations of VNodeSharingRandom,
+            otherwise contiguous ranges as in VNodeSharing
+
+        Returns
+        -------
+        tuple
+            (permutation as torch.Tensor, start column of every chunk and the end)
+
+        """
+        state_dict = model.state_dict()
+        total_length = sum(v.numel() for v in state_dict.values())
+        if not random_chunks:
+            sizes = total_length // self.vnodes_per_node
+            bounds = [j * sizes for j in range(self.vnodes_per_node)] + [total_length]
+            return torch.arange(total_length), bounds
+
+        torch_gen = torch.Generator()
+        torch_gen.manual_seed(self.random_seed)
+        chunks = [[] for _ in range(self.vnodes_per_node)]
+        state_dict_index = 0
+        for _, v in state_dict.items():
+            random_perm = (
+                torch.randperm(v.numel(), generator=torch_gen) + state_dict_index
+            )
+            sizes = v.numel() // self.vnodes_per_node
+            index = 0
+            for i in range(self.vnodes_per_node - 1):
+                chunks[i].append(random_perm[index : index + sizes])
+                index += sizes
+            chunks[-1].append(random_perm[index:])
+            state_dict_index += v.numel()
+        chunks = [torch.cat(c) for c in chunks]
+        bounds = np.concatenate([[0], np.cumsum([len(c) for c in chunks])]).tolist()
+        return torch.cat(chunks), bounds
+
+    def initial_params(self, model):
+        """
+        Initial models of the real nodes, perturbed as in VNodeReal.
+
+        Parameters
+        ----------
+        model : torch.nn.Module
+            Model initialized with the random seed
+
+        """
+        state_dict = model.state_dict()
+        flat = torch.cat([v.flatten().to(torch.float32) for v in state_dict.values()])
+        self.params[:] = flat[self.permutation]
+        if not self.perturb_model:
+            return
+        logging.info("Perturbing models")
+        for uid in range(self.n_procs_real):
+            rng = torch.Generator()
+            rng.manual_seed(self.random_seed * 125 + uid)
+            noise = torch.cat(
+                [
+                    (
+                        (torch.rand(v.shape, generator=rng) / 100 - 0.005)
+                        * self.perturb_multiplier
+                    ).flatten()
+                    for v in state_dict.values()
+                ]
+            )
+            self.params[uid] += noise[self.permutation]
+
+    def mixing_matrices(self, iteration):
+        """
+        Counts of the chunks received by every real node in an iteration.
+
+        Parameters
+        ----------
+        iteration : int
+            Communication round
+
+        Returns
+        -------
+        tuple
+            (list of sparse COO matrices, the j-th one counts the copies of chunk j
+            of node s received by node r at [r, s], list of received counts per node,
+            bytes sent by every virtual node as np.ndarray in graph order)
+
+        """
+        n = self.n_procs_real
+        graph = self.topology.graph(iteration)
+        indptr = np.asarray(graph.indptr, dtype=np.int64)
+        indices = np.asarray(graph.indices, dtype=np.int64)
+        # The virtual node g forwards chunk g // n of node g % n to its neighbors,
+        # which forward it to their own real nodes
+        sources = np.repeat(np.arange(n * self.vnodes_per_node), np.diff(indptr))
+        matrices, counts = [], []
+        for j in range(self.vnodes_per_node):
+            edges = slice(indptr[j * n], indptr[(j + 1) * n])
+            received = torch.sparse_coo_tensor(
+                torch.from_numpy(np.stack([indices[edges] % n, sources[edges] % n])),
+                torch.ones(edges.stop - edges.start, dtype=torch.float32),
+                (n, n),
+                check_invariants=False,
+            )
+            matrices.append(received.coalesce())
+            counts.append(
+                torch.from_numpy(
+                    np.bincount(indices[edges] % n, minlength=n).astype(np.float32)
+                )
+            )
+        # Chunk of the virtual node to every neighbor, and every chunk received
+        # from the neighbors to the real node
+        chunk_bytes = self.chunk_bytes[np.arange(n * self.vnodes_per_node) // n]
+        sent = np.diff(indptr) * chunk_bytes + np.bincount(
+            sources, weights=self.chunk_bytes[indices // n], minlength=len(chunk_bytes)
+        )
+        return matrices, counts, sent
+
+    def gossip(self, iteration):
+        """
+        Averages every chunk of every real node with the copies it receives
+        through the virtual nodes, in place.
+
+        Parameters
+        ----------
+        iteration : int
+            Communication round
+
+        Returns
+        -------
+        np.ndarray
+            Bytes sent by every virtual node in graph order
+
+        """
+        matrices, counts, sent = self.mixing_matrices(iteration)
+        with torch.no_grad():
+            for j, (received, count) in enumerate(zip(matrices, counts)):
+                chunk = self.params[:, self.bounds[j] : self.bounds[j + 1]]
+                total = torch.sparse.mm(received, chunk)
+                total += chunk
+                chunk.copy_(total / (count + 1).unsqueeze(1))
+        return sent
+
+    def call_workers(self, command, *args):
+        """
+        Runs a method of all the workers and merges their results.
+
+        Parameters
+        ----------
+        command : str
+            Method of VNodeInProcessWorker
+        args : optional
+            Arguments of the method
+
+        Returns
+        -------
+        dict
+            uid -> result
+
+        """
+        if len(self.pipes) == 0:
+            return getattr(self.worker, command)(*args)
+        for pipe in self.pipes:
+            pipe.send((command, args))
+        results = dict()
+        for pipe in self.pipes:
+            results.update(pipe.recv())
+        return results
+
+    def write_results(self, file_name, row):
+        """
+        Appends a row to a results CSV, formatted as utils.write_results_to_csv.
+        Writing thousands of files with pandas would take longer than the round.
+
+        Parameters
+        ----------
+        file_name : str
+            File name in the log directory
+        row : dict
+            Column -> value
+
+        """
+        path = os.path.join(self.log_dir, file_name)
+        lines = []
+        if not os.path.exists(path):
+            lines.append(",".join(row.keys()))
+        lines.append(
+            ",".join(
+                (
+                    ""
+                    if v is None
+                    else "%.4f" % v if isinstance(v, (float, np.floating)) else str(v)
+                )
+                for v in row.values()
+            )
+        )
+        with open(path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def run(self):
+        """
+        Start the simulation
+
+        """
+        # Learning rate of an optimizer that is never reset
+        decayed_lr = self.lr
+        prev_elapsed_time = np.zeros(self.n_procs_real)
+        total_bytes = 0
+        vnode_bytes = np.zeros(self.n_procs_real * self.vnodes_per_node)
+
+        for iteration in range(self.iterations):
+            # Learning rate decay, as VNodeReal applies it to its current optimizer
+            lr = decayed_lr if not self.reset_optimizer else self.lr
+            if iteration > 0 and iteration % self.reduce_lr_after == 0:
+                decayed_lr = decayed_lr * self.reduce_by
+                lr = lr * self.reduce_by
+            logging.info("Starting training iteration: %d", iteration)
+
+            log_models = self.log_models and (
+                iteration == 0 or iteration % self.train_evaluate_after == 0
+            )
+            start_time = perf_counter()
+            train_times = self.call_workers("train", iteration, lr, log_models)
+            agg_start_time = perf_counter()
+            vnode_bytes += self.gossip(iteration)
+            total_bytes += self.model_bytes
+            agg_time = perf_counter() - agg_start_time
+            logging.info(
+                "Round {}: training {:.2f} s, averaging {:.2f} s".format(
+                    iteration, agg_start_time - start_time, agg_time
+                )
+            )
+
+            evaluations = self.call_workers(
+                "evaluate",
+                iteration == 0 or iteration % self.train_evaluate_after == 0,
+                iteration % self.test_after == 0,
+            )
+            # Averaging is a step of the whole simulation, spread over the nodes
+            agg_time /= self.n_procs_real
+            for uid in range(self.n_procs_real):
+                train_loss, ta, tl, eval_time = evaluations[uid]
+                total_time_no_eval = train_times[uid] + agg_time
+                self.write_results(
+                    "{}_results.csv".format(uid),
+                    {
+                        "iteration": iteration + 1,
+                        "train_loss": train_loss,
+                        "test_loss": tl,
+                        "test_acc": ta,
+                        "total_bytes": total_bytes,
+                        "total_meta": 0,
+                        "total_data_per_n": total_bytes,
+                        "agg_time": agg_time,
+                        "train_time": train_times[uid],
+                        "send_time": 0.0,
+                        "wait_time": 0.0,
+                        "merge_time": agg_time,
+                        "pending_rounds": 0,
+                        "eval_time": eval_time,
+                        "total_round_time_no_eval": total_time_no_eval,
+                        "total_elapsed_time_no_eval": total_time_no_eval
+                        + prev_elapsed_time[uid],
+                    },
+                )
+                prev_elapsed_time[uid] += total_time_no_eval
+
+            for g, sent in enumerate(vnode_bytes.tolist()):
+                self.write_results(
+                    "{}_results.csv".format(g + self.n_procs_real),
+                    {
+                        "iteration": iteration + 1,
+                        "total_bytes": int(sent),
+                        "total_meta": 0,
+                        "total_data_per_n": int(sent),
+                    },
+                )
+
+        for pipe in self.pipes:
+            pipe.send(("STOP", ()))
+        for p in self.processes:
+            p.join()
+        logging.info("Simulation complete!")
+
+    def start_workers(self, config, n_workers):
+        """
+        Splits the real nodes among the workers, in this process if n_workers is 0.
+
+        Parameters
+        ----------
+        config : dict
+            A dictionary of configurations.
+        n_workers : int
+            Number of worker processes
+
+        """
+        self.pipes = []
+        self.processes = []
+        if n_workers == 0:
+            self.worker = VNodeInProcessWorker(
+                list(range(self.n_procs_real)),
+                self.params,
+                self.permutation,
+                self.mapping,
+                config,
+                self.log_dir,
+                self.weights_store_dir,
+                self.log_level,
+                self.reset_optimizer,
+            )
+            return
+
+        # Forking after torch has started its thread pools may deadlock
+        context = mp.get_context("spawn")
+        for i, uids in enumerate(
+            np.array_split(np.arange(self.n_procs_real), n_workers)
+        ):
+            pipe, child_pipe = context.Pipe()
+            self.pipes.append(pipe)
+            self.processes.append(
+                context.Process(
+                    target=VNodeInProcessWorker.start,
+                    args=[
+                        child_pipe,
+                        os.path.join(self.log_dir, "worker_{}.log".format(i)),
+                        self.log_level,
+                        uids.tolist(),
+                        self.params,
+                        self.permutation,
+                        self.mapping,
+                        config,
+                        self.log_dir,
+                        self.weights_store_dir,
+                        self.log_level,
+                        self.reset_optimizer,
+                    ],
+                    daemon=False,
+                )
+            )
+        for p in self.processes:
+            p.start()
+        for pipe in self.pipes:
+            assert pipe.recv() == "READY"
+
+    def __init__(
+        self,
+        mapping: Mapping,
+        config,
+        iterations=1,
+        log_dir=".",
+        weights_store_dir=".",
+        log_level=logging.INFO,
+        test_after=5,
+        train_evaluate_after=1,
+        reset_optimizer=1,
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        mapping : decentralizepy.mappings
+            The object containing the mapping rank <--> uid of the real nodes
+        config : dict
+            A dictionary of configurations, as for VNodeReal. [NODE] may contain
+            simulation_workers, the number of worker processes that train the
+            real nodes, 0 to train them in this process
+        iterations : int
+            Number of iterations (communication steps) for which the model should be trained
+        log_dir : str
+            Logging directory
+        weights_store_dir : str
+            Directory in which to store model weights
+        log_level : logging.Level
+            One of DEBUG, INFO, WARNING, ERROR, CRITICAL
+        test_after : int
+            Number of iterations after which the test loss and accuracy arecalculated
+        train_evaluate_after : int
+            Number of iterations after which the train loss is calculated
+        reset_optimizer : int
+            1 if optimizer should be reset every communication round, else 0
+
+        """
+        self.mapping = mapping
+        self.n_procs_real = mapping.get_n_procs()
+        self.iterations = iterations
+        self.log_dir = log_dir
+        self.weights_store_dir = weights_store_dir
+        self.log_level = log_level
+        self.test_after = test_after
+        self.train_evaluate_after = train_evaluate_after
+        self.reset_optimizer = reset_optimizer
+        logging.basicConfig(
+            filename=os.path.join(log_dir, "simulation.log"),
+            format="[%(asctime)s][%(module)s][%(levelname)s] %(message)s",
+            level=log_level,
+            force=True,
+        )
+
+        nodeConfigs = config["NODE"]
+        self.vnodes_per_node = nodeConfigs["vnodes_per_node"]
+        self.dynamic = nodeConfigs.get("dynamic", None) == True
+        self.log_models = (
+            nodeConfigs["log_models"] if "log_models" in nodeConfigs else False
+        )
+        self.perturb_model = (
+            nodeConfigs["perturb_model"] if "perturb_model" in nodeConfigs else False
+        )
+        self.perturb_multiplier = (
+            nodeConfigs["perturb_multiplier"]
+            if "perturb_multiplier" in nodeConfigs
+            else 1
+        )
+        self.reduce_lr_after = (
+            nodeConfigs["reduce_lr_after"] if "reduce_lr_after" in nodeConfigs else 10e9
+        )
+        self.reduce_by = nodeConfigs["reduce_by"] if "reduce_by" in nodeConfigs else 0.1
+        if nodeConfigs.get("sparsity", 0.0) != 0.0:
+            raise ValueError("Sparse chunks differ per node and round")
+        if nodeConfigs.get("max_staleness", 0) != 0:
+            logging.warning("max_staleness is ignored, the rounds are synchronous")
+        self.lr = config["OPTIMIZER_PARAMS"]["lr"]
+
+        dataset_configs = config["DATASET"]
+        self.random_seed = (
+            dataset_configs["random_seed"] if "random_seed" in dataset_configs else 97
+        )
+        self.topology = SeededRegular(
+            self.n_procs_real * self.vnodes_per_node,
+            nodeConfigs["graph_degree"],
+            self.random_seed,
+            dynamic=self.dynamic,
+            prefetch=nodeConfigs.get("prefetch_graphs", 1),
+        )
+
+        # Same initial model as init_dataset_model
+        dataset_module = importlib.import_module(dataset_configs["dataset_package"])
+        torch.manual_seed(self.random_seed)
+        np.random.seed(self.random_seed)
+        model = getattr(dataset_module, dataset_configs["model_class"])()
+
+        sharing_module = importlib.import_module(config["SHARING"]["sharing_package"])
+        sharing_class = getattr(sharing_module, config["SHARING"]["sharing_class"])
+        random_chunks = issubclass(sharing_class, VNodeSharingRandom.VNodeSharing)
+        base_class = (
+            VNodeSharingRandom.VNodeSharing
+            if random_chunks
+            else VNodeSharing.VNodeSharing
+        )
+        if not issubclass(sharing_class, base_class):
+            raise ValueError(
+                "{} is not a VNodeSharing or VNodeSharingRandom".format(
+                    sharing_class.__name__
+                )
+            )
+        for method in ["get_data_to_send", "forward_averaging", "serialized_models"]:
+            if getattr(sharing_class, method) is not getattr(base_class, method):
+                raise ValueError(
+                    "{} overrides {}, only the averaging of {} is simulated".format(
+                        sharing_class.__name__, method, base_class.__module__
+                    )
+                )
+        self.permutation, self.bounds = self.chunk_permutation(model, random_chunks)
+        self.chunk_bytes = 4 * np.diff(self.bounds)
+        self.model_bytes = 4 * len(self.permutation)
+
+        self.params = torch.zeros(
+            self.n_procs_real, len(self.permutation), dtype=torch.float32
+        ).share_memory_()
+        self.initial_params(model)
+        logging.info(
+            "Simulating {} real nodes with {} virtual nodes each, {} parameters".format(
+                self.n_procs_real, self.vnodes_per_node, len(self.permutation)
+            )
+        )
+
+        self.start_workers(config, nodeConfigs.get("simulation_workers", 0))
+        self.run()
@@ -0,0 +1,372 @@
+import importlib
+import logging
+import os
+from time import perf_counter
+
+import numpy as np
+import torch
+
+from decentralizepy import utils
+
+
+class VNodeInProcessWorker:
+    """
+    Trains and evaluates a block of the real nodes of VNodeInProcess. All the
+    nodes share one model, optimizer and trainer: the parameters of a node are
+    loaded from its row of the shared parameter matrix before training, and
+    written back after. The dataset is loaded once, each node trains on its own
+    partition of it.
+
+    """
+
+    def __init__(
+        self,
+        uids,
+        params,
+        permutation,
+        mapping,
+        config,
+        log_dir=".",
+        weights_store_dir=".",
+        log_level=logging.INFO,
+        reset_optimizer=1,
+    ):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        uids : list(int)
+            Real nodes of the block
+        params : torch.Tensor
+            [n_procs_real, P] parameters of all the real nodes, in shared memory
+        permutation : torch.Tensor
+            Column of the parameter matrix -> index in the flattened state_dict
+        mapping : decentralizepy.mappings
+            The object containing the mapping rank <--> uid
+        config : dict
+            A dictionary of configurations.
+        log_dir : str
+            Logging directory
+        weights_store_dir : str
+            Directory in which to store model weights
+        log_level : logging.Level
+            One of DEBUG, INFO, WARNING, ERROR, CRITICAL
+        reset_optimizer : int
+            1 if optimizer should be reset every communication round, else 0
+
+        """
+        self.uids = uids
+        self.params = params
+        self.permutation = permutation
+        self.mapping = mapping
+        self.weights_store_dir = weights_store_dir
+        self.reset_optimizer = reset_optimizer
+
+        nodeConfigs = config["NODE"]
+        self.log_models = (
+            nodeConfigs["log_models"] if "log_models" in nodeConfigs else False
+        )
+        threads_per_proc = (
+            nodeConfigs["threads_per_proc"] if "threads_per_proc" in nodeConfigs else 1
+        )
+        torch.set_num_threads(threads_per_proc)
+
+        self.init_dataset_model(config["DATASET"])
+        self.init_optimizer(config["OPTIMIZER_PARAMS"])
+        self.init_trainer(config["TRAIN_PARAMS"], log_dir)
+
+        self.keys = []
+        self.shapes = []
+        self.lens = []
+        for k, v in self.model.state_dict().items():
+            self.keys.append(k)
+            self.shapes.append(v.shape)
+            self.lens.append(v.numel())
+        # uid -> optimizer state, without reset_optimizer
+        self.optimizer_states = dict()
+
+    def init_dataset_model(self, dataset_configs):
+        """
+        Instantiate the dataset of the first node of the block and the model.
+
+        Parameters
+        ----------
+        dataset_configs : dict
+            Python dict containing dataset config params
+
+        """
+        dataset_module = importlib.import_module(dataset_configs["dataset_package"])
+        self.dataset_class = getattr(dataset_module, dataset_configs["dataset_class"])
+        random_seed = (
+            dataset_configs["random_seed"] if "random_seed" in dataset_configs else 97
+        )
+        torch.manual_seed(random_seed)
+        np.random.seed(random_seed)
+        self.dataset_params = utils.remove_keys(
+            dataset_configs,
+            ["dataset_package", "dataset_class", "model_class"],
+        )
+        self.dataset = self.dataset_class(
+            *self.mapping.get_machine_and_rank(self.uids[0]),
+            self.mapping,
+            **self.dataset_params
+        )
+        # uid -> dataset of the node, when the partitions cannot be shared
+        self.datasets = dict()
+        # uid -> training partition of the node
+        self.trainsets = dict()
+
+        self.model_class = getattr(dataset_module, dataset_configs["model_class"])
+        self.model = self.model_class()
+
+    def init_optimizer(self, optimizer_configs):
+        """
+        Read the optimizer class and parameters from config.
+
+        Parameters
+        ----------
+        optimizer_configs : dict
+            Python dict containing optimizer config params
+
+        """
+        optimizer_module = importlib.import_module(
+            optimizer_configs["optimizer_package"]
+        )
+        self.optimizer_class = getattr(
+            optimizer_module, optimizer_configs["optimizer_class"]
+        )
+        self.optimizer_params = utils.remove_keys(
+            optimizer_configs, ["optimizer_package", "optimizer_class"]
+        )
+        self.optimizer = self.optimizer_class(
+            self.model.parameters(), **self.optimizer_params
+        )
+
+    def init_trainer(self, train_configs, log_dir):
+        """
+        Instantiate training module and loss from config.
+
+        Parameters
+        ----------
+        train_configs : dict
+            Python dict containing training config params
+        log_dir : str
+            Logging directory
+
+        """
+        train_module = importlib.import_module(train_configs["training_package"])
+        train_class = getattr(train_module, train_configs["training_class"])
+
+        loss_package = importlib.import_module(train_configs["loss_package"])
+        if "loss_class" in train_configs.keys():
+            loss_class = getattr(loss_package, train_configs["loss_class"])
+            self.loss = loss_class()
+        else:
+            self.loss = getattr(loss_package, train_configs["loss"])
+
+        train_params = utils.remove_keys(
+            train_configs,
+            [
+                "training_package",
+                "training_class",
+                "loss",
+                "loss_package",
+                "loss_class",
+            ],
+        )
+        self.trainer = train_class(
+            self.uids[0],
+            0,
+            self.mapping,
+            self.model,
+            self.optimizer,
+            self.loss,
+            log_dir,
+            **train_params
+        )
+
+    def get_dataset(self, uid):
+        """
+        Dataset whose training set is the partition of a node.
+
+        Parameters
+        ----------
+        uid : int
+            Real node
+
+        Returns
+        -------
+        decentralizepy.datasets.Dataset
+            The dataset
+
+        """
+        rank, machine_id = self.mapping.get_machine_and_rank(uid)
+        if not hasattr(self.dataset, "training_partitions"):
+            # Datasets split by user files are loaded per node
+            if uid not in self.datasets:
+                self.datasets[uid] = self.dataset_class(
+                    rank, machine_id, self.mapping, **self.dataset_params
+                )
+            return self.datasets[uid]
+        if uid not in self.trainsets:
+            # Partition of the node, as Dataset.dataset_id
+            dataset_id = rank if self.dataset.only_local else uid
+            self.trainsets[uid] = self.dataset.training_partitions.use(dataset_id)
+        self.dataset.trainset = self.trainsets[uid]
+        return self.dataset
+
+    def load_node(self, uid):
+        """
+        Loads the parameters of a node into the model.
+
+        Parameters
+        ----------
+        uid : int
+            Real node
+
+        """
+        flat = torch.empty_like(self.params[uid])
+        flat[self.permutation] = self.params[uid]
+        state_dict = self.model.state_dict()
+        for k, v in zip(self.keys, torch.split(flat, self.lens)):
+            state_dict[k] = v.reshape(state_dict[k].shape).to(state_dict[k].dtype)
+        self.model.load_state_dict(state_dict)
+
+    def store_node(self, uid):
+        """
+        Writes the parameters of the model into the row of a node.
+
+        Parameters
+        ----------
+        uid : int
+            Real node
+
+        """
+        with torch.no_grad():
+            flat = torch.cat(
+                [
+                    v.flatten().to(torch.float32)
+                    for v in self.model.state_dict().values()
+                ]
+            )
+            self.params[uid] = flat[self.permutation]
+
+    def train(self, iteration, lr, log_models=False):
+        """
+        One round of local training of all the nodes of the block.
+
+        Parameters
+        ----------
+        iteration : int
+            Communication round
+        lr : float
+            Learning rate of the round
+        log_models : bool, optional
+            Save the trained models to weights_store_dir
+
+        Returns
+        -------
+        dict
+            uid -> training time in seconds
+
+        """
+        train_times = dict()
+        for uid in self.uids:
+            start_time = perf_counter()
+            self.load_node(uid)
+            self.optimizer = self.optimizer_class(
+                self.model.parameters(), **self.optimizer_params
+            )
+            if not self.reset_optimizer and uid in self.optimizer_states:
+                self.optimizer.load_state_dict(self.optimizer_states[uid])
+            for param_group in self.optimizer.param_groups:
+                param_group["lr"] = lr
+            self.trainer.reset_optimizer(self.optimizer)
+            self.trainer.train(self.get_dataset(uid))
+            if not self.reset_optimizer:
+                self.optimizer_states[uid] = self.optimizer.state_dict()
+            if log_models:
+                torch.save(
+                    self.model.state_dict(),
+                    os.path.join(
+                        self.weights_store_dir,
+                        "{}_{}_inter.pt".format(uid, iteration),
+                    ),
+                )
+            self.store_node(uid)
+            train_times[uid] = perf_counter() - start_time
+        return train_times
+
+    def evaluate(self, train_loss=False, test=False):
+        """
+        Evaluates the averaged models of all the nodes of the block.
+
+        Parameters
+        ----------
+        train_loss : bool, optional
+            Compute the loss on the training partition of each node
+        test : bool, optional
+            Compute the accuracy and loss on the test set
+
+        Returns
+        -------
+        dict
+            uid -> (train_loss, test_acc, test_loss, eval_time), None if not computed
+
+        """
+        results = dict()
+        for uid in self.uids:
+            self.load_node(uid)
+            loss, ta, tl, eval_time = None, None, None, 0
+            if train_loss:
+                loss = self.trainer.eval_loss(self.get_dataset(uid))
+            if test and self.dataset.__testing__:
+                eval_start_time = perf_counter()
+                ta, tl = self.dataset.test(self.model, self.loss)
+                eval_time = perf_counter() - eval_start_time
+            results[uid] = (loss, ta, tl, eval_time)
+        return results
+
+    def serve(self, pipe):
+        """
+        Runs the commands of VNodeInProcess until it stops the worker.
+
+        Parameters
+        ----------
+        pipe : multiprocessing.connection.Connection
+            Receives (method name, arguments), sends back the results
+
+        """
+        while True:
+            command, args = pipe.recv()
+            if command == "STOP":
+                break
+            pipe.send(getattr(self, command)(*args))
+
+    @staticmethod
+    def start(pipe, log_file, log_level, *args):
+        """
+        Entry point of a worker process.
+
+        Parameters
+        ----------
+        pipe : multiprocessing.connection.Connection
+            Connection to VNodeInProcess
+        log_file : str
+            Log file of the worker
+        log_level : logging.Level
+            One of DEBUG, INFO, WARNING, ERROR, CRITICAL
+        args : optional
+            Arguments of the constructor
+
+        """
+        logging.basicConfig(
+            filename=log_file,
+            format="[%(asctime)s][%(module)s][%(levelname)s] %(message)s",
+            level=log_level,
+            force=True,
+        )
+        worker = VNodeInProcessWorker(*args)
+        pipe.send("READY")
+        worker.serve(pipe)
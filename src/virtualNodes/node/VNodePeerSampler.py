@@ -1,9 +1,11 @@
 import importlib
 import logging
 
+import numpy as np
+
 from decentralizepy import utils
 from decentralizepy.graphs.Graph import Graph
-from decentralizepy.graphs.Regular import Regular
+from decentralizepy.graphs.SeededRegular import SeededRegular
 from decentralizepy.mappings.Mapping import Mapping
 from decentralizepy.node.PeerSamplerDynamic import PeerSamplerDynamic
 
@@ -14,52 +16,75 @@ class VNodePeerSampler(PeerSamplerDynamic):
 
     """
 
-    def fix_identifiers(self, neighbors):
+    def get_neighbors(self, node, iteration=None):
+        return list(self.topology.neighbors(node, iteration))
+
+    def get_topology(self, node, iteration):
         """
-        Fix the identifiers of the neighbors to be consistent with the global graph
+        Neighbors of all the virtual nodes hosted by a real node, as one compact array
 
         Parameters
         ----------
-        neighbors : list
-            List of neighbors
+        node : int
+            uid of the VNodeReal
+        iteration : int
+            Communication round
 
         Returns
         -------
-        list
-            List of neighbors with fixed identifiers
+        tuple
+            (indptr, indices) as np.int32 arrays, the neighbors of the j-th virtual
+            node are indices[indptr[j] : indptr[j + 1]]
 
         """
+        graph = self.topology.graph(iteration)
+        rows = [
+            graph.neighbors(node + j * self.n_procs_real)
+            for j in range(self.vnodes_per_node)
+        ]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+        np.cumsum([len(row) for row in rows], out=indptr[1:])
+        indices = np.concatenate(rows).astype(np.int32) + self.n_procs_real
+        return indptr, indices
 
-        return [(neighbor + self.n_procs_real) for neighbor in neighbors]
+    def run(self):
+        """
+        Start the peer-sampling service.
+        With batched_neighbors, every VNodeReal requests the topology of its virtual
+        nodes for topology_rounds rounds at once, and forwards it to them.
 
-    def get_neighbors(self, node, iteration=None):
-        if iteration != None and self.dynamic == True:
-            if self.messages_received[iteration] == 0:
-                logging.info(
-                    "Generating new graph in iteration, self.iteration: {}, {}".format(
-                        iteration, self.iteration
-                    )
-                )
-                assert iteration == self.iteration + 1
-                self.iteration = iteration
-                self.graphs[iteration] = Regular(
-                    self.n_procs_real * self.vnodes_per_node,
-                    self.graph_degree,
-                    seed=self.random_seed * 100000 + iteration,
+        """
+        while len(self.barrier) > 0:
+            sender, data = self.receive_server_request()
+            if "BYE" in data:
+                logging.debug("Received {} from {}".format("BYE", sender))
+                self.barrier.remove(sender)
+
+            elif "REQUEST_TOPOLOGY" in data:
+                logging.debug("Received {} from {}".format("Topology request", sender))
+                rounds = range(
+                    data["iteration"],
+                    min(data["iteration"] + self.topology_rounds, self.iterations),
                 )
-            assert iteration in self.graphs
-            to_return = self.fix_identifiers(
-                self.graphs[iteration].neighbors(node - self.n_procs_real)
-            )
-            self.messages_received[iteration] += 1
-            if (
-                self.messages_received[iteration]
-                == self.n_procs_real * self.vnodes_per_node
-            ):
-                del self.graphs[iteration]
-            return to_return
-        else:
-            return self.fix_identifiers(self.graph.neighbors(node - self.n_procs_real))
+                resp = {
+                    "TOPOLOGY": {
+                        iteration: self.get_topology(sender, iteration)
+                        for iteration in rounds
+                    },
+                    "CHANNEL": "PEERS",
+                }
+                self.communication.send(sender, resp)
+
+            elif "REQUEST_NEIGHBORS" in data:
+                logging.debug("Received {} from {}".format("Request", sender))
+                if "iteration" in data:
+                    resp = {
+                        "NEIGHBORS": self.get_neighbors(sender, data["iteration"]),
+                        "CHANNEL": "PEERS",
+                    }
+                else:
+                    resp = {"NEIGHBORS": self.get_neighbors(sender), "CHANNEL": "PEERS"}
+                self.communication.send(sender, resp)
 
     def __init__(
         self,
@@ -108,15 +133,14 @@ class VNodePeerSampler(PeerSamplerDynamic):
 
         """
 
-        self.iteration = -1
-        self.graphs = dict()
-
         nodeConfigs = config["NODE"]
         self.vnodes_per_node = nodeConfigs["vnodes_per_node"]
         self.graph_degree = nodeConfigs["graph_degree"]
         self.dynamic = None
         if "dynamic" in nodeConfigs:
             self.dynamic = nodeConfigs["dynamic"]
+        self.batched_neighbors = nodeConfigs.get("batched_neighbors", False)
+        self.topology_rounds = nodeConfigs.get("topology_rounds", 2)
 
         self.instantiate(
             rank,
@@ -130,14 +154,16 @@ class VNodePeerSampler(PeerSamplerDynamic):
             *args
         )
 
-        self.graph = Regular(
+        # VNodeFake with local_topology in [NODE] build the same graphs themselves
+        self.topology = SeededRegular(
             self.n_procs_real * self.vnodes_per_node,
             self.graph_degree,
-            seed=self.random_seed,
+            self.random_seed,
+            dynamic=self.dynamic == True,
+            offset=self.n_procs_real,
+            prefetch=nodeConfigs.get("prefetch_graphs", 1),
         )
-
-        self.n_procs_real = self.mapping.get_n_procs()
-        self.messages_received = [0 for _ in range(iterations)]
+        self.graph = self.topology.graph(None)
 
         self.run()
 
@@ -220,13 +246,18 @@ class VNodePeerSampler(PeerSamplerDynamic):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
 
         self.init_comm(config["COMMUNICATION"])
         self.n_procs_real = self.mapping.get_n_procs()
-        self.my_neighbors = [
-            i
-            for i in range(
-                self.n_procs_real, self.n_procs_real * (self.vnodes_per_node + 1)
-            )
-        ]
+        if self.batched_neighbors:
+            # The VNodeReal request the topologies for their virtual nodes
+            self.my_neighbors = [i for i in range(self.n_procs_real)]
+        else:
+            self.my_neighbors = [
+                i
+                for i in range(
+                    self.n_procs_real, self.n_procs_real * (self.vnodes_per_node + 1)
+                )
+            ]
         self.connect_neighbors()
@@ -19,17 +19,176 @@ class VNodeReal(VNode):
 
     """
 
-    def received_from_all(self):
+    def receive_round_message(self, block=True):
         """
-        Check if all neighbors have sent the current iteration
+        Receives one message of the virtual nodes. Chunks are averaged right
+        away if the model has not changed since it was sent, otherwise they
+        are kept in peer_deques until their round is aggregated.
+
+        Parameters
+        ----------
+        block : bool
+            Wait for a message
 
         Returns
         -------
         bool
-            True if required data has been received, False otherwise
+            False if block is False and no message was available
+
+        """
+        x = self.receive_channel("VNodeDPSGD", block=block)
+        if x is None:
+            return False
+        forwarder, data = x
+        assert forwarder in self.vids
+
+        if "ROUND_COMPLETE" in data:
+            logging.debug(
+                "Received ROUND_COMPLETE from {} for iteration {}".format(
+                    forwarder, data["iteration"]
+                )
+            )
+            self.round_complete[data["iteration"]] += 1
+            return True
+
+        logging.debug(
+            "Received Forwarder Model from {} of iteration {}".format(
+                forwarder, data["iteration"]
+            )
+        )
+
+        sender = data["vSource"]
+
+        if sender not in self.peer_deques:
+            self.peer_deques[sender] = deque()
+
+        if self.max_staleness == 0 and data["iteration"] == self.iteration:
+            self.sharing.forward_averaging(data)
+        else:
+            self.peer_deques[sender].append(data)
+        return True
+
+    def merge_round(self, iteration, sent_model):
+        """
+        Averages the chunks received in an iteration. With pipelining, the
+        average is computed on the model sent in that iteration, and the
+        change it makes is added to the model trained since.
+
+        Parameters
+        ----------
+        iteration : int
+            Communication round
+        sent_model : dict or None
+            state_dict sent in that iteration, None if the model did not change
+
+        """
+        averaging_deque = dict()
+        for neighbor in self.peer_deques:
+            averaging_deque[neighbor] = deque()
+            for deq in self.peer_deques[neighbor]:
+                if deq["iteration"] == iteration:
+                    averaging_deque[neighbor].append(deq)
+                    logging.debug(
+                        "Virtual node {} has sent iteration {}".format(
+                            neighbor, iteration
+                        )
+                    )
+            for deq in averaging_deque[neighbor]:
+                self.peer_deques[neighbor].remove(deq)
+
+        if sent_model is None:
+            self.sharing.finish_forward_averaging(averaging_deque)
+            return
+
+        with torch.no_grad():
+            trained = {k: v.clone() for k, v in self.model.state_dict().items()}
+            self.model.load_state_dict(sent_model)
+            self.sharing.finish_forward_averaging(averaging_deque)
+            averaged = self.model.state_dict()
+            self.model.load_state_dict(
+                {k: trained[k] + (averaged[k] - sent_model[k]) for k in trained}
+            )
+
+    def aggregate_rounds(self, max_pending):
+        """
+        Aggregates the pending rounds whose chunks have all been received, in
+        order. Blocks until at most max_pending rounds are left.
+
+        Parameters
+        ----------
+        max_pending : int
+            Number of rounds allowed to stay pending
+
+        Returns
+        -------
+        float
+            Time spent merging the rounds
 
         """
-        return self.round_complete[self.iteration] == self.vnodes_per_node
+        merge_time = 0
+        while len(self.pending_rounds) > 0:
+            iteration, sent_model = self.pending_rounds[0]
+            if self.round_complete[iteration] < self.vnodes_per_node:
+                if len(self.pending_rounds) > max_pending:
+                    self.receive_round_message()
+                elif not self.receive_round_message(block=False):
+                    break
+                continue
+            merge_start_time = perf_counter()
+            self.merge_round(iteration, sent_model)
+            merge_time += perf_counter() - merge_start_time
+            self.pending_rounds.popleft()
+        return merge_time
+
+    def request_topology(self, iteration):
+        """
+        Requests the neighbors of all the virtual nodes from the peer sampler,
+        for this and the next few iterations, unless already received
+
+        Parameters
+        ----------
+        iteration : int
+            Communication round
+
+        """
+        if iteration not in self.topologies and iteration not in self.requested:
+            logging.debug("Requesting topology of iteration {}".format(iteration))
+            self.communication.send(
+                self.peer_sampler_uid,
+                {
+                    "REQUEST_TOPOLOGY": self.uid,
+                    "iteration": iteration,
+                    "CHANNEL": "SERVER_REQUEST",
+                },
+            )
+            self.requested.add(iteration)
+
+    def receive_topology(self, iteration):
+        """
+        Waits for the neighbors of the virtual nodes in the given iteration
+
+        Parameters
+        ----------
+        iteration : int
+            Communication round
+
+        Returns
+        -------
+        list
+            Neighbors of the i-th virtual node at position i
+
+        """
+        while iteration not in self.topologies:
+            _, data = self.receive_channel("PEERS")
+            self.topologies.update(data["TOPOLOGY"])
+        for old in [i for i in self.topologies if i < iteration]:
+            del self.topologies[old]
+        self.requested.discard(iteration)
+        indptr, indices = self.topologies[iteration]
+        return [
+            indices[indptr[i] : indptr[i + 1]].tolist()
+            for i in range(self.vnodes_per_node)
+        ]
 
     def run(self):
         """
@@ -43,6 +202,8 @@ class VNodeReal(VNode):
         prev_elapsed_time = 0
 
         self.round_complete = [0 for _ in range(self.iterations)]
+        # (iteration, model sent in that iteration) of the rounds not aggregated yet
+        self.pending_rounds = deque()
 
         # Perturb the model parameters
         if self.perturb_model:
@@ -76,6 +237,9 @@ class VNodeReal(VNode):
             rounds_to_test -= 1
 
             self.iteration = iteration
+            if self.batched_neighbors:
+                # Answered while training
+                self.request_topology(iteration)
             self.trainer.train(self.dataset)
 
             if self.log_models and (iteration == 0 or rounds_to_train_evaluate == 0):
@@ -93,9 +257,13 @@ class VNodeReal(VNode):
             to_send_list = self.sharing.get_data_to_send(
                 vnodes_per_node=self.vnodes_per_node, sparsity=self.sparsity
             )
+            if self.batched_neighbors:
+                vnode_neighbors = self.receive_topology(iteration)
             for i, to_send in enumerate(to_send_list):
                 to_send["CHANNEL"] = "VNodeDPSGD"
                 to_send["iteration"] = self.iteration
+                if self.batched_neighbors:
+                    to_send["NEIGHBORS"] = vnode_neighbors[i]
                 self.communication.send(self.vids[i], to_send)
                 logging.debug(
                     "Sending message to {} of iteration {}".format(
@@ -103,52 +271,15 @@ class VNodeReal(VNode):
                     )
                 )
             del to_send_list
+            sent_model = None
+            if self.max_staleness > 0:
+                # The next rounds train while this one is aggregating
+                sent_model = {k: v.clone() for k, v in self.model.state_dict().items()}
+            self.pending_rounds.append((iteration, sent_model))
 
-            while not self.received_from_all():
-                forwarder, data = self.receive_Virtual()
-                assert forwarder in self.vids
-
-                if "ROUND_COMPLETE" in data:
-                    logging.debug(
-                        "Received ROUND_COMPLETE from {} for iteration {}".format(
-                            forwarder, iteration
-                        )
-                    )
-                    self.round_complete[data["iteration"]] += 1
-                    continue
-
-                logging.debug(
-                    "Received Forwarder Model from {} of iteration {}".format(
-                        forwarder, data["iteration"]
-                    )
-                )
-
-                sender = data["vSource"]
-
-                if sender not in self.peer_deques:
-                    self.peer_deques[sender] = deque()
-
-                if data["iteration"] == self.iteration:
-                    self.sharing.forward_averaging(data)
-                else:
-                    self.peer_deques[sender].append(data)
-
-            averaging_deque = dict()
-            for neighbor in self.peer_deques:
-                averaging_deque[neighbor] = deque()
-                for deq in self.peer_deques[neighbor]:
-                    if deq["iteration"] == self.iteration:
-                        averaging_deque[neighbor].append(deq)
-                        logging.debug(
-                            "Virtual node {} has sent the current iteration".format(
-                                neighbor
-                            )
-                        )
-                for deq in averaging_deque[neighbor]:
-                    self.peer_deques[neighbor].remove(deq)
-
-            self.sharing.finish_forward_averaging(averaging_deque)
-            del averaging_deque
+            wait_start_time = perf_counter()
+            send_time = wait_start_time - agg_start_time
+            merge_time = self.aggregate_rounds(self.max_staleness)
 
             agg_end_time = perf_counter()
             agg_time = agg_end_time - agg_start_time
@@ -178,6 +309,10 @@ class VNodeReal(VNode):
                 ),
                 "agg_time": agg_time,
                 "train_time": train_time,
+                "send_time": send_time,
+                "wait_time": agg_time - send_time - merge_time,
+                "merge_time": merge_time,
+                "pending_rounds": len(self.pending_rounds),
                 "eval_time": None,
                 "total_round_time_no_eval": total_time_no_eval,
                 "total_elapsed_time_no_eval": total_time_no_eval + prev_elapsed_time,
@@ -206,6 +341,7 @@ class VNodeReal(VNode):
                 results_dict,
             )
 
+        self.aggregate_rounds(0)
         self.disconnect_neighbors()
 
         for p in self.virtualProcs:
@@ -291,6 +427,9 @@ class VNodeReal(VNode):
             else 1
         )
         self.vids = self.get_vids()
+        self.batched_neighbors = nodeConfigs.get("batched_neighbors", False)
+        # Rounds that may still be aggregating while the next ones train
+        self.max_staleness = nodeConfigs.get("max_staleness", 0)
         self.reduce_lr_after = (
             nodeConfigs["reduce_lr_after"] if "reduce_lr_after" in nodeConfigs else 10e9
         )
@@ -344,6 +483,7 @@ class VNodeReal(VNode):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
         self.my_neighbors = self.vids
         self.peer_sampler_uid = peer_sampler_uid
 
@@ -351,6 +491,13 @@ class VNodeReal(VNode):
         self.peer_deques = dict()
         self.connect_neighbors()
 
+        if self.batched_neighbors:
+            # The virtual nodes receive their neighbors with the chunks
+            self.topologies = dict()
+            self.requested = set()
+            self.connect_neighbor(self.peer_sampler_uid)
+            self.wait_for_hello(self.peer_sampler_uid)
+
     def __init__(
         self,
         rank: int,
@@ -287,6 +287,7 @@ class VNodePeerSampler(PeerSamplerDynamic):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
 
         self.init_comm(config["COMMUNICATION"])
         self.n_procs_real = self.mapping.get_n_procs()
@@ -411,6 +411,7 @@ class VNodeReal(VNode):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
         self.my_neighbors = self.vids
         self.peer_sampler_uid = peer_sampler_uid
 
@@ -398,6 +398,7 @@ class VNodeReal(VNode):
         self.message_queue = dict()
 
         self.barrier = set()
+        self.said_bye = set()
         self.my_neighbors = [i for i in range(self.mapping.get_n_procs())]
         self.peer_sampler_uid = peer_sampler_uid
         self.init_sharing(config["SHARING"])
@@ -11,6 +11,7 @@ from decentralizepy.datasets.text.Twitter import Twitter
 from virtualNodes.attacks.LinkabilityAttack import LinkabilityAttack
 from virtualNodes.attacks.LinkabilityAttackTwitter import LinkabilityAttackTwitter
 from virtualNodes.attacks.MIA import LiRACIFAR_ResNET, LiRATwitterFinal
+from virtualNodes.attacks.MIA.ScoreCache import ScoreCache
 from virtualNodes.sharing.VNodeSharingRandom import VNodeSharing
 
 
@@ -41,6 +42,8 @@ class VNodeSharingAttackRandom(VNodeSharing):
         perform_attack=True,
         attack_random=8,
         will_receive=8,
+        mia_cache_bytes=256 * 2**20,
+        adaptive_linkability=False,
     ):
         """
         Constructor
@@ -63,6 +66,12 @@ class VNodeSharingAttackRandom(VNodeSharing):
             Dataset for sharing data. Not implemented yet!
         log_dir : str
             Location to write shared_params (only writing for 2 procs per machine)
+        mia_cache_bytes : int, optional
+            Size of the MIA score cache shared by the attackers of the machine, 0 to disable.
+            The cache in /dev/shm is removed when its last user exits, after a crash
+            remove /dev/shm/mia_cache_* by hand
+        adaptive_linkability : bool, optional
+            Link with the successive halving search instead of evaluating every training set
 
         """
         super().__init__(
@@ -141,9 +150,11 @@ class VNodeSharingAttackRandom(VNodeSharing):
             self.num_clients,
             trainset_dict,
             loss,
+            adaptive=adaptive_linkability,
         )
         self.attack_results = {
             "linkability": {},
+            "linkability_samples": {},
             "loss_vals": {},
             "lira_offline": {},
             "lira_online": {},
@@ -164,8 +175,17 @@ class VNodeSharingAttackRandom(VNodeSharing):
         self.shadow_dataset_model = self.shadow_dataset_model(
             K=self.K, train_dir=self.train_dir
         )
+        self.score_cache = (
+            ScoreCache(
+                namespace=os.path.abspath(self.log_dir), max_bytes=mia_cache_bytes
+            )
+            if mia_cache_bytes > 0
+            else None
+        )
         self.mia = self.mia(
-            self.shadow_dataset_model, weights_store_dir=self.shadow_weights_store_dir
+            self.shadow_dataset_model,
+            weights_store_dir=self.shadow_weights_store_dir,
+            score_cache=self.score_cache,
         )
         if os.path.isfile(self.shadow_model_confidence_path):
             self.mia.load_shadow_confidences(self.shadow_model_confidence_path)
@@ -200,6 +220,8 @@ class VNodeSharingAttackRandom(VNodeSharing):
                 self.attack_results,
                 os.path.join(self.log_dir, "{}_attacker.pth".format(self.uid)),
             )
+        if self.score_cache is not None:
+            self.score_cache.close()
 
     def forward_averaging(self, data):
         """
@@ -295,12 +317,17 @@ class VNodeSharingAttackRandom(VNodeSharing):
                     self.attack_model, skip=[self.uid]
                 )
                 logging.info(
-                    "Original client: {}, Linked as: {}".format(
-                        correct_real_node, predicted_client
+                    "Original client: {}, Linked as: {}, samples evaluated: {}".format(
+                        correct_real_node,
+                        predicted_client,
+                        self.linkabilityAttack.samples_evaluated,
                     )
                 )
                 if correct_real_node not in self.attack_results["linkability"]:
                     self.attack_results["linkability"][correct_real_node] = dict()
+                    self.attack_results["linkability_samples"][
+                        correct_real_node
+                    ] = dict()
                 if (
                     self.communication_round
                     not in self.attack_results["linkability"][correct_real_node]
@@ -308,9 +335,15 @@ class VNodeSharingAttackRandom(VNodeSharing):
                     self.attack_results["linkability"][correct_real_node][
                         self.communication_round
                     ] = []
+                    self.attack_results["linkability_samples"][correct_real_node][
+                        self.communication_round
+                    ] = []
                 self.attack_results["linkability"][correct_real_node][
                     self.communication_round
                 ].append(predicted_client)
+                self.attack_results["linkability_samples"][correct_real_node][
+                    self.communication_round
+                ].append(self.linkabilityAttack.samples_evaluated)
 
                 # LiRA-LOSS
                 logging.info("MIA on neighbor {}".format(data["vSource"]))
@@ -321,6 +354,12 @@ class VNodeSharingAttackRandom(VNodeSharing):
                     return_loss=True,
                     return_both=True,
                 )
+                if self.score_cache is not None:
+                    logging.info(
+                        "MIA score cache hits: {}, misses: {}".format(
+                            self.score_cache.hits, self.score_cache.misses
+                        )
+                    )
 
                 if correct_real_node not in self.attack_results["loss_vals"]:
                     self.attack_results["loss_vals"][correct_real_node] = dict()
@@ -16,6 +16,7 @@ from virtualNodes.attacks.MIA import (
     LOSSMovieLensTestSet,
     LOSSTwitterTestSet,
 )
+from virtualNodes.attacks.MIA.ScoreCache import ScoreCache
 from virtualNodes.sharing.VNodeSharingRandom import VNodeSharing
 
 
@@ -43,6 +44,8 @@ class VNodeSharingAttackRandomLOSS(VNodeSharing):
         perform_attack=True,
         attack_random=8,
         will_receive=8,
+        mia_cache_bytes=256 * 2**20,
+        adaptive_linkability=False,
     ):
         """
         Constructor
@@ -65,6 +68,12 @@ class VNodeSharingAttackRandomLOSS(VNodeSharing):
             Dataset for sharing data. Not implemented yet!
         log_dir : str
             Location to write shared_params (only writing for 2 procs per machine)
+        mia_cache_bytes : int, optional
+            Size of the MIA score cache shared by the attackers of the machine, 0 to disable.
+            The cache in /dev/shm is removed when its last user exits, after a crash
+            remove /dev/shm/mia_cache_* by hand
+        adaptive_linkability : bool, optional
+            Link with the successive halving search instead of evaluating every training set
 
         """
         super().__init__(
@@ -161,9 +170,11 @@ class VNodeSharingAttackRandomLOSS(VNodeSharing):
             self.num_clients,
             trainset_dict,
             loss,
+            adaptive=adaptive_linkability,
         )
         self.attack_results = {
             "linkability": {},
+            "linkability_samples": {},
             "loss_vals": {},
         }
 
@@ -178,7 +189,14 @@ class VNodeSharingAttackRandomLOSS(VNodeSharing):
 
         self.seed = self.dataset.random_seed
         self.train_dir = self.dataset.train_dir
-        self.mia = self.mia()
+        self.score_cache = (
+            ScoreCache(
+                namespace=os.path.abspath(self.log_dir), max_bytes=mia_cache_bytes
+            )
+            if mia_cache_bytes > 0
+            else None
+        )
+        self.mia = self.mia(score_cache=self.score_cache)
 
     def copy_model(self, model):
         """
@@ -205,6 +223,8 @@ class VNodeSharingAttackRandomLOSS(VNodeSharing):
                 self.attack_results,
                 os.path.join(self.log_dir, "{}_attacker.pth".format(self.uid)),
             )
+        if self.score_cache is not None:
+            self.score_cache.close()
 
     def forward_averaging(self, data):
         """
@@ -300,12 +320,17 @@ class VNodeSharingAttackRandomLOSS(VNodeSharing):
                     self.attack_model, skip=[self.uid]
                 )
                 logging.info(
-                    "Original client: {}, Linked as: {}".format(
-                        correct_real_node, predicted_client
+                    "Original client: {}, Linked as: {}, samples evaluated: {}".format(
+                        correct_real_node,
+                        predicted_client,
+                        self.linkabilityAttack.samples_evaluated,
                     )
                 )
                 if correct_real_node not in self.attack_results["linkability"]:
                     self.attack_results["linkability"][correct_real_node] = dict()
+                    self.attack_results["linkability_samples"][
+                        correct_real_node
+                    ] = dict()
                 if (
                     self.communication_round
                     not in self.attack_results["linkability"][correct_real_node]
@@ -313,9 +338,15 @@ class VNodeSharingAttackRandomLOSS(VNodeSharing):
                     self.attack_results["linkability"][correct_real_node][
                         self.communication_round
                     ] = []
+                    self.attack_results["linkability_samples"][correct_real_node][
+                        self.communication_round
+                    ] = []
                 self.attack_results["linkability"][correct_real_node][
                     self.communication_round
                 ].append(predicted_client)
+                self.attack_results["linkability_samples"][correct_real_node][
+                    self.communication_round
+                ].append(self.linkabilityAttack.samples_evaluated)
 
                 # LiRA-LOSS
                 logging.info("MIA on neighbor {}".format(data["vSource"]))
@@ -323,7 +354,14 @@ class VNodeSharingAttackRandomLOSS(VNodeSharing):
                     self.attack_model,
                     self.linkabilityAttack.client_trainsets[correct_real_node],
                     self.test_dataloader,
+                    dataset_id=correct_real_node,
                 )
+                if self.score_cache is not None:
+                    logging.info(
+                        "MIA score cache hits: {}, misses: {}".format(
+                            self.score_cache.hits, self.score_cache.misses
+                        )
+                    )
 
                 if correct_real_node not in self.attack_results["loss_vals"]:
                     self.attack_results["loss_vals"][correct_real_node] = dict()